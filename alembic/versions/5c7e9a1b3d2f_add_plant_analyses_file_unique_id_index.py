@@ -0,0 +1,43 @@
+"""add plant_analyses file_unique_id lookup index
+
+Revision ID: 5c7e9a1b3d2f
+Revises: 2f4b6d4a8c1e
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "5c7e9a1b3d2f"
+down_revision: Union[str, None] = "2f4b6d4a8c1e"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+TABLE_NAME = "plant_analyses"
+INDEX_NAME = "ix_plant_analyses_file_unique_id_created_at"
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    existing_indexes = {index["name"] for index in inspector.get_indexes(TABLE_NAME)}
+    if INDEX_NAME not in existing_indexes:
+        op.create_index(
+            INDEX_NAME,
+            TABLE_NAME,
+            ["tg_file_unique_id", sa.text("created_at DESC")],
+            unique=False,
+            postgresql_where=sa.text("tg_file_unique_id IS NOT NULL"),
+        )
+
+
+def downgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    existing_indexes = {index["name"] for index in inspector.get_indexes(TABLE_NAME)}
+    if INDEX_NAME in existing_indexes:
+        op.drop_index(INDEX_NAME, table_name=TABLE_NAME)
@@ -0,0 +1,47 @@
+"""add shops table
+
+Revision ID: 8d1f3b5a7c9e
+Revises: 5c7e9a1b3d2f
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "8d1f3b5a7c9e"
+down_revision: Union[str, None] = "5c7e9a1b3d2f"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+TABLE_NAME = "shops"
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    if TABLE_NAME in inspector.get_table_names():
+        return
+    op.create_table(
+        TABLE_NAME,
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("address", sa.String(), server_default="", nullable=False),
+        sa.Column("city", sa.String(), server_default="", nullable=False),
+        sa.Column("lat", sa.Float(), nullable=False),
+        sa.Column("lon", sa.Float(), nullable=False),
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_shops_city"), TABLE_NAME, ["city"], unique=False)
+
+
+def downgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    if TABLE_NAME in inspector.get_table_names():
+        op.drop_index(op.f("ix_shops_city"), table_name=TABLE_NAME)
+        op.drop_table(TABLE_NAME)
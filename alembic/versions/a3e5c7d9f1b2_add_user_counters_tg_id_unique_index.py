@@ -0,0 +1,46 @@
+"""add unique index on user_counters.tg_id
+
+Revision ID: a3e5c7d9f1b2
+Revises: 8d1f3b5a7c9e
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "a3e5c7d9f1b2"
+down_revision: Union[str, None] = "8d1f3b5a7c9e"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+TABLE_NAME = "user_counters"
+INDEX_NAME = "ix_user_counters_tg_id"
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    existing_indexes = {index["name"] for index in inspector.get_indexes(TABLE_NAME)}
+    if INDEX_NAME in existing_indexes:
+        return
+    # Гонки в старом get_user_counter могли создать дубли: оставляем самую раннюю строку
+    op.execute(
+        """
+        DELETE FROM user_counters duplicate
+        USING user_counters kept
+        WHERE duplicate.tg_id = kept.tg_id AND duplicate.id > kept.id
+        """
+    )
+    op.create_index(INDEX_NAME, TABLE_NAME, ["tg_id"], unique=True)
+
+
+def downgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    existing_indexes = {index["name"] for index in inspector.get_indexes(TABLE_NAME)}
+    if INDEX_NAME in existing_indexes:
+        op.drop_index(INDEX_NAME, table_name=TABLE_NAME)
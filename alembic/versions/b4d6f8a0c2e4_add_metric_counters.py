@@ -0,0 +1,164 @@
+"""add metric_counters maintained by triggers
+
+Revision ID: b4d6f8a0c2e4
+Revises: a3e5c7d9f1b2
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "b4d6f8a0c2e4"
+down_revision: Union[str, None] = "a3e5c7d9f1b2"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+TABLE_NAME = "metric_counters"
+SHARDS = 16
+
+# Разрезы по каждой таблице: подзапрос над строками {rows} даёт пары (dimension, value).
+# Удаление уменьшает только total: разрезы — это история созданных строк, а предпочтение
+# при каскадном удалении пользователя может исчезнуть раньше подборки
+DIMENSIONS = {
+    "users": """
+        SELECT 'total', '' FROM {rows}
+        UNION ALL SELECT 'day', to_char(created_at AT TIME ZONE 'UTC', 'YYYY-MM-DD') FROM {rows}
+        UNION ALL SELECT 'source', coalesce(source, '') FROM {rows}
+    """,
+    "recommendations": """
+        SELECT 'total', '' FROM {rows}
+        UNION ALL SELECT 'day', to_char(created_at AT TIME ZONE 'UTC', 'YYYY-MM-DD') FROM {rows}
+        UNION ALL SELECT 'style', coalesce(preferences.style, '')
+            FROM {rows} LEFT JOIN preferences ON preferences.id = {rows}.preference_id
+    """,
+    "photos": """
+        SELECT 'total', '' FROM {rows}
+        UNION ALL SELECT 'day', to_char(created_at AT TIME ZONE 'UTC', 'YYYY-MM-DD') FROM {rows}
+    """,
+}
+TOTAL = "SELECT 'total', '' FROM {rows}"
+
+BUMP = """
+    INSERT INTO {counters} AS counter (metric, dimension, value, shard, count)
+    SELECT {metric}, dimension, value, {shard}, {sign}count(*)
+    FROM ({dimensions}) AS delta (dimension, value)
+    GROUP BY dimension, value
+    ON CONFLICT (metric, dimension, value, shard) DO UPDATE SET count = counter.count + excluded.count
+"""
+CREATE_FUNCTION = """
+    CREATE OR REPLACE FUNCTION {function}() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            {on_insert};
+        ELSE
+            {on_delete};
+        END IF;
+        RETURN NULL;
+    END
+    $$
+"""
+CREATE_TRIGGER = """
+    CREATE TRIGGER {trigger} AFTER {operation} ON {table}
+    REFERENCING {transition} TABLE AS {rows}
+    FOR EACH STATEMENT EXECUTE FUNCTION {function}()
+"""
+DROP_TRIGGER = "DROP TRIGGER IF EXISTS {trigger} ON {table}"
+DROP_FUNCTION = "DROP FUNCTION IF EXISTS {function}()"
+CLEAR_METRIC = "DELETE FROM {counters} WHERE metric = :metric"
+EXISTING_TRIGGERS = sa.text("SELECT tgname FROM pg_trigger WHERE NOT tgisinternal")
+
+
+def _quote(name: str) -> str:
+    return op.get_bind().dialect.identifier_preparer.quote(name)
+
+
+def _names(table: str) -> dict[str, str]:
+    return {
+        "counters": _quote(TABLE_NAME),
+        "table": _quote(table),
+        "function": _quote(f"{table}_metric_counters"),
+        "insert_trigger": _quote(f"{table}_metric_counters_insert"),
+        "delete_trigger": _quote(f"{table}_metric_counters_delete"),
+    }
+
+
+def _bump(table: str, rows: str, shard: str, sign: str = "", dimensions: str | None = None) -> str:
+    return BUMP.format(
+        counters=_quote(TABLE_NAME),
+        metric=f"'{table}'",
+        shard=shard,
+        sign=sign,
+        dimensions=(dimensions or DIMENSIONS[table]).format(rows=_quote(rows)),
+    )
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    # Таблицу мог уже создать create_all при старте бота, но без триггеров и начальных значений,
+    # поэтому о выполненной миграции судим по триггерам, а не по таблице
+    if TABLE_NAME not in sa.inspect(bind).get_table_names():
+        op.create_table(
+            TABLE_NAME,
+            sa.Column("metric", sa.String(), nullable=False),
+            sa.Column("dimension", sa.String(), nullable=False),
+            sa.Column("value", sa.String(), server_default="", nullable=False),
+            sa.Column("shard", sa.SmallInteger(), server_default="0", nullable=False),
+            sa.Column("count", sa.BigInteger(), server_default="0", nullable=False),
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+            sa.PrimaryKeyConstraint("id"),
+            sa.UniqueConstraint("metric", "dimension", "value", "shard", name="uq_metric_counters_key"),
+        )
+    existing_triggers = set(bind.execute(EXISTING_TRIGGERS).scalars())
+    shard = f"pg_backend_pid() % {SHARDS}"
+    for table in DIMENSIONS:
+        if {f"{table}_metric_counters_insert", f"{table}_metric_counters_delete"} <= existing_triggers:
+            continue
+        names = _names(table)
+        # Триггер уровня оператора с таблицами переходов: одна пачка из write queue — один upsert на разрез,
+        # а не по строке на каждую вставленную запись
+        op.execute(
+            CREATE_FUNCTION.format(
+                function=names["function"],
+                on_insert=_bump(table, "new_rows", shard),
+                on_delete=_bump(table, "old_rows", shard, sign="-", dimensions=TOTAL),
+            )
+        )
+        for trigger, operation, transition, rows in (
+            (names["insert_trigger"], "INSERT", "NEW", "new_rows"),
+            (names["delete_trigger"], "DELETE", "OLD", "old_rows"),
+        ):
+            op.execute(DROP_TRIGGER.format(trigger=trigger, table=names["table"]))
+            op.execute(
+                CREATE_TRIGGER.format(
+                    trigger=trigger,
+                    operation=operation,
+                    table=names["table"],
+                    transition=transition,
+                    rows=rows,
+                    function=names["function"],
+                )
+            )
+        # CREATE TRIGGER держит блокировку таблицы до конца миграции, поэтому вставки, пришедшие во время
+        # заполнения, дождутся коммита и попадут в счётчики уже через триггер, без двойного учёта.
+        # Строки, оставшиеся без триггера, пересчитываются с нуля
+        op.execute(sa.text(CLEAR_METRIC.format(counters=names["counters"])).bindparams(metric=table))
+        op.execute(_bump(table, table, "0"))
+
+
+def downgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    if TABLE_NAME not in inspector.get_table_names():
+        return
+    for table in DIMENSIONS:
+        names = _names(table)
+        op.execute(DROP_TRIGGER.format(trigger=names["insert_trigger"], table=names["table"]))
+        op.execute(DROP_TRIGGER.format(trigger=names["delete_trigger"], table=names["table"]))
+        op.execute(DROP_FUNCTION.format(function=names["function"]))
+    op.drop_table(TABLE_NAME)
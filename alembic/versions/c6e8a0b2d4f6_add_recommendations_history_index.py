@@ -0,0 +1,53 @@
+"""add covering (user_id, created_at DESC) index on recommendations
+
+Revision ID: c6e8a0b2d4f6
+Revises: b4d6f8a0c2e4
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c6e8a0b2d4f6"
+down_revision: Union[str, None] = "b4d6f8a0c2e4"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+TABLE_NAME = "recommendations"
+INDEX_NAME = "ix_recommendations_user_id_created_at"
+OLD_INDEX_NAME = "ix_recommendations_user_id"
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    existing_indexes = {index["name"] for index in inspector.get_indexes(TABLE_NAME)}
+    # CONCURRENTLY не блокирует вставки подборок на время построения, но не работает внутри транзакции
+    with op.get_context().autocommit_block():
+        if INDEX_NAME not in existing_indexes:
+            op.create_index(
+                INDEX_NAME,
+                TABLE_NAME,
+                ["user_id", sa.text("created_at DESC"), sa.text("id DESC")],
+                unique=False,
+                postgresql_include=["weather_summary"],
+                postgresql_concurrently=True,
+            )
+        # Новый индекс начинается с user_id и заменяет старый для внешнего ключа
+        if OLD_INDEX_NAME in existing_indexes:
+            op.drop_index(OLD_INDEX_NAME, table_name=TABLE_NAME, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    existing_indexes = {index["name"] for index in inspector.get_indexes(TABLE_NAME)}
+    with op.get_context().autocommit_block():
+        if OLD_INDEX_NAME not in existing_indexes:
+            op.create_index(OLD_INDEX_NAME, TABLE_NAME, ["user_id"], unique=False, postgresql_concurrently=True)
+        if INDEX_NAME in existing_indexes:
+            op.drop_index(INDEX_NAME, table_name=TABLE_NAME, postgresql_concurrently=True)
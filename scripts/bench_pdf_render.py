@@ -0,0 +1,54 @@
+import argparse
+import asyncio
+import time
+
+from bot.handlers.pdf_generator import PDFRenderer, _init_worker, render_plan_pdf
+
+SAMPLE_PLAN = "\n".join(
+    [
+        "### ЭТАП 1. Осмотр",
+        "- Проверьте листья с обеих сторон",
+        "- Уберите повреждённые побеги",
+        "",
+        "### ЭТАП 2. Уход",
+        "– Полив раз в неделю тёплой водой",
+        "— Подкормка раз в две недели",
+        "Растение любит рассеянный свет и не переносит сквозняки.",
+    ]
+    * 6
+)
+
+
+def bench_inline(count: int) -> float:
+    # Те же настройки ReportLab, что и в воркерах пула
+    _init_worker()
+    render_plan_pdf(SAMPLE_PLAN, "Warm-up")
+    started = time.perf_counter()
+    for i in range(count):
+        render_plan_pdf(SAMPLE_PLAN, f"План #{i}")
+    return count / (time.perf_counter() - started)
+
+
+async def bench_pool(count: int, workers: int) -> float:
+    renderer = PDFRenderer(max_workers=workers)
+    try:
+        await asyncio.gather(*(renderer.render(SAMPLE_PLAN, "Warm-up") for _ in range(workers)))
+        started = time.perf_counter()
+        await asyncio.gather(*(renderer.render(SAMPLE_PLAN, f"План #{i}") for i in range(count)))
+        return count / (time.perf_counter() - started)
+    finally:
+        renderer.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="PDF plan rendering throughput")
+    parser.add_argument("--count", type=int, default=40)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    print(f"inline:          {bench_inline(args.count):.1f} PDF/s")
+    print(f"pool ({args.workers} workers): {asyncio.run(bench_pool(args.count, args.workers)):.1f} PDF/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import argparse
+import random
+import time
+
+from bot.controllers.shops import Shop, ShopIndex, distance_km
+
+# Примерные центры крупных городов, вокруг них рассыпаем магазины
+CITIES = {
+    "Москва": (55.7558, 37.6173),
+    "Санкт-Петербург": (59.9343, 30.3351),
+    "Новосибирск": (55.0084, 82.9357),
+    "Екатеринбург": (56.8389, 60.6057),
+    "Казань": (55.7961, 49.1064),
+}
+
+
+def generate_shops(count: int, seed: int = 42) -> list[Shop]:
+    rng = random.Random(seed)
+    shops = []
+    for i in range(count):
+        city, (lat, lon) = rng.choice(list(CITIES.items()))
+        shops.append(
+            Shop(
+                name=f"Shop #{i}",
+                address=f"ул. Тестовая, {i % 300}",
+                city=city,
+                lat=lat + rng.gauss(0, 0.15),
+                lon=lon + rng.gauss(0, 0.25),
+            )
+        )
+    return shops
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Shop index build and query latency")
+    parser.add_argument("--shops", type=int, default=200_000)
+    parser.add_argument("--queries", type=int, default=20_000)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--radius", type=float, default=1.0)
+    args = parser.parse_args()
+
+    shops = generate_shops(args.shops)
+    started = time.perf_counter()
+    index = ShopIndex(shops)
+    print(f"build:   {time.perf_counter() - started:.2f}s for {len(index)} shops")
+
+    rng = random.Random(7)
+    points = []
+    for _ in range(args.queries):
+        lat, lon = rng.choice(list(CITIES.values()))
+        points.append((lat + rng.gauss(0, 0.2), lon + rng.gauss(0, 0.3)))
+
+    # Проверяем точность на части запросов полным перебором
+    for lat, lon in points[:20]:
+        expected = sorted(distance_km(lat, lon, shop.lat, shop.lon) for shop in index.shops)[: args.k]
+        got = [distance for _, distance in index.nearest(lat, lon, k=args.k)]
+        assert [round(d, 9) for d in got] == [round(d, 9) for d in expected], (got, expected)
+
+    started = time.perf_counter()
+    for lat, lon in points:
+        index.nearest(lat, lon, k=args.k)
+    elapsed = time.perf_counter() - started
+    print(f"nearest: {elapsed / args.queries * 1e6:.1f} µs/query (k={args.k})")
+
+    started = time.perf_counter()
+    found = 0
+    for lat, lon in points:
+        found += len(index.within(lat, lon, args.radius))
+    elapsed = time.perf_counter() - started
+    print(f"within:  {elapsed / args.queries * 1e6:.1f} µs/query (r={args.radius} km, {found / args.queries:.1f} hits)")
+
+    # Точка вдали от всех магазинов: худший случай для сеток, для дерева — обычный спуск
+    started = time.perf_counter()
+    for _ in range(1000):
+        index.nearest(45.0, 40.0, k=args.k)
+    print(f"sparse:  {(time.perf_counter() - started) / 1000 * 1e6:.1f} µs/query")
+
+
+if __name__ == "__main__":
+    main()
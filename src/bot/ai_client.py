@@ -1,8 +1,9 @@
 import logging
 from asyncio import get_running_loop, sleep
+from collections.abc import Awaitable, Callable
 
 from aiogram.types import Message
-from openai import AsyncOpenAI, BadRequestError
+from openai import APIError, AsyncOpenAI, BadRequestError, RateLimitError
 from openai.types.beta.threads import (
     ImageFileContentBlockParam,
     ImageURLContentBlockParam,
@@ -11,36 +12,54 @@ from openai.types.beta.threads import (
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from bot.internal.lexicon import replies
+from bot.internal.openai_scheduler import SYSTEM_QUEUE, OpenAIScheduler, estimate_tokens
+from bot.internal.streaming_reply import StreamingReply
+from bot.internal.thread_coordinator import ThreadCoordinator
+from bot.internal.upload_cache import UploadCache, content_key
 from database.models import User
 
 logger = logging.getLogger(__name__)
 
 ContentType = str | list[TextContentBlockParam | ImageFileContentBlockParam | ImageURLContentBlockParam]
+DeltaCallback = Callable[[str], Awaitable[None]]
+# Ключ справедливой очереди планировщика — tg_id пользователя, от имени которого идёт вызов
+UserKey = int | str
+
+RUN_FINAL_STATUSES = ("completed", "failed", "cancelled", "expired", "incomplete")
+RATE_LIMIT_REPLY = "Превышены лимиты запросов. Пожалуйста, попробуйте позже."
+BAD_IMAGE_REPLY = "Ошибка при обработке изображения. Убедитесь, что файл корректного формата."
+IMAGE_ERROR_REPLIES = (RATE_LIMIT_REPLY, BAD_IMAGE_REPLY)
 
 
 class AIClient:
-    def __init__(self, token: str, assistant_id: str):
-        self.client = AsyncOpenAI(api_key=token)
+    def __init__(  # noqa: PLR0913
+        self,
+        token: str,
+        assistant_id: str,
+        *,
+        streaming: bool = True,
+        stream_edit_interval: float = 1.0,
+        coordinator: ThreadCoordinator | None = None,
+        scheduler: OpenAIScheduler | None = None,
+        upload_cache: UploadCache | None = None,
+    ):
+        # Повторы делает планировщик, чтобы учитывать Retry-After и общую очередь
+        self.client = AsyncOpenAI(api_key=token, max_retries=0)
         self.assistant_id = assistant_id
+        self.streaming = streaming
+        self.stream_edit_interval = stream_edit_interval
+        self.coordinator = coordinator or ThreadCoordinator()
+        self.scheduler = scheduler or OpenAIScheduler()
+        self.upload_cache = upload_cache or UploadCache()
 
-    async def delete_thread(self, thread_id: str):
-        await self.client.beta.threads.delete(thread_id)
+    async def delete_thread(self, thread_id: str, user_key: UserKey = SYSTEM_QUEUE):
+        await self.scheduler.call(user_key, self.client.beta.threads.delete, thread_id)
 
-    async def new_thread(self) -> str:
-        thread = await self.client.beta.threads.create()
+    async def new_thread(self, user_key: UserKey = SYSTEM_QUEUE) -> str:
+        thread = await self.scheduler.call(user_key, self.client.beta.threads.create)
         logging.debug(f"Created new thread {thread.id}")
         return thread.id
 
-    async def _ensure_thread_available(self, thread_id: str, message: Message, fullname: str):
-        while True:
-            runs = await self.client.beta.threads.runs.list(thread_id=thread_id, limit=1)
-            if runs.data and runs.data[0].status in ("queued", "in_progress"):
-                logger.info(f"Active run detected {runs.data[0].id} in thread {thread_id}")
-                await message.answer(replies[2].format(fullname=fullname))
-                await sleep(2)
-            else:
-                break
-
     async def _safe_create_message(
         self,
         thread_id: str,
@@ -51,10 +70,13 @@ class AIClient:
         max_retries: int = 3,
     ) -> bool:
         try:
-            await self.client.beta.threads.messages.create(
+            await self.scheduler.call(
+                message.from_user.id,
+                self.client.beta.threads.messages.create,
                 thread_id=thread_id,
                 role="user",
                 content=content,
+                tokens=estimate_tokens(content, completion_budget=0),
             )
         except BadRequestError as e:
             if "while a run" in str(e):
@@ -67,17 +89,124 @@ class AIClient:
             raise
         return True
 
-    async def _run_thread_and_get_response(self, thread_id: str) -> str | None:
-        run = await self.client.beta.threads.runs.create(thread_id=thread_id, assistant_id=self.assistant_id)
-        run = await self.wait_for_run_completion(thread_id, run.id)
+    async def _run_thread_and_get_response(
+        self,
+        thread_id: str,
+        user_key: UserKey = SYSTEM_QUEUE,
+        on_delta: DeltaCallback | None = None,
+    ) -> str | None:
+        if not self.streaming:
+            return await self._poll_thread_and_get_response(thread_id, user_key)
+        return await self._stream_thread_and_get_response(thread_id, user_key, on_delta)
+
+    async def _stream_thread_and_get_response(
+        self,
+        thread_id: str,
+        user_key: UserKey,
+        on_delta: DeltaCallback | None,
+    ) -> str | None:
+        loop = get_running_loop()
+        started_at = loop.time()
+        first_token_at = None
+        parts: list[str] = []
+        run = None
+        try:
+            async with (
+                self.scheduler.slot(user_key, tokens=estimate_tokens(""), run=True),
+                self.client.beta.threads.runs.stream(thread_id=thread_id, assistant_id=self.assistant_id) as stream,
+            ):
+                async for event in stream:
+                    if event.event == "thread.run.created":
+                        run = event.data
+                    if event.event != "thread.message.delta":
+                        continue
+                    for block in event.data.delta.content or []:
+                        if block.type != "text" or not block.text or not block.text.value:
+                            continue
+                        if first_token_at is None:
+                            first_token_at = loop.time()
+                        parts.append(block.text.value)
+                        if on_delta is not None:
+                            await on_delta(block.text.value)
+                run = stream.current_run or run
+        except APIError as e:
+            # Если run уже создан, дожидаемся его через polling, а не создаём новый
+            logger.warning(f"Streaming run failed in thread {thread_id}, falling back to polling: {e}")
+            return await self._poll_thread_and_get_response(thread_id, user_key, run.id if run else None)
+
+        total = loop.time() - started_at
+        ttft = first_token_at - started_at if first_token_at is not None else total
+        status = run.status if run else "unknown"
+        logger.info(f"Thread {thread_id} run {status} (stream): ttft={ttft:.2f}s total={total:.2f}s")
+        if status != "completed":
+            return None
+        response = "".join(parts)
+        logger.debug(f"Thread {thread_id} responded with: {response[:100]}...")
+        return response
+
+    async def _poll_thread_and_get_response(
+        self,
+        thread_id: str,
+        user_key: UserKey,
+        run_id: str | None = None,
+    ) -> str | None:
+        started_at = get_running_loop().time()
+        async with self.scheduler.slot(user_key, run=True):
+            if run_id is None:
+                run = await self.scheduler.call(
+                    user_key,
+                    self.client.beta.threads.runs.create,
+                    thread_id=thread_id,
+                    assistant_id=self.assistant_id,
+                    tokens=estimate_tokens(""),
+                )
+                run_id = run.id
+            run = await self.wait_for_run_completion(thread_id, run_id, user_key=user_key)
+        total = get_running_loop().time() - started_at
+        logger.info(f"Thread {thread_id} run {run.status} (polling): ttft={total:.2f}s total={total:.2f}s")
 
         if run.status == "completed":
-            messages = await self.client.beta.threads.messages.list(thread_id=thread_id)
+            messages = await self.scheduler.call(
+                user_key, self.client.beta.threads.messages.list, thread_id=thread_id, limit=1
+            )
             response = messages.data[0].content[0].text.value
             logger.debug(f"Thread {thread_id} responded with: {response[:100]}...")
             return response
         return None
 
+    async def _submit(  # noqa: PLR0913
+        self,
+        thread_id: str,
+        content: ContentType,
+        message: Message,
+        fullname: str,
+        retry: int,
+        max_retries: int,
+        stream_to_user: bool,
+    ) -> str | None:
+        # Если сообщение объединено с более ранним, ответ отправит тот вызов, а здесь вернётся None
+        async def process(merged: ContentType) -> str | None:
+            success = await self._safe_create_message(thread_id, merged, message, fullname, retry, max_retries)
+            if not success:
+                return None
+            return await self._answer(thread_id, message, stream_to_user)
+
+        async def notify_busy() -> None:
+            logger.info(f"Thread {thread_id} is busy, queueing input from {fullname}")
+            await message.answer(replies[2].format(fullname=fullname))
+
+        return await self.coordinator.submit(thread_id, content, process, on_busy=notify_busy)
+
+    async def _answer(self, thread_id: str, message: Message, stream_to_user: bool) -> str | None:
+        user_key = message.from_user.id
+        if not stream_to_user:
+            return await self._run_thread_and_get_response(thread_id, user_key)
+        reply = StreamingReply(message, min_interval=self.stream_edit_interval)
+        response = await self._run_thread_and_get_response(thread_id, user_key, on_delta=reply.on_delta)
+        if response:
+            await reply.finish(response)
+        return response
+
     async def get_response(
         self,
         ai_thread_id: str,
@@ -86,14 +215,10 @@ class AIClient:
         fullname: str,
         retry: int = 0,
         max_retries: int = 3,
+        *,
+        stream_to_user: bool = False,
     ) -> str | None:
-        await self._ensure_thread_available(ai_thread_id, message, fullname)
-
-        success = await self._safe_create_message(ai_thread_id, text, message, fullname, retry, max_retries)
-        if not success:
-            return None
-
-        return await self._run_thread_and_get_response(ai_thread_id)
+        return await self._submit(ai_thread_id, text, message, fullname, retry, max_retries, stream_to_user)
 
     async def get_response_with_image(
         self,
@@ -104,31 +229,41 @@ class AIClient:
         fullname: str,
         retry: int = 0,
         max_retries: int = 3,
+        *,
+        stream_to_user: bool = False,
+        file_unique_id: str | None = None,
     ) -> str | None:
         try:
-            await self._ensure_thread_available(thread_id, message, fullname)
-
-            uploaded_file = await self.client.files.create(
-                file=("image.png", image_bytes, "image/png"),
-                purpose="assistants",
-            )
+            file_id = await self._upload_image(message.from_user.id, image_bytes, file_unique_id)
 
             content = [
                 TextContentBlockParam(type="text", text=text),
-                ImageFileContentBlockParam(type="image_file", image_file={"file_id": uploaded_file.id}),
+                ImageFileContentBlockParam(type="image_file", image_file={"file_id": file_id}),
             ]
 
-            success = await self._safe_create_message(thread_id, content, message, fullname, retry, max_retries)
-            if not success:
-                return None
-
-            return await self._run_thread_and_get_response(thread_id)
+            return await self._submit(thread_id, content, message, fullname, retry, max_retries, stream_to_user)
 
+        except RateLimitError:
+            logger.exception("OpenAI rate limit persisted after retries")
+            return RATE_LIMIT_REPLY
         except BadRequestError as e:
             logger.exception(f"OpenAI API Error: {e}")
-            if e.status_code == 429:
-                return "Превышены лимиты запросов. Пожалуйста, попробуйте позже."
-            return "Ошибка при обработке изображения. Убедитесь, что файл корректного формата."
+            return BAD_IMAGE_REPLY
+
+    async def _upload_image(self, user_key: UserKey, image_bytes: bytes, file_unique_id: str | None) -> str:
+        key = content_key(file_unique_id, image_bytes)
+        file_id = await self.upload_cache.get(key)
+        if file_id:
+            logger.debug(f"Reusing uploaded file {file_id} for {key}")
+            return file_id
+        uploaded_file = await self.scheduler.call(
+            user_key,
+            self.client.files.create,
+            file=("image.png", image_bytes, "image/png"),
+            purpose="assistants",
+        )
+        await self.upload_cache.put(key, uploaded_file.id)
+        return uploaded_file.id
 
     async def apply_context_to_thread(
         self,
@@ -139,12 +274,17 @@ class AIClient:
     ) -> str:
         if use_existing_thread and user.ai_thread:
             thread_id = user.ai_thread
-            await self.client.beta.threads.messages.create(thread_id=thread_id, role="user", content=context)
         else:
-            thread = await self.client.beta.threads.create()
-            thread_id = thread.id
-            await self.client.beta.threads.messages.create(thread_id=thread_id, role="user", content=context)
+            thread_id = await self.new_thread(user.tg_id)
             user.ai_thread = thread_id
+        await self.scheduler.call(
+            user.tg_id,
+            self.client.beta.threads.messages.create,
+            thread_id=thread_id,
+            role="user",
+            content=context,
+            tokens=estimate_tokens(context, completion_budget=0),
+        )
 
         user.is_context_added = True
         db_session.add(user)
@@ -152,12 +292,51 @@ class AIClient:
         logger.info(f"Added context to thread {thread_id}")
         return thread_id
 
-    async def wait_for_run_completion(self, thread_id: str, run_id: str, interval: int = 2, timeout: int = 120):
+    async def add_to_thread(self, thread_id: str, messages: list[tuple[str, str]], user_key: UserKey = SYSTEM_QUEUE):
+        # Готовый ответ (например, сохранённый анализ) добавляется в тред без run,
+        # чтобы ассистент учитывал его в следующих вопросах пользователя
+        for role, content in messages:
+            await self.scheduler.call(
+                user_key,
+                self.client.beta.threads.messages.create,
+                thread_id=thread_id,
+                role=role,
+                content=content,
+                tokens=estimate_tokens(content, completion_budget=0),
+            )
+
+    async def wait_for_run_completion(
+        self,
+        thread_id: str,
+        run_id: str,
+        interval: int = 2,
+        timeout: int = 120,
+        user_key: UserKey = SYSTEM_QUEUE,
+    ):
         start = get_running_loop().time()
         while True:
-            run = await self.client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run_id)
-            if run.status in ("completed", "failed", "cancelled", "expired"):
+            run = await self.scheduler.call(
+                user_key, self.client.beta.threads.runs.retrieve, thread_id=thread_id, run_id=run_id
+            )
+            if run.status in RUN_FINAL_STATUSES:
                 return run
             if get_running_loop().time() - start > timeout:
                 raise TimeoutError(f"Run {run_id} in thread {thread_id} did not finish in time")
             await sleep(interval)
+
+
+def get_ai_client(settings, redis=None, lock_redis=None) -> AIClient:
+    return AIClient(
+        token=settings.gpt.OPENAI_API_KEY.get_secret_value(),
+        assistant_id=settings.gpt.ASSISTANT_ID.get_secret_value(),
+        streaming=settings.gpt.STREAMING,
+        stream_edit_interval=settings.gpt.STREAM_EDIT_INTERVAL,
+        coordinator=ThreadCoordinator(lock_redis or redis),
+        scheduler=OpenAIScheduler(
+            requests_per_minute=settings.gpt.REQUESTS_PER_MINUTE,
+            tokens_per_minute=settings.gpt.TOKENS_PER_MINUTE,
+            max_concurrent_runs=settings.gpt.MAX_CONCURRENT_RUNS,
+            max_retries=settings.gpt.MAX_RETRIES,
+        ),
+        upload_cache=UploadCache(redis, ttl=settings.gpt.UPLOAD_TTL),
+    )
@@ -3,6 +3,7 @@ from functools import cache
 from pydantic import Field, SecretStr
 from pydantic_settings import BaseSettings
 
+from bot.internal.consts import ARCHIVE_REDACT_FIELDS
 from bot.internal.enums import Stage
 from bot.internal.helpers import assign_config_dict
 
@@ -16,6 +17,8 @@ class BotConfig(BaseSettings):
     ACTIONS_THRESHOLD: int
     PICTURES_THRESHOLD: int
     PICTURES_WINDOW_DAYS: int
+    ACTIONS_WINDOW_HOURS: int = 24
+    LIMITS_RECONCILE_INTERVAL: float = 60.0
     USERS_THRESHOLD: int
     STAGE: Stage
 
@@ -25,6 +28,13 @@ class BotConfig(BaseSettings):
 class GPTConfig(BaseSettings):
     OPENAI_API_KEY: SecretStr
     ASSISTANT_ID: SecretStr
+    STREAMING: bool = True
+    STREAM_EDIT_INTERVAL: float = 1.0
+    REQUESTS_PER_MINUTE: int = 500
+    TOKENS_PER_MINUTE: int = 200_000
+    MAX_CONCURRENT_RUNS: int = 20
+    MAX_RETRIES: int = 5
+    UPLOAD_TTL: int = 86400
 
     model_config = assign_config_dict(prefix="GPT_")
 
@@ -34,6 +44,13 @@ class RedisConfig(BaseSettings):
     PORT: int
     USERNAME: str
     PASSWORD: SecretStr
+    FSM_TTL: int = 2 * 24 * 3600
+    FSM_POOL_SIZE: int = 20
+    CACHE_POOL_SIZE: int = 30
+    LOCKS_POOL_SIZE: int = 10
+    POOL_TIMEOUT: float = 5.0
+    SOCKET_TIMEOUT: float = 5.0
+    HEALTH_CHECK_INTERVAL: int = 30
 
     model_config = assign_config_dict(prefix="REDIS_")
 
@@ -41,6 +58,7 @@ class RedisConfig(BaseSettings):
 class WeatherConfig(BaseSettings):
     API_KEY: SecretStr | None = None
     BASE_URL: str = "https://api.openweathermap.org/data/2.5"
+    CACHE_TTL: int = 600
 
     model_config = assign_config_dict(prefix="WEATHER_")
 
@@ -48,9 +66,77 @@ class WeatherConfig(BaseSettings):
 class MapsConfig(BaseSettings):
     API_KEY: SecretStr | None = None
     BASE_URL: str = "https://maps.googleapis.com/maps/api/place"
+    SHOPS_FILE: str | None = None
+    SHOPS_FROM_DB: bool = True
+    SHOPS_RELOAD_INTERVAL: int = 300
 
     model_config = assign_config_dict(prefix="MAPS_")
 
+
+class CacheConfig(BaseSettings):
+    USER_TTL: int = 300
+    USER_MAXSIZE: int = 10_000
+    USER_SHARED: bool = False
+    FSM_LOCAL_TTL: float = 30
+    ANALYSIS_MAX_AGE_HOURS: int = 24
+
+    model_config = assign_config_dict(prefix="CACHE_")
+
+
+class WebhookConfig(BaseSettings):
+    URL: str | None = None
+    PATH: str = "/webhook"
+    SECRET: SecretStr | None = None
+    HOST: str = "0.0.0.0"  # noqa: S104 слушаем все интерфейсы контейнера
+    PORT: int = 8080
+    WORKERS: int = 1
+    MAX_IN_FLIGHT: int = 100
+
+    model_config = assign_config_dict(prefix="WEBHOOK_")
+
+
+class LogConfig(BaseSettings):
+    FORMAT: str = "text"
+    LEVEL: str = "INFO"
+    LEVELS: dict[str, str] = {}
+    QUEUE_SIZE: int = 10_000
+
+    model_config = assign_config_dict(prefix="LOG_")
+
+
+class ArchiveConfig(BaseSettings):
+    ENABLED: bool = True
+    DIR: str = "logs/updates"
+    SAMPLE_RATE: float = 1.0
+    UPDATE_TYPES: list[str] = []
+    REDACT_FIELDS: list[str] = sorted(ARCHIVE_REDACT_FIELDS)
+    MAX_FILE_MB: int = 64
+    QUEUE_SIZE: int = 10_000
+    FLUSH_INTERVAL: float = 1.0
+
+    model_config = assign_config_dict(prefix="ARCHIVE_")
+
+
+class MetricsConfig(BaseSettings):
+    ENABLED: bool = True
+    HOST: str = "0.0.0.0"  # noqa: S104 слушаем все интерфейсы контейнера
+    PORT: int = 9100
+    TOKEN: SecretStr | None = None
+
+    model_config = assign_config_dict(prefix="METRICS_")
+
+
+class SentryConfig(BaseSettings):
+    TRACES_RATE: float = 0.05
+    HANDLER_RATES: dict[str, float] = {}
+    TRACES_PER_MINUTE: float = 60
+    PROFILES_RATE: float = 0.0
+    OUTLIER_FACTOR: float = 4.0
+    OUTLIER_MIN_SECONDS: float = 1.0
+
+    model_config = assign_config_dict(prefix="SENTRY_")
+
+
 class DBConfig(BaseSettings):
     USER: str
     PASSWORD: SecretStr
@@ -60,6 +146,9 @@ class DBConfig(BaseSettings):
     echo: bool = False
     pool_size: int = 50
     max_overflow: int = 10
+    write_behind: bool = True
+    write_batch_size: int = 500
+    write_flush_interval: float = 1.0
 
     model_config = assign_config_dict(prefix="DB_")
 
@@ -77,6 +166,12 @@ class Settings(BaseSettings):
     db: DBConfig = Field(default_factory=DBConfig)
     weather: WeatherConfig = Field(default_factory=WeatherConfig)
     maps: MapsConfig = Field(default_factory=MapsConfig)
+    webhook: WebhookConfig = Field(default_factory=WebhookConfig)
+    cache: CacheConfig = Field(default_factory=CacheConfig)
+    log: LogConfig = Field(default_factory=LogConfig)
+    archive: ArchiveConfig = Field(default_factory=ArchiveConfig)
+    metrics: MetricsConfig = Field(default_factory=MetricsConfig)
+    sentry: SentryConfig = Field(default_factory=SentryConfig)
     model_config = assign_config_dict()
 
 
@@ -12,7 +12,7 @@ async def get_or_create_ai_thread(
     if user.ai_thread:
         return user.ai_thread
 
-    thread_id = await openai_client.new_thread()
+    thread_id = await openai_client.new_thread(user.tg_id)
     user.ai_thread = thread_id
     db_session.add(user)
     await db_session.flush()
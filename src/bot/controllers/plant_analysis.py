@@ -0,0 +1,118 @@
+import logging
+from collections.abc import Awaitable, Callable
+from datetime import UTC, datetime, timedelta
+
+from aiogram.types import Message
+from openai import OpenAIError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.ai_client import IMAGE_ERROR_REPLIES, AIClient
+from bot.config import Settings
+from bot.controllers.gpt import get_or_create_ai_thread
+from bot.internal.metrics import BotMetrics
+from database.models import PlantAnalysis, User
+
+logger = logging.getLogger(__name__)
+
+
+async def find_fresh_analysis(
+    db_session: AsyncSession,
+    tg_file_unique_id: str,
+    max_age: timedelta,
+) -> PlantAnalysis | None:
+    stmt = (
+        select(PlantAnalysis)
+        .where(
+            PlantAnalysis.tg_file_unique_id == tg_file_unique_id,
+            PlantAnalysis.created_at >= datetime.now(UTC) - max_age,
+        )
+        .order_by(PlantAnalysis.created_at.desc())
+        .limit(1)
+    )
+    return (await db_session.execute(stmt)).scalar_one_or_none()
+
+
+async def save_plant_analysis(  # noqa: PLR0913
+    db_session: AsyncSession,
+    user: User,
+    *,
+    thread_id: str | None,
+    tg_file_id: str,
+    tg_file_unique_id: str | None,
+    ai_response: str,
+    health_score: int | None = None,
+) -> PlantAnalysis:
+    analysis = PlantAnalysis(
+        user_tg_id=user.tg_id,
+        thread_id=thread_id,
+        tg_file_id=tg_file_id,
+        tg_file_unique_id=tg_file_unique_id,
+        ai_response=ai_response,
+        health_score=health_score,
+    )
+    db_session.add(analysis)
+    await db_session.flush()
+    return analysis
+
+
+async def analyze_plant_photo(  # noqa: PLR0913
+    message: Message,
+    user: User,
+    db_session: AsyncSession,
+    openai_client: AIClient,
+    *,
+    prompt: str,
+    tg_file_id: str,
+    tg_file_unique_id: str | None,
+    load_image: Callable[[], Awaitable[bytes]],
+    settings: Settings,
+    metrics: BotMetrics | None = None,
+) -> str | None:
+    thread_id = await get_or_create_ai_thread(user, openai_client, db_session)
+    # Одно и то же фото (например, демо из онбординга) анализируем один раз за окно свежести
+    if tg_file_unique_id:
+        max_age = timedelta(hours=settings.cache.ANALYSIS_MAX_AGE_HOURS)
+        cached = await find_fresh_analysis(db_session, tg_file_unique_id, max_age)
+        if cached is not None:
+            if metrics is not None:
+                metrics.analysis_cache.inc("hit")
+            logger.info(f"Plant analysis cache hit for {tg_file_unique_id}")
+            try:
+                await openai_client.add_to_thread(
+                    thread_id, [("user", prompt), ("assistant", cached.ai_response)], user_key=user.tg_id
+                )
+            except OpenAIError as e:
+                # Ответ у пользователя уже есть, теряется только контекст для уточняющих вопросов
+                logger.warning(f"Could not add cached plant analysis to thread {thread_id}: {e!r}")
+            await save_plant_analysis(
+                db_session,
+                user,
+                thread_id=thread_id,
+                tg_file_id=tg_file_id,
+                tg_file_unique_id=tg_file_unique_id,
+                ai_response=cached.ai_response,
+                health_score=cached.health_score,
+            )
+            return cached.ai_response
+    if metrics is not None:
+        metrics.analysis_cache.inc("miss")
+
+    response = await openai_client.get_response_with_image(
+        thread_id,
+        prompt,
+        await load_image(),
+        message,
+        user.fullname,
+        file_unique_id=tg_file_unique_id,
+    )
+    if response and response not in IMAGE_ERROR_REPLIES:
+        await save_plant_analysis(
+            db_session,
+            user,
+            thread_id=thread_id,
+            tg_file_id=tg_file_id,
+            tg_file_unique_id=tg_file_unique_id,
+            ai_response=response,
+        )
+    return response
@@ -0,0 +1,149 @@
+import asyncio
+import json
+import logging
+from array import array
+from pathlib import Path
+
+from bot.controllers.weather import WeatherSnapshot
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CATALOG_PATH = Path(__file__).resolve().parents[1] / "data" / "wardrobe.json"  # src/bot/data
+LOOKS_COUNT = 3
+# Веса совпадений; вещь не по погоде исключается совсем, не по событию — только штрафуется
+EVENT_MATCH, EVENT_MISS = 6, -8
+STYLE_MATCH, STYLE_MISS = 5, -4
+RAIN_BONUS = 6
+EXCLUDED = -10_000
+PRECIPITATION_WORDS = ("осадк", "дожд", "снег", "ливн")
+
+Context = tuple[int, int, int, int]
+
+
+def weather_bucket(weather: WeatherSnapshot, band_limits: list[float | None]) -> tuple[int, int]:
+    band = next(i for i, limit in enumerate(band_limits) if limit is None or weather.temperature_c < limit)
+    warning = (weather.warning or "").lower()
+    return band, int(any(word in warning for word in PRECIPITATION_WORDS))
+
+
+def _column(garments: list[dict], key: str, value: str, match: int, miss: int) -> array:
+    # Пустой список у вещи означает «подходит к любому значению»
+    return array("i", (match if not garment.get(key) or value in garment[key] else miss for garment in garments))
+
+
+class CompiledCatalog:
+    # Каталог, разложенный в таблицы: для каждого значения измерения (событие, стиль, погода, осадки)
+    # заранее посчитан столбец вкладов по всем вещам, ранжирование — сумма столбцов
+    def __init__(self, raw: dict):
+        self.events = {name: i for i, name in enumerate(raw["events"])}
+        self.default_event = self.events[raw["default_event"]]
+        self.style_hints = raw["styles"]
+        self.styles = {name: i for i, name in enumerate(raw["styles"])}
+        self.band_limits = [band["max_c"] for band in raw["bands"]]
+        bands = {band["name"]: i for i, band in enumerate(raw["bands"])}
+        self.slots = {name: i for i, name in enumerate(raw["slots"])}
+        self.required_slots = [self.slots[name] for name in raw["required_slots"]]
+
+        garments = raw["garments"]
+        self.names = [garment["name"] for garment in garments]
+        self.slot_of = array("B", (self.slots[garment["slot"]] for garment in garments))
+        self.base = array("i", (garment.get("weight", 0) for garment in garments))
+        self.event_columns = [_column(garments, "events", name, EVENT_MATCH, EVENT_MISS) for name in self.events]
+        # Последний столбец — для стиля, которого нет в каталоге: нейтральный вклад
+        self.style_columns = [_column(garments, "styles", name, STYLE_MATCH, STYLE_MISS) for name in self.styles]
+        self.style_columns.append(array("i", bytes(4 * len(garments))))
+        self.band_columns = [_column(garments, "bands", name, 0, EXCLUDED) for name in bands]
+        self.precip_columns = [
+            array("i", bytes(4 * len(garments))),
+            array("i", (RAIN_BONUS if g.get("rain") else 0 for g in garments)),
+        ]
+        name_index = {name: i for i, name in enumerate(self.names)}
+        self.rules = [
+            (
+                self._rule_condition(rule.get("when", {}), bands),
+                [self.slots[slot] for slot in rule.get("require", [])],
+                [(name_index[name], boost) for name, boost in rule.get("boost", {}).items()],
+            )
+            for rule in raw.get("rules", [])
+        ]
+        self._memo: dict[Context, list[tuple[str, ...]]] = {}
+        self.memo_hits = 0
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def _rule_condition(self, when: dict, bands: dict[str, int]) -> Context:
+        # -1 в позиции означает «любое значение»
+        return (
+            self.events[when["event"]] if "event" in when else -1,
+            self.styles[when["style"]] if "style" in when else -1,
+            bands[when["band"]] if "band" in when else -1,
+            int(when["precip"]) if "precip" in when else -1,
+        )
+
+    def context(self, event_type: str, style: str, weather: WeatherSnapshot) -> Context:
+        band, precip = weather_bucket(weather, self.band_limits)
+        event = self.events.get(event_type, self.default_event)
+        return event, self.styles.get(style, len(self.styles)), band, precip
+
+    def looks(self, context: Context) -> list[tuple[str, ...]]:
+        looks = self._memo.get(context)
+        if looks is not None:
+            self.memo_hits += 1
+            return looks
+        looks = self._memo[context] = self._rank(context)
+        return looks
+
+    def _rank(self, context: Context) -> list[tuple[str, ...]]:
+        event, style, band, precip = context
+        scores = [
+            base + e + s + b + p
+            for base, e, s, b, p in zip(
+                self.base,
+                self.event_columns[event],
+                self.style_columns[style],
+                self.band_columns[band],
+                self.precip_columns[precip],
+                strict=True,
+            )
+        ]
+        slots = list(self.required_slots)
+        for condition, required, boosts in self.rules:
+            if all(expected in (-1, actual) for expected, actual in zip(condition, context, strict=True)):
+                slots.extend(slot for slot in required if slot not in slots)
+                for i, boost in boosts:
+                    scores[i] += boost
+
+        ranked: dict[int, list[int]] = {slot: [] for slot in slots}
+        for i in sorted(range(len(scores)), key=scores.__getitem__, reverse=True):
+            if scores[i] > EXCLUDED // 2 and self.slot_of[i] in ranked:
+                ranked[self.slot_of[i]].append(i)
+        # Образы отличаются по очереди вариантов в каждом слоте: i-й образ берёт i-ю по рангу вещь
+        return [
+            tuple(self.names[items[n % len(items)]] for slot, items in ranked.items() if items)
+            for n in range(LOOKS_COUNT)
+        ]
+
+
+def load_catalog(path: Path) -> CompiledCatalog:
+    with path.open(encoding="utf-8") as file:
+        return CompiledCatalog(json.load(file))
+
+
+class RecommendationEngine:
+    def __init__(self, path: Path = DEFAULT_CATALOG_PATH):
+        self.path = path
+        self.catalog = load_catalog(path)
+
+    async def reload(self) -> int:
+        catalog = await asyncio.to_thread(load_catalog, self.path)
+        # Мемоизация живёт в скомпилированном каталоге и сбрасывается вместе с ним
+        self.catalog = catalog
+        logger.info(f"Wardrobe catalog loaded: {len(catalog)} garments")
+        return len(catalog)
+
+    def recommend(self, event_type: str, style: str, weather: WeatherSnapshot) -> list[str]:
+        catalog = self.catalog
+        style_hint = catalog.style_hints.get(style, f"в стиле {style}")
+        looks = catalog.looks(catalog.context(event_type, style, weather))
+        return [f"{n}) {', '.join(look)}, {style_hint}" for n, look in enumerate(looks, start=1)]
@@ -0,0 +1,306 @@
+import asyncio
+import csv
+import heapq
+import json
+import logging
+import math
+from array import array
+from dataclasses import dataclass
+from pathlib import Path
+
+import aiohttp
+from sqlalchemy import func, select
+
+from bot.controllers.weather import geohash, normalize_city
+from bot.internal.cache import TTLCache
+from database.database_connector import DatabaseConnector
+from database.models import Shop as ShopRow
+
+logger = logging.getLogger(__name__)
+
+KM_PER_DEG = 111.195
+DEFAULT_MAX_RADIUS_KM = 50
+LEAF_SIZE = 8
+LAT, LON = 0, 1
+
+
+@dataclass(slots=True, frozen=True)
+class Shop:
+    name: str
+    address: str
+    city: str
+    lat: float
+    lon: float
+
+
+class ShopIndex:
+    # Неявное KD-дерево: магазины переупорядочены так, что медиана диапазона [lo, hi) — узел,
+    # левая и правая половины — поддеревья. Координаты лежат в плоских массивах double,
+    # ось разбиения узла — в bytearray, указателей и объектов-узлов нет
+    def __init__(self, shops: list[Shop]):
+        lats = [shop.lat for shop in shops]
+        lons = [shop.lon for shop in shops]
+        order = list(range(len(shops)))
+        self.axes = bytearray(len(shops))
+        mean_lat = sum(lats) / len(lats) if lats else 0.0
+        self._build(order, lats, lons, math.cos(math.radians(mean_lat)))
+        self.shops = [shops[i] for i in order]
+        self.lats = array("d", (lats[i] for i in order))
+        self.lons = array("d", (lons[i] for i in order))
+        self._by_city: dict[str, list[int]] = {}
+        for i, shop in enumerate(self.shops):
+            self._by_city.setdefault(normalize_city(shop.city), []).append(i)
+
+    def __len__(self) -> int:
+        return len(self.shops)
+
+    def _build(self, order: list[int], lats: list[float], lons: list[float], cos_lat: float) -> None:
+        stack = [(0, len(order))]
+        while stack:
+            lo, hi = stack.pop()
+            if hi - lo <= LEAF_SIZE:
+                continue
+            part = order[lo:hi]
+            lat_spread = max(lats[i] for i in part) - min(lats[i] for i in part)
+            lon_spread = (max(lons[i] for i in part) - min(lons[i] for i in part)) * cos_lat
+            axis = LAT if lat_spread >= lon_spread else LON
+            part.sort(key=(lats if axis == LAT else lons).__getitem__)
+            order[lo:hi] = part
+            mid = (lo + hi) // 2
+            self.axes[mid] = axis
+            stack.append((lo, mid))
+            stack.append((mid + 1, hi))
+
+    def nearest(
+        self,
+        lat: float,
+        lon: float,
+        k: int = 3,
+        max_radius_km: float = DEFAULT_MAX_RADIUS_KM,
+    ) -> list[tuple[Shop, float]]:
+        if not self.shops or k <= 0:
+            return []
+        lats, lons, axes = self.lats, self.lons, self.axes
+        cos_lat = math.cos(math.radians(lat))
+        # Поиск ведётся в градусах с масштабированной долготой, в км переводим только результат
+        limit = max_radius_km / KM_PER_DEG
+        best: list[tuple[float, int]] = []
+        worst = limit
+        stack = [(0, len(lats), 0.0)]
+        while stack:
+            lo, hi, bound = stack.pop()
+            if bound > worst:
+                continue
+            if hi - lo <= LEAF_SIZE:
+                candidates = range(lo, hi)
+            else:
+                mid = (lo + hi) // 2
+                diff = lat - lats[mid] if axes[mid] == LAT else (lon - lons[mid]) * cos_lat
+                near, far = ((mid + 1, hi), (lo, mid)) if diff >= 0 else ((lo, mid), (mid + 1, hi))
+                stack.append((*far, max(bound, abs(diff))))
+                stack.append((*near, bound))
+                candidates = (mid,)
+            for i in candidates:
+                distance = math.hypot(lats[i] - lat, (lons[i] - lon) * cos_lat)
+                if distance > worst:
+                    continue
+                if len(best) < k:
+                    heapq.heappush(best, (-distance, i))
+                    if len(best) == k:
+                        worst = -best[0][0]
+                else:
+                    heapq.heapreplace(best, (-distance, i))
+                    worst = -best[0][0]
+        return [(self.shops[i], -distance * KM_PER_DEG) for distance, i in sorted(best, reverse=True)]
+
+    def within(self, lat: float, lon: float, radius_km: float) -> list[tuple[Shop, float]]:
+        if not self.shops:
+            return []
+        lats, lons, axes = self.lats, self.lons, self.axes
+        cos_lat = math.cos(math.radians(lat))
+        radius = radius_km / KM_PER_DEG
+        found = []
+        stack = [(0, len(lats))]
+        while stack:
+            lo, hi = stack.pop()
+            if hi - lo <= LEAF_SIZE:
+                candidates = range(lo, hi)
+            else:
+                mid = (lo + hi) // 2
+                diff = lat - lats[mid] if axes[mid] == LAT else (lon - lons[mid]) * cos_lat
+                if diff >= -radius:
+                    stack.append((mid + 1, hi))
+                if diff <= radius:
+                    stack.append((lo, mid))
+                candidates = (mid,)
+            for i in candidates:
+                distance = math.hypot(lats[i] - lat, (lons[i] - lon) * cos_lat)
+                if distance <= radius:
+                    found.append((distance, i))
+        return [(self.shops[i], distance * KM_PER_DEG) for distance, i in sorted(found)]
+
+    def in_city(self, city: str, k: int = 3) -> list[Shop]:
+        return [self.shops[i] for i in self._by_city.get(normalize_city(city), [])[:k]]
+
+
+def distance_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    # Равнопромежуточная проекция: на расстояниях до сотни км ошибка меньше процента
+    return math.hypot(lat2 - lat1, (lon2 - lon1) * math.cos(math.radians(lat1))) * KM_PER_DEG
+
+
+def load_shops_file(path: Path) -> list[Shop]:
+    with path.open(encoding="utf-8") as file:
+        rows = csv.DictReader(file) if path.suffix == ".csv" else (json.loads(line) for line in file if line.strip())
+        return [
+            Shop(
+                name=row["name"],
+                address=row.get("address") or "",
+                city=row.get("city") or "",
+                lat=float(row["lat"]),
+                lon=float(row["lon"]),
+            )
+            for row in rows
+        ]
+
+
+async def load_shops_db(db: DatabaseConnector) -> list[Shop]:
+    stmt = select(ShopRow.name, ShopRow.address, ShopRow.city, ShopRow.lat, ShopRow.lon)
+    async with db.session_factory() as db_session:
+        result = await db_session.stream(stmt.execution_options(yield_per=5000))
+        return [Shop(*row) async for row in result]
+
+
+async def shops_db_version(db: DatabaseConnector) -> tuple:
+    # Дешёвый отпечаток таблицы: новые, удалённые и перезалитые строки меняют число строк или max(id)
+    stmt = select(func.count(), func.max(ShopRow.id), func.max(ShopRow.created_at))
+    async with db.session_factory() as db_session:
+        return tuple((await db_session.execute(stmt)).one())
+
+
+class PlacesEnricher:
+    # Дополняет выдачу магазинами из Google Places, ответы кэшируются по ячейке geohash
+    def __init__(self, api_key: str, base_url: str, radius_m: int = 2000, ttl: int = 86400):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.radius_m = radius_m
+        self.cache = TTLCache(maxsize=10_000, ttl=ttl)
+        self._session: aiohttp.ClientSession | None = None
+
+    async def nearby(self, lat: float, lon: float) -> list[Shop]:
+        cell = geohash(lat, lon, precision=6)
+        shops = self.cache.get(cell)
+        if shops is not None:
+            return shops
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=5))
+        params = {
+            "location": f"{lat},{lon}",
+            "radius": self.radius_m,
+            "type": "clothing_store",
+            "language": "ru",
+            "key": self.api_key,
+        }
+        async with self._session.get(f"{self.base_url}/nearbysearch/json", params=params) as response:
+            response.raise_for_status()
+            payload = await response.json()
+        shops = [
+            Shop(
+                name=place["name"],
+                address=place.get("vicinity", ""),
+                city="",
+                lat=place["geometry"]["location"]["lat"],
+                lon=place["geometry"]["location"]["lng"],
+            )
+            for place in payload.get("results", [])
+        ]
+        self.cache.set(cell, shops)
+        return shops
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+
+
+class ShopCatalog:
+    def __init__(
+        self,
+        file_path: Path | None = None,
+        db: DatabaseConnector | None = None,
+        enricher: PlacesEnricher | None = None,
+    ):
+        self.file_path = file_path
+        self.db = db
+        self.enricher = enricher
+        self.index = ShopIndex([])
+        self.reload_task: asyncio.Task | None = None
+        self._version: object = None
+
+    async def current_version(self) -> object:
+        if self.file_path is not None:
+            return self.file_path.stat().st_mtime
+        if self.db is not None:
+            return await shops_db_version(self.db)
+        return None
+
+    async def reload(self) -> int:
+        version = await self.current_version()
+        if self.file_path is not None:
+            shops = await asyncio.to_thread(load_shops_file, self.file_path)
+        elif self.db is not None:
+            shops = await load_shops_db(self.db)
+        else:
+            shops = []
+        index = await asyncio.to_thread(ShopIndex, shops)
+        # Подмена целиком: запросы в процессе перезагрузки продолжают работать со старым индексом
+        self.index = index
+        self._version = version
+        logger.info(f"Shop catalog loaded: {len(index)} shops")
+        return len(index)
+
+    async def watch(self, interval: int) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                # Индекс пересобирается только если каталог изменился с прошлой загрузки
+                if await self.current_version() != self._version:
+                    await self.reload()
+            except Exception:
+                logger.exception("Shop catalog reload failed")
+
+    async def nearest(self, lat: float, lon: float, k: int = 3) -> list[tuple[Shop, float]]:
+        found = self.index.nearest(lat, lon, k=k)
+        if len(found) >= k or self.enricher is None:
+            return found
+        try:
+            extra = await self.enricher.nearby(lat, lon)
+        except Exception:
+            logger.exception("Places enrichment failed")
+            return found
+        known = {shop.name for shop, _ in found}
+        for shop in extra:
+            if shop.name not in known:
+                found.append((shop, distance_km(lat, lon, shop.lat, shop.lon)))
+        return sorted(found, key=lambda item: item[1])[:k]
+
+
+def get_shop_catalog(settings, db: DatabaseConnector) -> ShopCatalog:
+    enricher = None
+    if settings.maps.API_KEY:
+        enricher = PlacesEnricher(settings.maps.API_KEY.get_secret_value(), settings.maps.BASE_URL)
+    file_path = Path(settings.maps.SHOPS_FILE) if settings.maps.SHOPS_FILE else None
+    return ShopCatalog(file_path=file_path, db=db if settings.maps.SHOPS_FROM_DB else None, enricher=enricher)
+
+
+async def start_shop_catalog(shop_catalog: ShopCatalog, settings) -> None:
+    try:
+        await shop_catalog.reload()
+    except Exception:
+        logger.exception("Initial shop catalog load failed")
+    shop_catalog.reload_task = asyncio.create_task(shop_catalog.watch(settings.maps.SHOPS_RELOAD_INTERVAL))
+
+
+async def stop_shop_catalog(shop_catalog: ShopCatalog) -> None:
+    if shop_catalog.reload_task is not None:
+        shop_catalog.reload_task.cancel()
+    if shop_catalog.enricher is not None:
+        await shop_catalog.enricher.close()
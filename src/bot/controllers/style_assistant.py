@@ -1,19 +1,28 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from decimal import Decimal
+from datetime import UTC, datetime, timedelta
+from typing import TYPE_CHECKING
 
-from sqlalchemy import Select, func, select
+from sqlalchemy import Row, func, or_, select, tuple_
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from database.models import Preference, Recommendation, User, UserPhoto, UserProfile
+from bot.controllers.recommendations import RecommendationEngine
+from bot.controllers.weather import FakeWeatherProvider, WeatherService, WeatherSnapshot
+from database.models import MetricCounter, Preference, Recommendation, User, UserPhoto, UserProfile
+from database.write_queue import PendingPhoto, PendingPreference, PendingRecommendation, WriteQueue
 
+if TYPE_CHECKING:
+    from bot.controllers.shops import ShopCatalog
 
-@dataclass(slots=True)
-class WeatherSnapshot:
-    summary: str
-    temperature_c: int
-    warning: str | None
+_fallback_weather = WeatherService(FakeWeatherProvider())
+_default_engine = RecommendationEngine()
+METRICS_DAYS = 7
+HISTORY_PAGE_SIZE = 5
+EPOCH = datetime(1970, 1, 1, tzinfo=UTC)
+
+HistoryCursor = tuple[datetime, int]
 
 
 def _normalize(city: str) -> str:
@@ -29,24 +38,22 @@ async def upsert_location(
     lon: float | None,
     allow_location: bool,
 ) -> UserProfile:
-    stmt: Select[tuple[UserProfile]] = select(UserProfile).where(UserProfile.user_id == user.id)
-    profile = (await db_session.execute(stmt)).scalar_one_or_none()
-    if profile is None:
-        profile = UserProfile(
-            user_id=user.id,
-            city=city,
-            lat=Decimal(str(lat)) if lat is not None else None,
-            lon=Decimal(str(lon)) if lon is not None else None,
-            allow_location=allow_location,
+    stmt = insert(UserProfile).values(user_id=user.id, city=city, lat=lat, lon=lon, allow_location=allow_location)
+    stmt = (
+        stmt.on_conflict_do_update(
+            index_elements=[UserProfile.user_id],
+            set_={
+                "city": stmt.excluded.city,
+                "lat": stmt.excluded.lat,
+                "lon": stmt.excluded.lon,
+                "allow_location": stmt.excluded.allow_location,
+                "updated_at": func.now(),
+            },
         )
-        db_session.add(profile)
-    else:
-        profile.city = city
-        profile.lat = Decimal(str(lat)) if lat is not None else None
-        profile.lon = Decimal(str(lon)) if lon is not None else None
-        profile.allow_location = allow_location
-    await db_session.flush()
-    return profile
+        .returning(UserProfile)
+        .execution_options(populate_existing=True)
+    )
+    return await db_session.scalar(stmt)
 
 
 async def save_preference(db_session: AsyncSession, user: User, event_type: str, style: str) -> Preference:
@@ -63,34 +70,22 @@ async def save_photo(db_session: AsyncSession, user: User, tg_file_id: str) -> U
     return photo
 
 
-async def generate_weather(city: str | None, lat: float | None, lon: float | None) -> WeatherSnapshot:
-    if lat is None or lon is None:
-        location = city or "вашему городу"
-        return WeatherSnapshot(summary=f"Сейчас прохладно в {location}: около 14°C.", temperature_c=14, warning="Возможен дождь")
-
-    pseudo_temp = int((abs(lat) + abs(lon)) % 30)
-    warning = "Сильный ветер" if pseudo_temp < 10 else None
-    return WeatherSnapshot(summary=f"Сейчас примерно {pseudo_temp}°C.", temperature_c=pseudo_temp, warning=warning)
-
+async def generate_weather(
+    city: str | None,
+    lat: float | None,
+    lon: float | None,
+    weather_service: WeatherService | None = None,
+) -> WeatherSnapshot:
+    return await (weather_service or _fallback_weather).get(city=city, lat=lat, lon=lon)
 
-def build_recommendations(event_type: str, style: str, weather: WeatherSnapshot) -> list[str]:
-    base = {
-        "повседневно": ["базовые джинсы", "хлопковая футболка", "кеды"],
-        "мероприятие": ["брюки/юбка", "акцентный верх", "лоферы или каблук"],
-    }
-    style_piece = {
-        "casual": "в расслабленном casual",
-        "classic": "в аккуратном classic",
-        "sport": "в функциональном sport",
-    }
-    pieces = ", ".join(base.get(event_type, base["повседневно"]))
-    style_hint = style_piece.get(_normalize(style), f"в стиле {style}")
 
-    return [
-        f"1) {pieces}, {style_hint}",
-        f"2) Добавь второй слой под {weather.temperature_c}°C (кардиган/пиджак)",
-        "3) Выбери непромокаемую обувь, если есть риск осадков",
-    ]
+def build_recommendations(
+    event_type: str,
+    style: str,
+    weather: WeatherSnapshot,
+    recommendation_engine: RecommendationEngine | None = None,
+) -> list[str]:
+    return (recommendation_engine or _default_engine).recommend(event_type, _normalize(style), weather)
 
 
 async def save_recommendation(
@@ -111,31 +106,124 @@ async def save_recommendation(
     return rec
 
 
-async def user_recommendation_history(db_session: AsyncSession, user: User, limit: int = 5) -> list[Recommendation]:
+async def record_recommendation(  # noqa: PLR0913
+    write_queue: WriteQueue | None,
+    db_session: AsyncSession,
+    user: User,
+    *,
+    event_type: str,
+    style: str,
+    weather_summary: str,
+    message_text: str,
+) -> None:
+    if write_queue is None:
+        pref = await save_preference(db_session, user, event_type=event_type, style=style)
+        await save_recommendation(db_session, user, pref, weather_summary, message_text)
+        return
+    pref = PendingPreference(user_id=user.id, event_type=event_type, style=style)
+    await write_queue.put(pref, PendingRecommendation(user.id, weather_summary, message_text, preference=pref))
+
+
+async def record_photo(write_queue: WriteQueue | None, db_session: AsyncSession, user: User, tg_file_id: str) -> None:
+    if write_queue is None:
+        await save_photo(db_session, user, tg_file_id)
+        return
+    await write_queue.put(PendingPhoto(user_id=user.id, tg_file_id=tg_file_id))
+
+
+@dataclass(slots=True, frozen=True)
+class HistoryPage:
+    # Строки — (id, created_at, weather_summary) прямо из индекса, без ORM-объектов
+    items: list[Row]
+    has_older: bool
+    has_newer: bool
+
+    @property
+    def first(self) -> HistoryCursor:
+        return self.items[0].created_at, self.items[0].id
+
+    @property
+    def last(self) -> HistoryCursor:
+        return self.items[-1].created_at, self.items[-1].id
+
+
+async def user_recommendation_history(
+    db_session: AsyncSession,
+    user: User,
+    limit: int = HISTORY_PAGE_SIZE,
+    cursor: HistoryCursor | None = None,
+    *,
+    newer: bool = False,
+) -> HistoryPage:
+    # Keyset-пагинация по (created_at, id): страница — это диапазон индекса после курсора,
+    # стоимость не растёт с номером страницы, как у OFFSET
+    key = tuple_(Recommendation.created_at, Recommendation.id)
+    stmt = select(Recommendation.id, Recommendation.created_at, Recommendation.weather_summary).where(
+        Recommendation.user_id == user.id
+    )
+    if newer:
+        stmt = stmt.where(key > tuple_(*cursor)).order_by(Recommendation.created_at, Recommendation.id)
+    else:
+        if cursor is not None:
+            stmt = stmt.where(key < tuple_(*cursor))
+        stmt = stmt.order_by(Recommendation.created_at.desc(), Recommendation.id.desc())
+    # Лишняя строка показывает, есть ли следующая страница, без отдельного count
+    rows = list(await db_session.execute(stmt.limit(limit + 1)))
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if newer:
+        return HistoryPage(items=rows[::-1], has_older=True, has_newer=more)
+    return HistoryPage(items=rows, has_older=more, has_newer=cursor is not None)
+
+
+def encode_history_cursor(cursor: HistoryCursor) -> str:
+    created_at, row_id = cursor
+    return f"{(created_at - EPOCH) // timedelta(microseconds=1)}:{row_id}"
+
+
+def decode_history_cursor(raw: str) -> HistoryCursor:
+    micros, row_id = raw.split(":")
+    return EPOCH + timedelta(microseconds=int(micros)), int(row_id)
+
+
+async def admin_metrics(db_session: AsyncSession, days: int = METRICS_DAYS) -> dict:
+    # Читаем счётчики, которые ведут триггеры (см. MetricCounter): размер ответа зависит от числа
+    # источников, стилей и дней в окне, а не от размера таблиц
+    since = (datetime.now(UTC).date() - timedelta(days=days - 1)).isoformat()
     stmt = (
-        select(Recommendation)
-        .where(Recommendation.user_id == user.id)
-        .order_by(Recommendation.created_at.desc())
-        .limit(limit)
+        select(MetricCounter.metric, MetricCounter.dimension, MetricCounter.value, func.sum(MetricCounter.count))
+        .where(or_(MetricCounter.dimension != "day", MetricCounter.value >= since))
+        .group_by(MetricCounter.metric, MetricCounter.dimension, MetricCounter.value)
     )
-    return list((await db_session.execute(stmt)).scalars().all())
-
-
-async def admin_metrics(db_session: AsyncSession) -> dict[str, int]:
-    users_count = await db_session.scalar(select(func.count()).select_from(User))
-    rec_count = await db_session.scalar(select(func.count()).select_from(Recommendation))
-    photos_count = await db_session.scalar(select(func.count()).select_from(UserPhoto))
-    return {
-        "users": users_count or 0,
-        "recommendations": rec_count or 0,
-        "photos": photos_count or 0,
-    }
-
-
-def find_nearby_shops(city: str | None) -> list[str]:
-    place = city or "вашем районе"
-    return [
-        f"Style Point — {place}",
-        f"Urban Mood — {place}",
-        f"Classic Hub — {place}",
-    ]
\ No newline at end of file
+    metrics = {"users": 0, "recommendations": 0, "photos": 0, "by_day": {}, "by_source": {}, "by_style": {}}
+    for metric, dimension, value, count in await db_session.execute(stmt):
+        if dimension == "total":
+            metrics[metric] = int(count)
+        elif dimension == "day":
+            metrics["by_day"].setdefault(value, {})[metric] = int(count)
+        elif count:
+            metrics[f"by_{dimension}"][value or "—"] = int(count)
+    return metrics
+
+
+async def get_user_location(db_session: AsyncSession, user: User) -> tuple[str | None, float | None, float | None]:
+    stmt = select(UserProfile.city, UserProfile.lat, UserProfile.lon).where(UserProfile.user_id == user.id)
+    row = (await db_session.execute(stmt)).one_or_none()
+    return tuple(row) if row is not None else (None, None, None)
+
+
+async def find_nearby_shops(
+    shop_catalog: ShopCatalog | None,
+    city: str | None,
+    lat: float | None,
+    lon: float | None,
+    k: int = 3,
+) -> list[str]:
+    if shop_catalog is None:
+        return []
+    if lat is not None and lon is not None:
+        nearest = await shop_catalog.nearest(lat, lon, k)
+        return [f"{shop.name} — {shop.address} ({distance:.1f} км)" for shop, distance in nearest]
+    if city:
+        return [f"{shop.name} — {shop.address}" for shop in shop_catalog.index.in_city(city, k)]
+    return []
@@ -1,10 +1,9 @@
 import logging
 from aiogram.types import User
-from sqlalchemy import Result, select
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy import Result, literal_column, select
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from bot.config import Settings
 from bot.internal.lexicon import ORDER, QUESTIONS
 from database.models import User as BotUser
 from database.models import UserCounters
@@ -12,27 +11,21 @@ from database.models import UserCounters
 logger = logging.getLogger(__name__)
 
 async def add_user_to_db(user, db_session: AsyncSession, source: str | None = None) -> BotUser:
-    new_user = BotUser(
-        tg_id=user.id,
-        fullname=user.full_name,
-        username=compose_username(user),
-        source=source,
+    # Конкурентные апдейты одного нового пользователя сходятся на уникальном tg_id:
+    # проигравший получает уже существующую строку, без исключения и повторов
+    stmt = (
+        insert(BotUser)
+        .values(tg_id=user.id, fullname=user.full_name, username=compose_username(user), source=source)
+        .on_conflict_do_update(index_elements=[BotUser.tg_id], set_={"tg_id": BotUser.tg_id})
+        .returning(BotUser, literal_column("xmax = 0").label("inserted"))
+        .execution_options(populate_existing=True)
     )
-    try:
-        async with db_session.begin_nested():
-            db_session.add(new_user)
-            await db_session.flush()
-    except IntegrityError:
-        existing_user = await get_user_from_db_by_tg_id(user.id, db_session)
-        if existing_user:
-            logger.info("User already exists, returning existing record: %s", existing_user)
-            return existing_user
-        raise
-    logger.info("New user created: %s", new_user)
+    new_user, inserted = (await db_session.execute(stmt)).one()
+    if inserted:
+        logger.info("New user created: %s", new_user)
     return new_user
 
 
-
 async def get_user_from_db_by_tg_id(telegram_id: int, db_session: AsyncSession) -> BotUser | None:
     query = select(BotUser).filter(BotUser.tg_id == telegram_id)
     result: Result = await db_session.execute(query)
@@ -62,14 +55,14 @@ def generate_user_context(user: BotUser) -> str:
 
 
 async def get_user_counter(telegram_id: int, db_session: AsyncSession) -> UserCounters:
-    query = select(UserCounters).filter(UserCounters.tg_id == telegram_id)
-    counter = await db_session.execute(query)
-    counter = counter.scalar_one_or_none()
-    if not counter:
-        counter = UserCounters(tg_id=telegram_id)
-        db_session.add(counter)
-        await db_session.flush()
-    return counter
+    stmt = (
+        insert(UserCounters)
+        .values(tg_id=telegram_id, image_count=0)
+        .on_conflict_do_update(index_elements=[UserCounters.tg_id], set_={"tg_id": UserCounters.tg_id})
+        .returning(UserCounters)
+        .execution_options(populate_existing=True)
+    )
+    return await db_session.scalar(stmt)
 
 
 async def reset_user_image_counter(telegram_id: int, db_session: AsyncSession) -> None:
@@ -78,8 +71,3 @@ async def reset_user_image_counter(telegram_id: int, db_session: AsyncSession) -
     await db_session.flush()
 
 
-def check_action_limit(user: BotUser, settings: Settings) -> bool:
-    if user.tg_id in settings.bot.ADMINS:
-        return True
-    return user.action_count < settings.bot.ACTIONS_THRESHOLD
-
@@ -1,54 +1,155 @@
 import asyncio
 import logging
-from io import BytesIO
+import tempfile
+from collections.abc import AsyncIterator
+from typing import BinaryIO
 
+from aiogram import Bot
 from aiogram.types import Message
 
 from bot.ai_client import AIClient
+from bot.internal.consts import FFMPEG_MAX_PROCESSES, FFMPEG_MAX_QUEUE
 
+# Форматы, которые Whisper принимает без перекодирования
+WHISPER_NATIVE_FORMATS = {
+    "audio/ogg": "ogg",
+    "audio/opus": "ogg",
+    "audio/mpeg": "mp3",
+    "audio/mp3": "mp3",
+    "audio/mp4": "m4a",
+    "audio/x-m4a": "m4a",
+    "audio/m4a": "m4a",
+    "audio/wav": "wav",
+    "audio/x-wav": "wav",
+    "audio/webm": "webm",
+    "audio/flac": "flac",
+}
+CHUNK_SIZE = 65536
 
-async def convert_to_mp3(audio: bytes) -> bytes:
-    try:
-        process = await asyncio.create_subprocess_exec(
-            "ffmpeg",
-            "-i",
-            "pipe:0",
-            "-f",
-            "mp3",
-            "-acodec",
-            "libmp3lame",
-            "-b:a",
-            "128k",
-            "pipe:1",
-            stdin=asyncio.subprocess.PIPE,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
+
+class TranscoderBusyError(RuntimeError):
+    pass
+
+
+class Transcoder:
+    # Ограниченный пул ffmpeg: не больше max_processes одновременно и не больше max_queue в ожидании
+    def __init__(self, max_processes: int = FFMPEG_MAX_PROCESSES, max_queue: int = FFMPEG_MAX_QUEUE):
+        self.max_queue = max_queue
+        self._semaphore = asyncio.Semaphore(max_processes)
+        self._waiting = 0
+
+    async def to_mp3(self, chunks: AsyncIterator[bytes], output: BinaryIO) -> None:
+        if self._waiting >= self.max_queue:
+            raise TranscoderBusyError("Too many voice messages are waiting for transcoding")
+        self._waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+        try:
+            await self._run_ffmpeg(chunks, output)
+        finally:
+            self._semaphore.release()
+
+    @staticmethod
+    async def _run_ffmpeg(chunks: AsyncIterator[bytes], output: BinaryIO) -> None:
+        try:
+            process = await asyncio.create_subprocess_exec(
+                "ffmpeg",
+                "-i",
+                "pipe:0",
+                "-f",
+                "mp3",
+                "-acodec",
+                "libmp3lame",
+                "-b:a",
+                "128k",
+                "pipe:1",
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+        except FileNotFoundError:
+            logging.exception("FFmpeg is not installed or not found in PATH.")
+            raise RuntimeError("FFmpeg is not installed or not found in PATH.")
+
+        async def feed() -> None:
+            try:
+                async for chunk in chunks:
+                    process.stdin.write(chunk)
+                    await process.stdin.drain()
+            except (BrokenPipeError, ConnectionResetError):
+                logging.warning("FFmpeg closed stdin before the whole input was sent")
+            finally:
+                process.stdin.close()
+
+        async def collect() -> None:
+            while chunk := await process.stdout.read(CHUNK_SIZE):
+                output.write(chunk)
+
+        try:
+            _, _, stderr = await asyncio.gather(feed(), collect(), process.stderr.read())
+        except BaseException:
+            process.kill()
+            await process.wait()
+            raise
+        if await process.wait() != 0:
+            raise RuntimeError(f"FFmpeg failed: {stderr.decode(errors='replace')[-2000:]}")
+
+
+transcoder = Transcoder()
+
+
+async def _download_chunks(bot: Bot, file_path: str) -> AsyncIterator[bytes]:
+    if bot.session.api.is_local:
+        buffer = await bot.download_file(file_path, chunk_size=CHUNK_SIZE)
+        while chunk := buffer.read(CHUNK_SIZE):
+            yield chunk
+        return
+    url = bot.session.api.file_url(bot.token, file_path)
+    async for chunk in bot.session.stream_content(url=url, chunk_size=CHUNK_SIZE):
+        yield chunk
+
+
+async def _load_audio(bot: Bot, file_path: str, mime_type: str | None, audio: BinaryIO) -> str:
+    # Аудио идёт чанками во временный файл, а из него — в запрос к Whisper: в памяти не больше одного чанка.
+    # Файл, а не поток прямо в запрос, потому что повтор планировщиком должен отправить его с начала
+    extension = WHISPER_NATIVE_FORMATS.get(mime_type or "")
+    if extension:
+        async for chunk in _download_chunks(bot, file_path):
+            audio.write(chunk)
+        return f"audio.{extension}"
+    await transcoder.to_mp3(_download_chunks(bot, file_path), audio)
+    return "audio.mp3"
+
+
+async def _transcribe(message: Message, openai_client: AIClient, filename: str, audio: BinaryIO) -> str:
+    async def transcribe() -> str:
+        # Повтор планировщиком должен отправить файл с начала
+        audio.seek(0)
+        return await openai_client.client.audio.transcriptions.create(
+            file=(filename, audio),
+            model="whisper-1",
+            response_format="text",
+            language="ru",
         )
-        stdout, stderr = await process.communicate(input=audio)
-        if process.returncode != 0:
-            raise RuntimeError(f"FFmpeg failed: {stderr.decode()}")
-        return stdout
-    except FileNotFoundError:
-        logging.exception("FFmpeg is not installed or not found in PATH.")
-        raise RuntimeError("FFmpeg is not installed or not found in PATH.")
+
+    transcription_response = await openai_client.scheduler.call(message.from_user.id, transcribe)
+    return transcription_response.strip()
 
 
 async def process_voice(message: Message, openai_client: AIClient) -> str | None:
     try:
         voice = message.voice
         file_info = await message.bot.get_file(voice.file_id)
-        audio_bytes = await message.bot.download_file(file_info.file_path)
-        audio_data = audio_bytes.read()
-
-        mp3_audio = await convert_to_mp3(audio_data)
-        audio_stream = BytesIO(mp3_audio)
-        audio_stream.name = "audio.mp3"
-
-        transcription_response = await openai_client.client.audio.transcriptions.create(
-            file=audio_stream, model="whisper-1", response_format="text", language="ru"
-        )
-        return transcription_response.strip()
+        with tempfile.TemporaryFile() as audio:
+            filename = await _load_audio(message.bot, file_info.file_path, voice.mime_type, audio)
+            return await _transcribe(message, openai_client, filename, audio)
 
+    except TranscoderBusyError:
+        logging.warning(f"Voice transcoding queue is full, rejecting message from {message.chat.id}")
+        await message.reply("Сейчас много голосовых сообщений. Пожалуйста, попробуйте через минуту.")
+        return None
     except Exception as e:
         logging.exception(f"Unexpected transcription error: {e}")
         await message.reply("Произошла непредвиденная ошибка при распознавании. Пожалуйста, попробуйте позже.")
@@ -0,0 +1,252 @@
+import asyncio
+import json
+import logging
+from dataclasses import asdict, dataclass
+from typing import Protocol
+
+import aiohttp
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from bot.internal.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+REDIS_KEY_PREFIX = "weather:"
+# Неудачный запрос (опечатка в городе, недоступный провайдер) кэшируем коротко, чтобы не долбить API
+FAILURE_TTL = 60
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_CHAR_BITS = 5
+# 5 символов geohash — ячейка ~4.9 x 4.9 км, мельче прогноз всё равно не различает
+GEOHASH_PRECISION = 5
+WIND_WARNING_MS = 10
+PRECIPITATION_CODES = range(200, 700)
+FAKE_WINDY_BELOW_C = 10
+
+
+@dataclass(slots=True)
+class WeatherSnapshot:
+    summary: str
+    temperature_c: int
+    warning: str | None
+
+
+def fallback_snapshot(location: str) -> WeatherSnapshot:
+    return WeatherSnapshot(summary=f"Сейчас прохладно в {location}: около 14°C.", temperature_c=14, warning="Возможен дождь")
+
+
+class WeatherProvider(Protocol):
+    async def by_coords(self, lat: float, lon: float) -> WeatherSnapshot: ...
+
+    async def by_city(self, city: str) -> WeatherSnapshot: ...
+
+
+def geohash(lat: float, lon: float, precision: int = GEOHASH_PRECISION) -> str:
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, bit_count, even = [], 0, 0, True
+    while len(chars) < precision:
+        target, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (target[0] + target[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            target[0] = mid
+        else:
+            target[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == GEOHASH_CHAR_BITS:
+            chars.append(GEOHASH_ALPHABET[bits])
+            bits, bit_count = 0, 0
+    return "".join(chars)
+
+
+def normalize_city(city: str) -> str:
+    return " ".join(city.strip().lower().replace("ё", "е").split())
+
+
+class OpenWeatherProvider:
+    def __init__(self, api_key: str, base_url: str, timeout: float = 5, max_connections: int = 20):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.max_connections = max_connections
+        self._session: aiohttp.ClientSession | None = None
+
+    async def by_coords(self, lat: float, lon: float) -> WeatherSnapshot:
+        return await self._current({"lat": lat, "lon": lon})
+
+    async def by_city(self, city: str) -> WeatherSnapshot:
+        return await self._current({"q": city})
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+
+    async def _current(self, params: dict) -> WeatherSnapshot:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=self.timeout,
+                connector=aiohttp.TCPConnector(limit=self.max_connections, ttl_dns_cache=300),
+            )
+        params = {**params, "appid": self.api_key, "units": "metric", "lang": "ru"}
+        async with self._session.get(f"{self.base_url}/weather", params=params) as response:
+            response.raise_for_status()
+            payload = await response.json()
+        return self._parse(payload)
+
+    @staticmethod
+    def _parse(payload: dict) -> WeatherSnapshot:
+        temperature = round(payload["main"]["temp"])
+        condition = (payload.get("weather") or [{}])[0]
+        description = condition.get("description", "без осадков")
+        place = payload.get("name")
+        summary = f"Сейчас {temperature}°C, {description}" + (f" ({place})." if place else ".")
+        warning = None
+        if condition.get("id") in PRECIPITATION_CODES:
+            warning = "Возможны осадки"
+        elif payload.get("wind", {}).get("speed", 0) >= WIND_WARNING_MS:
+            warning = "Сильный ветер"
+        return WeatherSnapshot(summary=summary, temperature_c=temperature, warning=warning)
+
+
+class FakeWeatherProvider:
+    # Локальная заглушка без сети: для dev-окружения и тестов
+    def __init__(self) -> None:
+        self.calls = 0
+
+    async def by_coords(self, lat: float, lon: float) -> WeatherSnapshot:
+        self.calls += 1
+        pseudo_temp = int((abs(lat) + abs(lon)) % 30)
+        warning = "Сильный ветер" if pseudo_temp < FAKE_WINDY_BELOW_C else None
+        return WeatherSnapshot(summary=f"Сейчас примерно {pseudo_temp}°C.", temperature_c=pseudo_temp, warning=warning)
+
+    async def by_city(self, city: str) -> WeatherSnapshot:
+        self.calls += 1
+        return fallback_snapshot(city)
+
+    async def close(self) -> None:
+        return None
+
+
+class WeatherService:
+    # Двухуровневый кэш (процесс + Redis) по ячейке geohash или названию города;
+    # одновременные промахи по одному ключу превращаются в один запрос к провайдеру
+    def __init__(self, provider: WeatherProvider, redis: Redis | None = None, ttl: int = 600, maxsize: int = 5000):
+        self.provider = provider
+        self.redis = redis
+        self.ttl = ttl
+        self.local = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.upstream_calls = 0
+        self._inflight: dict[str, asyncio.Future] = {}
+
+    async def get(self, city: str | None, lat: float | None, lon: float | None) -> WeatherSnapshot:
+        if lat is not None and lon is not None:
+            cell = geohash(lat, lon)
+            key = f"cell:{cell}"
+            lat, lon = self._cell_center(cell)
+            fetch, location = (lambda: self.provider.by_coords(lat, lon)), "вашему городу"
+        elif city:
+            key = f"city:{normalize_city(city)}"
+            fetch, location = (lambda: self.provider.by_city(city.strip())), city.strip()
+        else:
+            return fallback_snapshot("вашему городу")
+        try:
+            return await self._cached(key, fetch)
+        except (aiohttp.ClientError, TimeoutError) as e:
+            logger.warning(f"Weather lookup for {key} failed: {e!r}, using fallback")
+        except Exception:
+            # Неожиданный ответ провайдера (нет полей в payload) тоже не должен ломать подборку
+            logger.exception(f"Weather lookup for {key} failed, using fallback")
+        snapshot = fallback_snapshot(location)
+        self.local.set(key, snapshot, ttl=FAILURE_TTL)
+        return snapshot
+
+    async def close(self) -> None:
+        await self.provider.close()
+
+    async def _cached(self, key: str, fetch) -> WeatherSnapshot:
+        snapshot = self.local.get(key)
+        if snapshot is not None:
+            return snapshot
+
+        while (inflight := self._inflight.get(key)) is not None:
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                # Отменили ведущий запрос, а не нас: пробуем загрузить сами
+                if not inflight.cancelled():
+                    raise
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            snapshot = await self._load(key, fetch)
+        except Exception as e:
+            future.set_exception(e)
+            # Исключение уже доставлено ожидающим, не даём asyncio ругаться на непрочитанный future
+            future.exception()
+            raise
+        else:
+            future.set_result(snapshot)
+            return snapshot
+        finally:
+            # При отмене ведущего запроса (CancelledError — не Exception) будим ожидающих
+            if not future.done():
+                future.cancel()
+            self._inflight.pop(key, None)
+
+    async def _load(self, key: str, fetch) -> WeatherSnapshot:
+        # Недоступный Redis — только промах общего кэша: идём к провайдеру
+        if self.redis is not None:
+            try:
+                raw = await self.redis.get(REDIS_KEY_PREFIX + key)
+            except RedisError as e:
+                logger.warning(f"Weather cache read for {key} failed: {e!r}")
+                raw = None
+            if raw is not None:
+                snapshot = WeatherSnapshot(**json.loads(raw))
+                self.local.set(key, snapshot)
+                return snapshot
+
+        self.upstream_calls += 1
+        snapshot = await fetch()
+        self.local.set(key, snapshot)
+        if self.redis is not None:
+            try:
+                await self.redis.set(REDIS_KEY_PREFIX + key, json.dumps(asdict(snapshot)), ex=self.ttl)
+            except RedisError as e:
+                logger.warning(f"Weather cache write for {key} failed: {e!r}")
+        return snapshot
+
+    @staticmethod
+    def _cell_center(cell: str) -> tuple[float, float]:
+        lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+        even = True
+        for char in cell:
+            bits = GEOHASH_ALPHABET.index(char)
+            for shift in range(4, -1, -1):
+                target = lon_range if even else lat_range
+                mid = (target[0] + target[1]) / 2
+                if bits >> shift & 1:
+                    target[0] = mid
+                else:
+                    target[1] = mid
+                even = not even
+        return round((lat_range[0] + lat_range[1]) / 2, 4), round((lon_range[0] + lon_range[1]) / 2, 4)
+
+
+def get_weather_service(settings, redis: Redis | None = None) -> WeatherService:
+    if settings.weather.API_KEY:
+        provider = OpenWeatherProvider(
+            api_key=settings.weather.API_KEY.get_secret_value(),
+            base_url=settings.weather.BASE_URL,
+        )
+    else:
+        logger.warning("WEATHER_API_KEY is not set, using fake weather provider")
+        provider = FakeWeatherProvider()
+    return WeatherService(provider, redis=redis, ttl=settings.weather.CACHE_TTL)
+
+
+async def close_weather_service(weather_service: WeatherService) -> None:
+    await weather_service.close()
@@ -1,54 +1,108 @@
+import logging
+from xml.sax.saxutils import escape
+
 from aiogram import F, Router
 from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
-from aiogram.types import CallbackQuery, Message, ReplyKeyboardRemove
+from aiogram.types import BufferedInputFile, CallbackQuery, InlineKeyboardMarkup, Message, ReplyKeyboardRemove
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from bot.ai_client import AIClient
 from bot.config import Settings
+from bot.controllers.recommendations import RecommendationEngine
+from bot.controllers.shops import ShopCatalog
 from bot.controllers.style_assistant import (
+    HistoryPage,
     admin_metrics,
     build_recommendations,
+    decode_history_cursor,
+    encode_history_cursor,
     find_nearby_shops,
     generate_weather,
-    save_photo,
-    save_preference,
-    save_recommendation,
+    get_user_location,
+    record_photo,
+    record_recommendation,
     upsert_location,
     user_recommendation_history,
 )
+from bot.controllers.weather import WeatherService
+from bot.handlers.pdf_generator import PDFRenderer
 from bot.internal.enums import StyleAssistantState
 from bot.internal.keyboards import (
     event_kb,
+    history_kb,
     location_request_kb,
+    manual_city_kb,
     photo_optional_kb,
+    recommendation_pdf_kb,
     shops_kb,
     start_selection_kb,
     style_kb,
-    manual_city_kb,
 )
+from bot.internal.rate_limiter import ACTION, PICTURE
+from bot.internal.redis_pool import RedisRegistry
+from bot.internal.sentry_sampling import SamplingPolicy
+from bot.internal.user_cache import UserCache
 from database.models import User
+from database.write_queue import WriteQueue
+
+logger = logging.getLogger(__name__)
 router = Router()
 
 HELP_TEXT = (
     "Команды:\n"
     "/start — начать подбор\n"
-    "/history — история последних подборок\n"
+    "/history — история подборок\n"
     "/admin_logs — метрики (для админа)\n"
-    "/admin_catalog — управление каталогом (заглушка)"
+    "/admin_catalog — перезагрузить каталоги магазинов и гардероба\n"
+    "/admin_profile [минуты|off] — полная трассировка и профилирование в Sentry на время"
 )
+PROFILE_DEFAULT_MINUTES = 5
+PDF_TITLE = "Подборка образов"
 
 
 def _is_admin(message: Message, settings: Settings) -> bool:
     return message.from_user.id in settings.bot.ADMINS
 
 
+def _top(counts: dict[str, int], limit: int = 5) -> str:
+    return ", ".join(f"{name}: {count}" for name, count in sorted(counts.items(), key=lambda item: -item[1])[:limit])
+
+
+def _breakdown_lines(metrics: dict) -> str:
+    lines = []
+    for day, counts in sorted(metrics["by_day"].items(), reverse=True):
+        lines.append(
+            f"{day[8:10]}.{day[5:7]}: +{counts.get('users', 0)} польз., "
+            f"+{counts.get('recommendations', 0)} подборок, +{counts.get('photos', 0)} фото"
+        )
+    if metrics["by_source"]:
+        lines.append(f"Источники: {_top(metrics['by_source'])}")
+    if metrics["by_style"]:
+        lines.append(f"Стили: {_top(metrics['by_style'])}")
+    return "".join(f"\n{line}" for line in lines)
+
+
+def _history_text(page: HistoryPage) -> str:
+    lines = ["Ваши подборки:"]
+    lines.extend(f"• {item.created_at:%d.%m %H:%M} — {item.weather_summary}" for item in page.items)
+    return "\n".join(lines)
+
+
+def _history_markup(page: HistoryPage) -> InlineKeyboardMarkup | None:
+    return history_kb(
+        encode_history_cursor(page.first) if page.has_newer else None,
+        encode_history_cursor(page.last) if page.has_older else None,
+    )
+
+
 async def _prompt_for_event(message: Message, state: FSMContext) -> None:
     await state.set_state(StyleAssistantState.ASK_EVENT)
     await message.answer("Куда собираешься?", reply_markup=event_kb())
 
 
 
-@router.message(Command("start", "help", "history", "admin_logs", "admin_catalog"))
+@router.message(Command("start", "help", "history", "admin_logs"))
 async def command_handler(
     message: Message,
     command: CommandObject,
@@ -56,6 +110,9 @@ async def command_handler(
     settings: Settings,
     state: FSMContext,
     db_session: AsyncSession,
+    user_cache: UserCache | None = None,
+    openai_client: AIClient | None = None,
+    redis_registry: RedisRegistry | None = None,
 ) -> None:
     match command.command:
         case "start":
@@ -68,31 +125,108 @@ async def command_handler(
         case "help":
             await message.answer(HELP_TEXT)
         case "history":
-            history = await user_recommendation_history(db_session, user)
-            if not history:
+            page = await user_recommendation_history(db_session, user)
+            if not page.items:
                 await message.answer("История подборок пока пуста. Нажми /start")
                 return
-            lines = ["Ваши последние подборки:"]
-            for item in history:
-                lines.append(f"• {item.created_at:%d.%m %H:%M} — {item.weather_summary}")
-            await message.answer("\n".join(lines))
+            await message.answer(_history_text(page), reply_markup=_history_markup(page))
         case "admin_logs":
             if not _is_admin(message, settings):
                 await message.answer("❌ Нет доступа")
                 return
             metrics = await admin_metrics(db_session)
+            cache_line = f"\nКэш пользователей: {user_cache.hit_rate:.1%} попаданий" if user_cache else ""
+            scheduler_line = ""
+            if openai_client:
+                scheduler = openai_client.scheduler
+                stats = scheduler.stats
+                scheduler_line = (
+                    f"\nOpenAI: очередь {scheduler.queue_depth}, активных run {scheduler.active_runs}, "
+                    f"выдано {stats.granted}, повторов {stats.retries}, 429: {stats.rate_limited}, "
+                    f"ожидание {stats.avg_wait:.2f}s (макс. {stats.max_wait:.2f}s)"
+                )
+            redis_line = ""
+            if redis_registry:
+                pools = []
+                for name in redis_registry.pools:
+                    usage = redis_registry.usage(name)
+                    status = f"{usage.ping * 1000:.0f}ms" if usage.healthy else "недоступен"
+                    pools.append(f"{name} {usage.in_use}/{usage.size} ({status})")
+                redis_line = f"\nRedis: {', '.join(pools)}"
             await message.answer(
                 "📊 Метрики:\n"
                 f"Пользователей: {metrics['users']}\n"
                 f"Подборок: {metrics['recommendations']}\n"
                 f"Фото: {metrics['photos']}"
-
+                f"{_breakdown_lines(metrics)}"
+                f"{cache_line}"
+                f"{scheduler_line}"
+                f"{redis_line}"
             )
-        case "admin_catalog":
-            if message.from_user.id not in settings.bot.ADMINS:
-                await message.answer("❌ Нет доступа")
-                return
-            await message.answer("Управление каталогом пока в режиме заглушки.")
+
+
+@router.message(Command("admin_catalog"))
+async def admin_catalog(
+    message: Message,
+    settings: Settings,
+    shop_catalog: ShopCatalog | None = None,
+    recommendation_engine: RecommendationEngine | None = None,
+) -> None:
+    if not _is_admin(message, settings):
+        await message.answer("❌ Нет доступа")
+        return
+    lines = []
+    for title, catalog in (("Магазины", shop_catalog), ("Гардероб", recommendation_engine)):
+        if catalog is None:
+            lines.append(f"{title}: не подключён")
+            continue
+        try:
+            lines.append(f"✅ {title}: {await catalog.reload()} позиций")
+        except Exception as e:
+            logger.exception(f"Catalog reload failed: {title}")
+            lines.append(f"❌ {title}: {e}")
+    await message.answer("Каталоги перезагружены:\n" + "\n".join(lines))
+
+
+@router.message(Command("admin_profile"))
+async def admin_profile(
+    message: Message,
+    command: CommandObject,
+    settings: Settings,
+    sampling_policy: SamplingPolicy | None = None,
+) -> None:
+    if not _is_admin(message, settings):
+        await message.answer("❌ Нет доступа")
+        return
+    if sampling_policy is None:
+        await message.answer("Sentry не подключён")
+        return
+    args = (command.args or "").strip()
+    if args == "off":
+        sampling_policy.profile_for(0)
+        await message.answer("Профилирование выключено, трассировка вернулась к выборке")
+        return
+    if args and not args.isdigit():
+        await message.answer("Использование: /admin_profile [минуты|off]")
+        return
+    seconds = sampling_policy.profile_for(int(args or PROFILE_DEFAULT_MINUTES) * 60)
+    # В режиме webhook окно включается только в воркере, принявшем команду
+    await message.answer(
+        f"🔬 Полная трассировка и профилирование на {seconds / 60:.0f} мин.\n"
+        f"Сохранено транзакций: {sampling_policy.kept}, отброшено хвостом: {sampling_policy.trimmed}"
+    )
+
+
+@router.callback_query(F.data.startswith("history:"))
+async def history_page(callback: CallbackQuery, user: User, db_session: AsyncSession) -> None:
+    _, direction, raw_cursor = callback.data.split(":", maxsplit=2)
+    page = await user_recommendation_history(
+        db_session, user, cursor=decode_history_cursor(raw_cursor), newer=direction == "newer"
+    )
+    await callback.answer()
+    if not page.items:
+        return
+    await callback.message.edit_text(_history_text(page), reply_markup=_history_markup(page))
 
 
 @router.callback_query(F.data == "style:start")
@@ -169,22 +303,47 @@ async def style_chosen(callback: CallbackQuery, state: FSMContext) -> None:
     await callback.message.answer("Пришли фото (опционально) или пропусти.", reply_markup=photo_optional_kb())
     await callback.answer()
 
-@router.callback_query(StyleAssistantState.ASK_PHOTO_OPTIONAL, F.data == "style:skip_photo")
-async def skip_photo(callback: CallbackQuery, state: FSMContext, user: User, db_session: AsyncSession) -> None:
+@router.callback_query(
+    StyleAssistantState.ASK_PHOTO_OPTIONAL, F.data == "style:skip_photo", flags={"rate_limit": ACTION}
+)
+async def skip_photo(  # noqa: PLR0913
+    callback: CallbackQuery,
+    state: FSMContext,
+    user: User,
+    db_session: AsyncSession,
+    weather_service: WeatherService | None = None,
+    recommendation_engine: RecommendationEngine | None = None,
+    write_queue: WriteQueue | None = None,
+) -> None:
     await callback.answer()
-    await _build_and_send_recommendations(callback.message, state, user, db_session)
+    await _build_and_send_recommendations(
+        callback.message, state, user, db_session, weather_service, recommendation_engine, write_queue
+    )
 
-@router.message(StyleAssistantState.ASK_PHOTO_OPTIONAL, F.photo)
-async def photo_received(message: Message, state: FSMContext, user: User, db_session: AsyncSession) -> None:
-    await save_photo(db_session, user, message.photo[-1].file_id)
+@router.message(StyleAssistantState.ASK_PHOTO_OPTIONAL, F.photo, flags={"rate_limit": (ACTION, PICTURE)})
+async def photo_received(  # noqa: PLR0913
+    message: Message,
+    state: FSMContext,
+    user: User,
+    db_session: AsyncSession,
+    weather_service: WeatherService | None = None,
+    recommendation_engine: RecommendationEngine | None = None,
+    write_queue: WriteQueue | None = None,
+) -> None:
     await message.answer("Фото сохранено. Анализ фото пока в режиме заглушки.")
-    await _build_and_send_recommendations(message, state, user, db_session)
+    await record_photo(write_queue, db_session, user, message.photo[-1].file_id)
+    await _build_and_send_recommendations(
+        message, state, user, db_session, weather_service, recommendation_engine, write_queue
+    )
 
-async def _build_and_send_recommendations(
+async def _build_and_send_recommendations(  # noqa: PLR0913
     message: Message,
     state: FSMContext,
     user: User,
     db_session: AsyncSession,
+    weather_service: WeatherService | None = None,
+    recommendation_engine: RecommendationEngine | None = None,
+    write_queue: WriteQueue | None = None,
 ) -> None:
     state_data = await state.get_data()
     event_type = state_data.get("event_type", "повседневно")
@@ -193,9 +352,8 @@ async def _build_and_send_recommendations(
     lat = state_data.get("lat")
     lon = state_data.get("lon")
 
-    weather = await generate_weather(city=city, lat=lat, lon=lon)
-    pref = await save_preference(db_session, user, event_type=event_type, style=style)
-    looks = build_recommendations(event_type, style, weather)
+    weather = await generate_weather(city=city, lat=lat, lon=lon, weather_service=weather_service)
+    looks = build_recommendations(event_type, style, weather, recommendation_engine)
 
     weather_warning = f"\n⚠️ {weather.warning}" if weather.warning else ""
     text = (
@@ -203,20 +361,46 @@ async def _build_and_send_recommendations(
             + "\n".join(looks)
             + f"\n\nПогода: {weather.summary}{weather_warning}"
     )
-    await save_recommendation(db_session, user, pref, weather.summary, text)
     await state.set_state(StyleAssistantState.ASK_SHOPS)
-    await message.answer(text)
+    await message.answer(text, reply_markup=recommendation_pdf_kb())
     await message.answer("Показать магазины рядом?", reply_markup=shops_kb())
+    # Аналитика пишется после ответа: пользователь не ждёт вставок в БД
+    await record_recommendation(
+        write_queue,
+        db_session,
+        user,
+        event_type=event_type,
+        style=style,
+        weather_summary=weather.summary,
+        message_text=text,
+    )
+
+
+@router.callback_query(F.data == "style:pdf")
+async def recommendation_pdf(callback: CallbackQuery, pdf_renderer: PDFRenderer | None = None) -> None:
+    await callback.answer()
+    if pdf_renderer is None or not callback.message.text:
+        return
+    # Текст подборки берём из самого сообщения: кнопка работает и после выхода из сценария.
+    # Рендер идёт в пуле процессов, event loop в это время обслуживает других пользователей
+    document = await pdf_renderer.render(escape(callback.message.text), PDF_TITLE)
+    await callback.message.answer_document(BufferedInputFile(document, filename="look.pdf"))
 
 
 @router.callback_query(StyleAssistantState.ASK_SHOPS, F.data == "style:shops:yes")
-async def shops_yes(callback: CallbackQuery, state: FSMContext, user: User, db_session: AsyncSession) -> None:
-    history = await user_recommendation_history(db_session, user, limit=1)
-    city = None
-    if history:
-        city = "рядом"
-    shops = find_nearby_shops(city)
-    await callback.message.answer("Магазины рядом:\n" + "\n".join(f"• {item}" for item in shops))
+async def shops_yes(
+    callback: CallbackQuery,
+    state: FSMContext,
+    user: User,
+    db_session: AsyncSession,
+    shop_catalog: ShopCatalog | None = None,
+) -> None:
+    city, lat, lon = await get_user_location(db_session, user)
+    shops = await find_nearby_shops(shop_catalog, city, lat, lon)
+    if shops:
+        await callback.message.answer("Магазины рядом:\n" + "\n".join(f"• {item}" for item in shops))
+    else:
+        await callback.message.answer("Пока не нашли магазинов рядом с вами.")
     await state.clear()
     await callback.answer()
 
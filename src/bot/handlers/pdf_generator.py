@@ -1,12 +1,18 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import cache, partial
+from io import BytesIO
 from pathlib import Path
 
+from reportlab import rl_config
 from reportlab.lib.pagesizes import A4
-from reportlab.lib.units import mm
 from reportlab.lib.styles import ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+from reportlab.lib.units import mm
+from reportlab.lib.utils import ImageReader
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
-
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer
 
 # ─── PATHS (НЕ ТРОГАЕМ) ────────────────────────────────────
 
@@ -19,33 +25,17 @@ FONT_PATH = FONTS_DIR / "DejaVuSans.ttf"
 BG_IMAGE_PATH = BACKGROUNDS_DIR / "plant_plan_bg.png"
 
 
-# ─── PDF ──────────────────────────────────────────────────
-
-def generate_plan_pdf(
-    response_text: str,
-    output_path: str | Path,
-    title: str,
-):
-    output_path = Path(output_path)
-    output_path.parent.mkdir(parents=True, exist_ok=True)
+# ─── RESOURCES ────────────────────────────────────────────
+# Шрифт, стили и декодированный фон загружаются один раз на процесс
 
+@cache
+def _load_styles() -> dict[str, ParagraphStyle]:
     if not FONT_PATH.exists():
         raise FileNotFoundError(f"Font not found: {FONT_PATH}")
 
     pdfmetrics.registerFont(TTFont("DejaVu", str(FONT_PATH)))
 
-    doc = SimpleDocTemplate(
-        str(output_path),
-        pagesize=A4,
-        leftMargin=25 * mm,
-        rightMargin=25 * mm,
-        topMargin=42 * mm,
-        bottomMargin=65 * mm,
-    )
-
-    # ─── STYLES ────────────────────────────────────────────
-
-    styles = {
+    return {
         "title": ParagraphStyle(
             name="Title",
             fontName="DejaVu",
@@ -81,6 +71,42 @@ def generate_plan_pdf(
         ),
     }
 
+
+@cache
+def _load_background() -> ImageReader | None:
+    if not BG_IMAGE_PATH.exists():
+        return None
+    return ImageReader(str(BG_IMAGE_PATH))
+
+
+def warm_up() -> None:
+    _load_styles()
+    _load_background()
+
+
+def _init_worker() -> None:
+    # ASCII85 без C-ускорителя кодирует фон на чистом Python — в процессах рендера пишем бинарные потоки.
+    # Настройка глобальная для ReportLab, поэтому меняем её только в воркерах пула
+    rl_config.useA85 = 0
+    warm_up()
+
+
+# ─── PDF ──────────────────────────────────────────────────
+
+def render_plan_pdf(response_text: str, title: str) -> bytes:
+    styles = _load_styles()
+    background = _load_background()
+    buffer = BytesIO()
+
+    doc = SimpleDocTemplate(
+        buffer,
+        pagesize=A4,
+        leftMargin=25 * mm,
+        rightMargin=25 * mm,
+        topMargin=42 * mm,
+        bottomMargin=65 * mm,
+    )
+
     flowables: list = []
 
     # ─── TITLE ─────────────────────────────────────────────
@@ -123,9 +149,9 @@ def generate_plan_pdf(
     # ─── BACKGROUND ────────────────────────────────────────
 
     def draw_background(canvas, doc):
-        if BG_IMAGE_PATH.exists():
+        if background is not None:
             canvas.drawImage(
-                str(BG_IMAGE_PATH),
+                background,
                 0,
                 0,
                 width=A4[0],
@@ -139,3 +165,39 @@ def generate_plan_pdf(
         onFirstPage=draw_background,
         onLaterPages=draw_background,
     )
+    return buffer.getvalue()
+
+
+def generate_plan_pdf(
+    response_text: str,
+    output_path: str | Path,
+    title: str,
+):
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.write_bytes(render_plan_pdf(response_text, title))
+
+
+# ─── ASYNC RENDERER ───────────────────────────────────────
+
+class PDFRenderer:
+    # Рендер в отдельных процессах, чтобы ReportLab не блокировал event loop.
+    # Воркеры стартуют через forkserver: fork многопоточного процесса (поток логов, write queue)
+    # может унаследовать захваченную кем-то блокировку и зависнуть
+    def __init__(self, max_workers: int = 2):
+        self._executor = ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context("forkserver"),
+            initializer=_init_worker,
+        )
+
+    async def render(self, response_text: str, title: str) -> bytes:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(render_plan_pdf, response_text, title))
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+async def close_pdf_renderer(pdf_renderer: PDFRenderer) -> None:
+    await asyncio.to_thread(pdf_renderer.close)
@@ -3,3 +3,12 @@ from datetime import timedelta
 ONE_HOUR = 3600
 MAX_MESSAGE_LENGTH = 3900
 BLOCK_DURATION = timedelta(seconds=3)
+FFMPEG_MAX_PROCESSES = 4
+FFMPEG_MAX_QUEUE = 32
+PDF_RENDER_WORKERS = 2
+# Поля апдейтов, которые архив заменяет заглушками (персональные данные и геопозиция).
+# Тексты сообщений (text, caption) остаются как есть: по ним повторный прогон попадает в те же хендлеры.
+# Если архив уходит из прод-окружения, добавьте их в ARCHIVE_REDACT_FIELDS
+ARCHIVE_REDACT_FIELDS = frozenset(
+    {"first_name", "last_name", "username", "phone_number", "email", "latitude", "longitude", "vcard", "bio"}
+)
@@ -0,0 +1,175 @@
+import json
+import logging
+from collections.abc import AsyncIterator, Mapping
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any
+
+import msgpack
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from redis.asyncio import Redis
+
+from bot.internal.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+STATE_FIELD = b"state"
+DATA_FIELD = b"data"
+
+
+def encode_data(data: Mapping[str, Any]) -> bytes:
+    return msgpack.packb(data, use_bin_type=True)
+
+
+def decode_data(raw: bytes) -> dict[str, Any]:
+    # Ключи, записанные до перехода на msgpack, хранят JSON-объект: он начинается с "{",
+    # а словарь msgpack — с байта 0x80–0x8f, 0xde или 0xdf
+    if raw[:1] == b"{":
+        return json.loads(raw)
+    return msgpack.unpackb(raw, raw=False, strict_map_key=False)
+
+
+@dataclass(slots=True)
+class _Record:
+    state: str | None = None
+    data: dict[str, Any] = field(default_factory=dict)
+    dirty: bool = False
+
+
+# Записи, прочитанные и изменённые в рамках текущего апдейта (см. BatchedRedisStorage.batch)
+_batch: ContextVar[dict[str, _Record] | None] = ContextVar("fsm_batch", default=None)
+
+
+class BatchedRedisStorage(BaseStorage):
+    # Состояние и данные ключа лежат в одном hash: весь ключ читается одним HGETALL.
+    # Внутри batch() запись читается один раз, изменения данных копятся локально и пишутся одним пайплайном
+    # в конце апдейта, продлевая TTL. Смена состояния пишется сразу (вместе с накопленными данными): следующий
+    # апдейт пользователя, пришедший во время долгого хендлера, должен видеть новое состояние, как в RedisStorage.
+    # Вне batch() каждая операция сразу идёт в Redis.
+    # Локальный кэш (local_ttl > 0) хранит последнюю записанную версию между апдейтами — только для одного процесса
+    def __init__(
+        self,
+        redis: Redis,
+        key_builder: KeyBuilder | None = None,
+        ttl: int | None = None,
+        local_ttl: float = 0,
+        local_maxsize: int = 10_000,
+    ):
+        self.redis = redis
+        self.key_builder = key_builder or DefaultKeyBuilder()
+        self.ttl = ttl
+        self.local = TTLCache(maxsize=local_maxsize, ttl=local_ttl) if local_ttl > 0 else None
+        self.round_trips = 0
+
+    @asynccontextmanager
+    async def batch(self) -> AsyncIterator[None]:
+        if _batch.get() is not None:
+            yield
+            return
+        records: dict[str, _Record] = {}
+        token = _batch.set(records)
+        try:
+            yield
+        finally:
+            # Пишем и после ошибки в хендлере: обычное хранилище к этому моменту уже сохранило бы изменения
+            _batch.reset(token)
+            await self._save({redis_key: record for redis_key, record in records.items() if record.dirty})
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        redis_key = self.key_builder.build(key)
+        record = await self._record(redis_key)
+        record.state = state.state if isinstance(state, State) else state
+        await self._changed(redis_key, record, flush=True)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        return (await self._record(self.key_builder.build(key))).state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise DataNotDictLikeError(f"Data must be a dict or dict-like object, got {type(data).__name__}")
+        redis_key = self.key_builder.build(key)
+        record = await self._record(redis_key)
+        record.data = data.copy()
+        await self._changed(redis_key, record)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        return (await self._record(self.key_builder.build(key))).data.copy()
+
+    async def update_data(self, key: StorageKey, data: Mapping[str, Any]) -> dict[str, Any]:
+        redis_key = self.key_builder.build(key)
+        record = await self._record(redis_key)
+        record.data.update(data)
+        await self._changed(redis_key, record)
+        return record.data.copy()
+
+    async def close(self) -> None:
+        await self.redis.aclose()
+
+    async def _record(self, redis_key: str) -> _Record:
+        records = _batch.get()
+        if records is not None and redis_key in records:
+            return records[redis_key]
+        record = await self._load(redis_key)
+        if records is not None:
+            records[redis_key] = record
+        return record
+
+    async def _changed(self, redis_key: str, record: _Record, *, flush: bool = False) -> None:
+        if _batch.get() is not None and not flush:
+            record.dirty = True
+        else:
+            await self._save({redis_key: record})
+            record.dirty = False
+
+    async def _load(self, redis_key: str) -> _Record:
+        # В локальном кэше — закодированные данные: каждый апдейт получает свою копию словаря
+        cached = self.local.get(redis_key) if self.local is not None else None
+        if cached is not None:
+            state, raw = cached
+            return _Record(state, decode_data(raw) if raw else {})
+        self.round_trips += 1
+        fields = await self.redis.hgetall(redis_key)
+        state, raw = fields.get(STATE_FIELD), fields.get(DATA_FIELD)
+        record = _Record(state.decode("utf-8") if state else None, decode_data(raw) if raw else {})
+        if self.local is not None:
+            self.local.set(redis_key, (record.state, raw))
+        return record
+
+    async def _save(self, records: dict[str, _Record]) -> None:
+        if not records:
+            return
+        pipe = self.redis.pipeline(transaction=False)
+        encoded = {}
+        for redis_key, record in records.items():
+            raw = encode_data(record.data) if record.data else None
+            encoded[redis_key] = (record.state, raw)
+            if record.state is None and raw is None:
+                pipe.delete(redis_key)
+                continue
+            mapping = {}
+            for name, value in ((STATE_FIELD, record.state), (DATA_FIELD, raw)):
+                if value is None:
+                    pipe.hdel(redis_key, name)
+                else:
+                    mapping[name] = value
+            pipe.hset(redis_key, mapping=mapping)
+            if self.ttl:
+                pipe.expire(redis_key, self.ttl)
+        self.round_trips += 1
+        await pipe.execute()
+        if self.local is not None:
+            for redis_key, value in encoded.items():
+                self.local.set(redis_key, value)
+
+
+def get_fsm_storage(settings, redis: Redis) -> BatchedRedisStorage:
+    # С несколькими воркерами апдейты пользователя попадают в разные процессы,
+    # и локальный кэш одного из них отдавал бы устаревшее состояние
+    return BatchedRedisStorage(
+        redis,
+        ttl=settings.redis.FSM_TTL,
+        local_ttl=settings.cache.FSM_LOCAL_TTL if settings.webhook.WORKERS == 1 else 0,
+    )
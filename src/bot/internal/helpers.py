@@ -1,23 +1,86 @@
+import atexit
+import json
 import logging.config
 import sys
-from datetime import datetime
-from logging.handlers import RotatingFileHandler
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
+from queue import Full, Queue
 
 from pydantic_settings import SettingsConfigDict
 
+LOG_QUEUE_SIZE = 10_000
+
+# Запущенный слушатель очереди логов (не больше одного)
+_listeners: list[QueueListener] = []
+
 
 class CustomFormatter(logging.Formatter):
+    # Локальное время считается один раз в секунду, а не для каждой записи
+    _cached: tuple[int, str, str] = (-1, "", "")
+
     def formatTime(self, record, datefmt=None):
-        ct = datetime.fromtimestamp(record.created).astimezone()
         if datefmt:
-            base_time = ct.strftime("%d.%m.%Y %H:%M:%S")
+            second = int(record.created)
+            cached_second, base_time, tz = self._cached
+            if second != cached_second:
+                ct = time.localtime(second)
+                base_time, tz = time.strftime("%d.%m.%Y %H:%M:%S", ct), time.strftime("%z", ct)
+                self._cached = (second, base_time, tz)
             msecs = f"{int(record.msecs):03d}М"
-            tz = ct.strftime("%z")
             return f"{base_time}.{msecs}{tz}"
         return super().formatTime(record, datefmt)
 
 
+class JsonFormatter(CustomFormatter):
+    def format(self, record):
+        payload = {
+            "time": self.formatTime(record, self.datefmt),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "location": f"{record.module}:{record.funcName}:{record.lineno}",
+        }
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            payload["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class DroppingQueueHandler(QueueHandler):
+    # Запись в лог не должна блокировать event loop: при переполненной очереди запись отбрасывается
+    # и учитывается, а о потерях сообщается первой записью, которая снова поместилась
+    def __init__(self, queue: Queue):
+        super().__init__(queue)
+        self.dropped = 0
+        self._reported = 0
+
+    def prepare(self, record):
+        # Форматирование и трассировку исключения оставляем потоку-слушателю, здесь только
+        # подставляем аргументы, пока объекты не изменились
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            if self.dropped != self._reported:
+                dropped = self.dropped
+                self.queue.put_nowait(self._overflow_record(dropped - self._reported))
+                self._reported = dropped
+            self.queue.put_nowait(record)
+        except Full:
+            self.dropped += 1
+
+    @staticmethod
+    def _overflow_record(lost: int) -> logging.LogRecord:
+        return logging.LogRecord(
+            __name__, logging.WARNING, __file__, 0, f"Log queue overflow, dropped {lost} records", None, None
+        )
+
+
 main_template = {
     "format": "%(asctime)s | %(message)s",
     "datefmt": "%d.%m.%Y %H:%M:%S%z",
@@ -28,23 +91,56 @@ error_template = {
 }
 
 
-def setup_logs(app_name: str):
+def setup_logs(
+    app_name: str,
+    log_format: str = "text",
+    level: str = "INFO",
+    levels: dict[str, str] | None = None,
+    queue_size: int = LOG_QUEUE_SIZE,
+) -> DroppingQueueHandler:
+    stop_logs()
     Path("logs").mkdir(parents=True, exist_ok=True)
-    logging_config = get_logging_config(app_name)
+    logging_config = get_logging_config(app_name, log_format, level, levels)
     logging.config.dictConfig(logging_config)
+    # Обработчики из конфига переезжают за очередь: форматирование и запись в файл/консоль
+    # выполняет фоновый поток, в корневом логгере остаётся только быстрый put в очередь
+    root = logging.getLogger()
+    handlers = list(root.handlers)
+    queue_handler = DroppingQueueHandler(Queue(queue_size))
+    root.handlers = [queue_handler]
+    listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    listener.start()
+    _listeners.append(listener)
+    return queue_handler
+
+
+def stop_logs() -> None:
+    while _listeners:
+        _listeners.pop().stop()
+
 
+atexit.register(stop_logs)
 
-def get_logging_config(app_name: str):
+
+def get_logging_config(
+    app_name: str,
+    log_format: str = "text",
+    level: str = "INFO",
+    levels: dict[str, str] | None = None,
+):
+    formatter = {"()": JsonFormatter, "datefmt": main_template["datefmt"]} if log_format == "json" else None
     return {
         "version": 1,
         "disable_existing_loggers": False,
         "formatters": {
-            "main": {
+            "main": formatter
+            or {
                 "()": CustomFormatter,
                 "format": main_template["format"],
                 "datefmt": main_template["datefmt"],
             },
-            "errors": {
+            "errors": formatter
+            or {
                 "()": CustomFormatter,
                 "format": error_template["format"],
                 "datefmt": error_template["datefmt"],
@@ -53,7 +149,7 @@ def get_logging_config(app_name: str):
         "handlers": {
             "stdout": {
                 "class": "logging.StreamHandler",
-                "level": "INFO",
+                "level": "DEBUG",
                 "formatter": "main",
                 "stream": sys.stdout,
             },
@@ -65,7 +161,7 @@ def get_logging_config(app_name: str):
             },
             "file": {
                 "()": RotatingFileHandler,
-                "level": "INFO",
+                "level": "DEBUG",
                 "formatter": "main",
                 "filename": f"logs/{app_name}.log",
                 "maxBytes": 50000000,
@@ -73,11 +169,13 @@ def get_logging_config(app_name: str):
                 "encoding": "utf-8",
             },
         },
+        # Уровень задаётся логгерам, а не обработчикам: отфильтрованная запись не создаётся и не попадает в очередь
         "loggers": {
             "root": {
-                "level": "DEBUG",
+                "level": level,
                 "handlers": ["stdout", "stderr", "file"],
             },
+            **{name: {"level": logger_level} for name, logger_level in (levels or {}).items()},
         },
     }
 
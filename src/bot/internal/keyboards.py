@@ -12,6 +12,9 @@ def event_kb() -> InlineKeyboardMarkup:
     kb = InlineKeyboardBuilder()
     kb.button(text="Повседневно", callback_data="style:event:повседневно")
     kb.button(text="Мероприятие", callback_data="style:event:мероприятие")
+    kb.button(text="Работа", callback_data="style:event:работа")
+    kb.button(text="Свидание", callback_data="style:event:свидание")
+    kb.button(text="Спорт", callback_data="style:event:спорт")
     kb.adjust(1)
     return kb.as_markup()
 
@@ -21,6 +24,7 @@ def style_kb() -> InlineKeyboardMarkup:
     kb.button(text="Casual", callback_data="style:style:casual")
     kb.button(text="Classic", callback_data="style:style:classic")
     kb.button(text="Sport", callback_data="style:style:sport")
+    kb.button(text="Street", callback_data="style:style:street")
     kb.adjust(1)
     return kb.as_markup()
 
@@ -31,6 +35,12 @@ def photo_optional_kb() -> InlineKeyboardMarkup:
     return kb.as_markup()
 
 
+def recommendation_pdf_kb() -> InlineKeyboardMarkup:
+    kb = InlineKeyboardBuilder()
+    kb.button(text="Сохранить в PDF", callback_data="style:pdf")
+    return kb.as_markup()
+
+
 def shops_kb() -> InlineKeyboardMarkup:
     kb = InlineKeyboardBuilder()
     kb.button(text="Да, показать магазины", callback_data="style:shops:yes")
@@ -38,6 +48,15 @@ def shops_kb() -> InlineKeyboardMarkup:
     kb.adjust(1)
     return kb.as_markup()
 
+def history_kb(newer_cursor: str | None, older_cursor: str | None) -> InlineKeyboardMarkup | None:
+    kb = InlineKeyboardBuilder()
+    if newer_cursor:
+        kb.button(text="← Новее", callback_data=f"history:newer:{newer_cursor}")
+    if older_cursor:
+        kb.button(text="Старее →", callback_data=f"history:older:{older_cursor}")
+    kb.adjust(2)
+    return kb.as_markup() if newer_cursor or older_cursor else None
+
 def manual_city_kb() -> InlineKeyboardMarkup:
     kb = InlineKeyboardBuilder()
     kb.button(text="Ввести город вручную", callback_data="style:manual_city")
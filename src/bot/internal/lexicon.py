@@ -23,4 +23,8 @@ WELCOME_BY_SOURCE = {
 replies = {
     2: "{fullname}, подожди немного, я еще формирую предыдущий ответ 🙏",
     "users_limit_exceeded": "Сейчас бот работает в учебном лимитированном режиме. Доступ временно ограничен.",
+    "action_limit_exceeded": "Лимит подборок исчерпан. Следующая будет доступна через {retry}.",
+    "picture_limit_exceeded": (
+        "Лимит фото исчерпан, следующее можно прислать через {retry}. Пока можно продолжить без фото."
+    ),
 }
@@ -0,0 +1,246 @@
+import logging
+import secrets
+from bisect import bisect_left
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from time import perf_counter
+from typing import Any
+
+from aiohttp import web
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(names: Labels, values: Labels, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values, strict=True)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: Labels = ()):
+        self.name, self.help_text, self.labels = name, help_text, labels
+        self.series: dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self.series[labels] = self.series.get(labels, 0) + amount
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in self.series.items():
+            yield f"{self.name}{_label_text(self.labels, labels)} {value}"
+
+
+class Gauge:
+    # Значение либо выставляется вручную, либо читается функцией в момент запроса /metrics.
+    # С метками функция возвращает словарь {значения меток: значение}
+    def __init__(self, name: str, help_text: str, read: Callable[[], Any] | None = None, labels: Labels = ()):
+        self.name, self.help_text, self.read, self.labels = name, help_text, read, labels
+        self.value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} gauge"
+        if self.labels:
+            for labels, value in self.read().items():
+                yield f"{self.name}{_label_text(self.labels, labels)} {value}"
+        else:
+            yield f"{self.name} {self.read() if self.read else self.value}"
+
+
+class Histogram:
+    # На наблюдение — bisect и инкремент одной ячейки; накопительные суммы по бакетам считаются только при выдаче
+    def __init__(self, name: str, help_text: str, labels: Labels = (), buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.name, self.help_text, self.labels, self.buckets = name, help_text, labels, buckets
+        self.series: dict[Labels, list[float]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        series = self.series.get(labels)
+        if series is None:
+            # Ячейки бакетов, затем +Inf, сумма и количество
+            series = self.series[labels] = [0] * (len(self.buckets) + 3)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, series in self.series.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), series[:-2], strict=True):
+                cumulative += count
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{_label_text(self.labels, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_label_text(self.labels, labels)} {series[-2]}"
+            yield f"{self.name}_count{_label_text(self.labels, labels)} {series[-1]}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: list[Counter | Gauge | Histogram] = []
+
+    def counter(self, name: str, help_text: str, labels: Labels = ()) -> Counter:
+        return self._add(Counter(name, help_text, labels))
+
+    def gauge(self, name: str, help_text: str, read: Callable[[], Any] | None = None, labels: Labels = ()) -> Gauge:
+        return self._add(Gauge(name, help_text, read, labels))
+
+    def histogram(self, name: str, help_text: str, labels: Labels = ()) -> Histogram:
+        return self._add(Histogram(name, help_text, labels))
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
+
+
+class BotMetrics:
+    def __init__(self, registry: MetricsRegistry | None = None):
+        self.registry = registry or MetricsRegistry()
+        registry = self.registry
+        self.update_duration = registry.histogram(
+            "bot_update_duration_seconds", "Full update processing time", ("update_type",)
+        )
+        self.handler_duration = registry.histogram(
+            "bot_handler_duration_seconds", "Handler time including inner middlewares", ("handler",)
+        )
+        self.update_db = registry.histogram(
+            "bot_update_db_seconds", "Time spent in database queries per update", ("update_type",)
+        )
+        self.update_openai = registry.histogram(
+            "bot_update_openai_seconds", "Time spent in OpenAI calls per update", ("update_type",)
+        )
+        self.in_flight = registry.gauge("bot_updates_in_flight", "Updates being processed right now")
+        self.update_errors = registry.counter(
+            "bot_update_errors_total", "Exceptions that escaped update processing", ("update_type", "error")
+        )
+        self.handler_errors = registry.counter(
+            "bot_handler_errors_total", "Exceptions raised by handlers", ("handler", "error")
+        )
+        self.analysis_cache = registry.counter(
+            "bot_plant_analysis_cache_total", "Plant photo lookups in stored analyses", ("result",)
+        )
+
+    def add_gauge(self, name: str, help_text: str, read: Callable[[], Any], labels: Labels = ()) -> None:
+        self.registry.gauge(name, help_text, read, labels)
+
+    def render(self) -> str:
+        return self.registry.render()
+
+
+@dataclass(slots=True)
+class UpdateTimings:
+    db: float = 0.0
+    openai: float = 0.0
+    openai_depth: int = 0
+
+
+# Время в БД и OpenAI копится в объекте текущего апдейта; контекст доходит и до синхронных
+# событий SQLAlchemy, которые выполняются в greenlet с контекстом вызывающей задачи
+_timings: ContextVar[UpdateTimings | None] = ContextVar("update_timings", default=None)
+
+
+@contextmanager
+def track_update() -> Iterator[UpdateTimings]:
+    timings = UpdateTimings()
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+
+@contextmanager
+def track_openai() -> Iterator[None]:
+    # Учитывается только внешний интервал: вызовы внутри слота run не считаются повторно
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+    timings.openai_depth += 1
+    started = perf_counter()
+    try:
+        yield
+    finally:
+        timings.openai_depth -= 1
+        if not timings.openai_depth:
+            timings.openai += perf_counter() - started
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def _before(conn, *_) -> None:
+        conn.info["query_started_at"] = perf_counter()
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def _after(conn, *_) -> None:
+        timings = _timings.get()
+        started = conn.info.pop("query_started_at", None)
+        if timings is not None and started is not None:
+            timings.db += perf_counter() - started
+
+
+def is_authorized(token: str | None, authorization: str | None) -> bool:
+    if token is None:
+        return True
+    return authorization is not None and secrets.compare_digest(authorization, f"Bearer {token}")
+
+
+class MetricsServer:
+    # Отдельный /metrics для режима polling; в режиме webhook эндпоинт живёт в приложении FastAPI
+    def __init__(self, metrics: BotMetrics, host: str, port: int, token: str | None = None):
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self.token = token
+        self._runner: web.AppRunner | None = None
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"Metrics endpoint listening on {self.host}:{self.port}/metrics")
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        if not is_authorized(self.token, request.headers.get("Authorization")):
+            return web.Response(status=401)
+        return web.Response(body=self.metrics.render().encode("utf-8"), headers={"Content-Type": CONTENT_TYPE})
+
+
+def get_metrics(settings) -> BotMetrics | None:
+    return BotMetrics() if settings.metrics.ENABLED else None
+
+
+def get_metrics_server(settings, metrics: BotMetrics) -> MetricsServer:
+    token = settings.metrics.TOKEN.get_secret_value() if settings.metrics.TOKEN else None
+    return MetricsServer(metrics, settings.metrics.HOST, settings.metrics.PORT, token)
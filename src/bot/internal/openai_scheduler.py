@@ -0,0 +1,232 @@
+import asyncio
+import logging
+import random
+from collections import OrderedDict, deque
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from time import monotonic
+from typing import Any
+
+from openai import APIConnectionError, APIStatusError, APITimeoutError, InternalServerError, RateLimitError
+
+from bot.internal.metrics import track_openai
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+SLOW_WAIT_SECONDS = 1.0
+# Очередь для фоновых вызовов, не связанных с конкретным пользователем
+SYSTEM_QUEUE = "system"
+
+
+class TokenBucket:
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60
+        self.tokens = self.capacity
+        self.updated_at = monotonic()
+
+    def delay(self, amount: float) -> float:
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float) -> None:
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def _refill(self) -> None:
+        now = monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+
+@dataclass(slots=True)
+class _Waiter:
+    tokens: int
+    run: bool
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=monotonic)
+
+
+@dataclass(slots=True)
+class SchedulerStats:
+    granted: int = 0
+    retries: int = 0
+    rate_limited: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+
+    @property
+    def avg_wait(self) -> float:
+        return self.total_wait / self.granted if self.granted else 0.0
+
+
+def estimate_tokens(content: Any, completion_budget: int = 800) -> int:
+    if isinstance(content, str):
+        return len(content) // 3 + completion_budget
+    if isinstance(content, list):
+        return sum(estimate_tokens(block.get("text", ""), 0) + 85 for block in content) + completion_budget
+    return completion_budget
+
+
+class OpenAIScheduler:
+    # Общий планировщик запросов к OpenAI: лимиты RPM/TPM, ограничение одновременных run,
+    # справедливая очередь по пользователям (round-robin) и повторы с экспоненциальной задержкой
+    def __init__(  # noqa: PLR0913
+        self,
+        requests_per_minute: int = 500,
+        tokens_per_minute: int = 200_000,
+        max_concurrent_runs: int = 20,
+        max_retries: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 30.0,
+    ):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_concurrent_runs = max_concurrent_runs
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.active_runs = 0
+        self.stats = SchedulerStats()
+        self._queues: OrderedDict[Any, deque[_Waiter]] = OrderedDict()
+        self._paused_until = 0.0
+        self._timer: asyncio.TimerHandle | None = None
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    async def call(
+        self,
+        user_key: Any,
+        func: Callable[..., Awaitable[Any]],
+        *args: Any,
+        tokens: int = 0,
+        **kwargs: Any,
+    ) -> Any:
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self.slot(user_key, tokens):
+                    return await func(*args, **kwargs)
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self._backoff(attempt, e)
+                self.stats.retries += 1
+                logger.warning(f"OpenAI call {getattr(func, '__qualname__', func)} failed ({e!r}), retry in {delay:.1f}s")
+                await asyncio.sleep(delay)
+        return None
+
+    @asynccontextmanager
+    async def slot(self, user_key: Any, tokens: int = 0, *, run: bool = False) -> AsyncIterator[None]:
+        # Ожидание в очереди тоже считается временем OpenAI для метрик апдейта
+        with track_openai():
+            await self._acquire(user_key, tokens, run)
+            try:
+                yield
+            finally:
+                if run:
+                    self.active_runs -= 1
+                    self._dispatch()
+
+    async def _acquire(self, user_key: Any, tokens: int, run: bool) -> None:
+        waiter = _Waiter(tokens=tokens, run=run, future=asyncio.get_running_loop().create_future())
+        self._queues.setdefault(user_key, deque()).append(waiter)
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            queue = self._queues.get(user_key)
+            if queue is not None and waiter in queue:
+                queue.remove(waiter)
+                if not queue:
+                    del self._queues[user_key]
+            elif run and waiter.future.done() and not waiter.future.cancelled():
+                self.active_runs -= 1
+                self._dispatch()
+            raise
+
+        waited = monotonic() - waiter.enqueued_at
+        self.stats.granted += 1
+        self.stats.total_wait += waited
+        self.stats.max_wait = max(self.stats.max_wait, waited)
+        if waited > SLOW_WAIT_SECONDS:
+            logger.info(f"OpenAI request for {user_key} waited {waited:.2f}s in queue (depth={self.queue_depth})")
+
+    def _dispatch(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        while self._queues:
+            pause = self._paused_until - monotonic()
+            if pause > 0:
+                self._schedule(pause)
+                return
+
+            eligible = self._next_eligible()
+            if eligible is None:
+                # В очередях остались только run, ждущие освобождения слота, повторим при release
+                return
+            user_key, waiter = eligible
+            queue = self._queues[user_key]
+            delay = max(self.requests.delay(1), self.tokens.delay(waiter.tokens))
+            if delay > 0:
+                self._schedule(delay)
+                return
+
+            queue.remove(waiter)
+            if queue:
+                self._queues.move_to_end(user_key)
+            else:
+                del self._queues[user_key]
+            if waiter.future.done():
+                continue
+            self.requests.consume(1)
+            self.tokens.consume(waiter.tokens)
+            if waiter.run:
+                self.active_runs += 1
+            waiter.future.set_result(None)
+
+    def _next_eligible(self) -> tuple[Any, _Waiter] | None:
+        # Run, ждущий свободного слота, не задерживает обычные вызовы того же пользователя:
+        # иначе опрос уже идущего run (runs.retrieve) встал бы за ним в очередь
+        runs_available = self.active_runs < self.max_concurrent_runs
+        for user_key, queue in self._queues.items():
+            for waiter in queue:
+                if runs_available or not waiter.run:
+                    return user_key, waiter
+        return None
+
+    def _schedule(self, delay: float) -> None:
+        self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        delay = min(self.max_delay, self.base_delay * 2**attempt) * random.uniform(0.5, 1.0)  # noqa: S311 джиттер
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        if isinstance(error, RateLimitError):
+            # 429 касается всего ключа, поэтому притормаживаем всю очередь, а не только этот запрос
+            self.stats.rate_limited += 1
+            self._paused_until = max(self._paused_until, monotonic() + delay)
+        return delay
+
+
+def _retry_after(error: Exception) -> float | None:
+    if not isinstance(error, APIStatusError):
+        return None
+    headers = error.response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        return None
+    return None
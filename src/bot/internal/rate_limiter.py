@@ -0,0 +1,213 @@
+import asyncio
+import contextlib
+import logging
+from collections import Counter
+from dataclasses import dataclass
+from datetime import UTC, datetime
+from time import time
+
+from redis.asyncio import Redis
+from sqlalchemy import bindparam, update
+from sqlalchemy.dialects.postgresql import insert
+
+from bot.internal.user_cache import UserCache
+from database.database_connector import DatabaseConnector
+from database.models import User, UserCounters
+
+logger = logging.getLogger(__name__)
+
+ACTION = "action"
+PICTURE = "picture"
+KEY_PREFIX = "ratelimit:"
+
+# Скользящее окно по журналу событий: в ZSET ключа лежат отметки времени (мс) разрешённых действий.
+# Все действия апдейта проверяются и записываются атомарно: либо разрешены все, либо ни одно.
+# KEYS[i] — окно i-го действия; ARGV: now, member, затем пары (limit, window) для каждого ключа.
+# Ответ: {0, номер исчерпанного действия, мс до освобождения} или {1, count_1, oldest_1, count_2, oldest_2, ...}
+SLIDING_WINDOW_LUA = """
+local now = tonumber(ARGV[1])
+local member = ARGV[2]
+local counts = {}
+for i, key in ipairs(KEYS) do
+    local limit = tonumber(ARGV[1 + i * 2])
+    local window = tonumber(ARGV[2 + i * 2])
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+    local count = redis.call('ZCARD', key)
+    if count >= limit then
+        local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+        local retry = window
+        if oldest[2] then
+            retry = tonumber(oldest[2]) + window - now
+        end
+        return {0, i, retry}
+    end
+    counts[i] = count
+end
+local result = {1}
+for i, key in ipairs(KEYS) do
+    redis.call('ZADD', key, now, member)
+    redis.call('PEXPIRE', key, tonumber(ARGV[2 + i * 2]))
+    local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+    table.insert(result, counts[i] + 1)
+    table.insert(result, tonumber(oldest[2]))
+end
+return result
+"""
+
+
+@dataclass(slots=True, frozen=True)
+class Limit:
+    limit: int
+    window: float
+
+
+@dataclass(slots=True, frozen=True)
+class LimitResult:
+    allowed: bool
+    action: str | None = None
+    retry_after: float = 0.0
+
+
+class RateLimiter:
+    # Лимиты проверяются только в Redis; Postgres узнаёт о действиях раз в reconcile_interval —
+    # одним UPDATE users.action_count и одним upsert user_counters на всех накопившихся пользователей
+    def __init__(  # noqa: PLR0913
+        self,
+        redis: Redis,
+        limits: dict[str, Limit],
+        *,
+        db: DatabaseConnector | None = None,
+        user_cache: UserCache | None = None,
+        exempt: frozenset[int] = frozenset(),
+        reconcile_interval: float = 60.0,
+    ):
+        self.redis = redis
+        self.limits = limits
+        self.db = db
+        self.user_cache = user_cache
+        self.exempt = exempt
+        self.reconcile_interval = reconcile_interval
+        self.denied = 0
+        self._script = redis.register_script(SLIDING_WINDOW_LUA)
+        self._actions: Counter[int] = Counter()
+        self._pictures: dict[int, tuple[int, datetime]] = {}
+        self._stopping = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    async def hit(self, tg_id: int, actions: tuple[str, ...], member: str) -> LimitResult:
+        if tg_id in self.exempt:
+            return LimitResult(allowed=True)
+        limits = [self.limits[action] for action in actions]
+        args = [int(time() * 1000), member]
+        for limit in limits:
+            args += [limit.limit, int(limit.window * 1000)]
+        try:
+            result = await self._script(keys=[self._key(tg_id, action) for action in actions], args=args)
+        except Exception:
+            # Недоступный Redis не должен останавливать бота: пропускаем действие без учёта
+            logger.exception(f"Rate limit check failed for user {tg_id}, allowing {actions}")
+            return LimitResult(allowed=True)
+        if not result[0]:
+            self.denied += 1
+            return LimitResult(allowed=False, action=actions[result[1] - 1], retry_after=result[2] / 1000)
+        for n, action in enumerate(actions):
+            count, oldest = result[1 + n * 2], result[2 + n * 2]
+            if action == ACTION:
+                self._actions[tg_id] += 1
+            elif action == PICTURE:
+                self._pictures[tg_id] = (count, datetime.fromtimestamp(oldest / 1000, UTC))
+        return LimitResult(allowed=True)
+
+    @staticmethod
+    def _key(tg_id: int, action: str) -> str:
+        # Общий hash tag: ключи одного пользователя попадают в один слот Redis Cluster
+        return f"{KEY_PREFIX}{{{tg_id}}}:{action}"
+
+    def start(self) -> None:
+        if self.db is not None and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        self._stopping.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+
+    async def _run(self) -> None:
+        while not self._stopping.is_set():
+            with contextlib.suppress(TimeoutError):
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.reconcile_interval)
+            await self.reconcile()
+
+    async def reconcile(self) -> None:
+        actions, self._actions = self._actions, Counter()
+        pictures, self._pictures = self._pictures, {}
+        if not actions and not pictures:
+            return
+        try:
+            await self._write(actions, pictures)
+        except Exception:
+            users = len(actions.keys() | pictures.keys())
+            logger.exception(f"Failed to reconcile rate limits of {users} users, will retry")
+            # Пока шла запись, могли прийти новые действия: прибавляем к ним, а счётчик фото берём свежий
+            self._actions.update(actions)
+            for tg_id, value in pictures.items():
+                self._pictures.setdefault(tg_id, value)
+            return
+        # UPDATE мимо ORM не видит after_flush, поэтому снимки пользователей с action_count сбрасываем сами
+        if actions and self.user_cache is not None:
+            await self.user_cache.invalidate(*actions)
+        logger.debug(f"Reconciled rate limits: {len(actions)} action counters, {len(pictures)} picture counters")
+
+    async def _write(self, actions: Counter[int], pictures: dict[int, tuple[int, datetime]]) -> None:
+        users = User.__table__
+        async with self.db.session_factory() as db_session, db_session.begin():
+            if actions:
+                await db_session.execute(
+                    update(users)
+                    .where(users.c.tg_id == bindparam("b_tg_id"))
+                    .values(action_count=users.c.action_count + bindparam("b_delta")),
+                    [{"b_tg_id": tg_id, "b_delta": delta} for tg_id, delta in actions.items()],
+                )
+            if pictures:
+                stmt = insert(UserCounters).values(
+                    [
+                        {"tg_id": tg_id, "image_count": count, "period_started_at": started_at}
+                        for tg_id, (count, started_at) in pictures.items()
+                    ]
+                )
+                await db_session.execute(
+                    stmt.on_conflict_do_update(
+                        index_elements=[UserCounters.tg_id],
+                        set_={
+                            "image_count": stmt.excluded.image_count,
+                            "period_started_at": stmt.excluded.period_started_at,
+                        },
+                    )
+                )
+
+
+def get_rate_limiter(
+    settings, redis: Redis, db: DatabaseConnector, user_cache: UserCache | None = None
+) -> RateLimiter:
+    return RateLimiter(
+        redis,
+        limits={
+            ACTION: Limit(settings.bot.ACTIONS_THRESHOLD, settings.bot.ACTIONS_WINDOW_HOURS * 3600),
+            PICTURE: Limit(settings.bot.PICTURES_THRESHOLD, settings.bot.PICTURES_WINDOW_DAYS * 86400),
+        },
+        db=db,
+        user_cache=user_cache,
+        exempt=frozenset(settings.bot.ADMINS),
+        reconcile_interval=settings.bot.LIMITS_RECONCILE_INTERVAL,
+    )
+
+
+async def start_rate_limiter(rate_limiter: RateLimiter | None) -> None:
+    if rate_limiter is not None:
+        rate_limiter.start()
+
+
+async def stop_rate_limiter(rate_limiter: RateLimiter | None) -> None:
+    if rate_limiter is not None:
+        await rate_limiter.close()
@@ -0,0 +1,162 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from time import perf_counter
+
+from redis.asyncio import BlockingConnectionPool, Redis
+
+logger = logging.getLogger(__name__)
+
+# Логические пулы и нужно ли декодировать ответы: FSM хранит msgpack, остальным нужны строки
+POOLS = {"fsm": False, "cache": True, "locks": True}
+
+
+@dataclass(slots=True)
+class PoolUsage:
+    size: int
+    in_use: int
+    idle: int
+    healthy: bool
+    ping: float
+
+
+class RedisRegistry:
+    # Единственное место, где создаются клиенты Redis. Каждая логическая группа (FSM, кэши, блокировки)
+    # получает свой BlockingConnectionPool: при исчерпании пула запрос ждёт соединение до pool_timeout,
+    # а не открывает новое, и всплеск в одной группе не выедает соединения у другой
+    def __init__(  # noqa: PLR0913
+        self,
+        host: str,
+        port: int,
+        *,
+        username: str | None = None,
+        password: str | None = None,
+        pool_sizes: dict[str, int] | None = None,
+        pool_timeout: float = 5.0,
+        socket_timeout: float = 5.0,
+        health_check_interval: int = 30,
+    ):
+        self.pool_sizes = pool_sizes or {}
+        self.pool_timeout = pool_timeout
+        self.health_check_interval = health_check_interval
+        self.connection_kwargs = {
+            "host": host,
+            "port": port,
+            "username": username,
+            "password": password,
+            "socket_timeout": socket_timeout,
+            "socket_connect_timeout": socket_timeout,
+            "socket_keepalive": True,
+            # Соединение, простоявшее дольше интервала, перед командой проверяется PING
+            "health_check_interval": health_check_interval,
+        }
+        self.pools: dict[str, BlockingConnectionPool] = {}
+        self.clients: dict[str, Redis] = {}
+        self.healthy: dict[str, bool] = {}
+        self.ping: dict[str, float] = {}
+        self._task: asyncio.Task | None = None
+
+    def client(self, name: str) -> Redis:
+        client = self.clients.get(name)
+        if client is None:
+            pool = BlockingConnectionPool(
+                max_connections=self.pool_sizes.get(name, 10),
+                timeout=self.pool_timeout,
+                decode_responses=POOLS[name],
+                **self.connection_kwargs,
+            )
+            self.pools[name] = pool
+            client = self.clients[name] = Redis(connection_pool=pool)
+            self.healthy[name] = True
+        return client
+
+    def usage(self, name: str) -> PoolUsage:
+        pool = self.pools[name]
+        # Счётчики соединений у пула redis-py есть только во внутренних полях
+        return PoolUsage(
+            size=pool.max_connections,
+            in_use=len(pool._in_use_connections),  # noqa: SLF001
+            idle=len(pool._available_connections),  # noqa: SLF001
+            healthy=self.healthy[name],
+            ping=self.ping.get(name, 0.0),
+        )
+
+    async def check(self) -> None:
+        for name, client in self.clients.items():
+            started = perf_counter()
+            try:
+                await client.ping()
+            except Exception:
+                if self.healthy[name]:
+                    logger.exception(f"Redis pool {name} is unhealthy")
+                self.healthy[name] = False
+                continue
+            self.ping[name] = perf_counter() - started
+            if not self.healthy[name]:
+                logger.warning(f"Redis pool {name} recovered")
+            self.healthy[name] = True
+
+    def start(self) -> None:
+        if self._task is None and self.health_check_interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for pool in self.pools.values():
+            await pool.disconnect()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            await self.check()
+
+
+POOL_GAUGES = (
+    ("size", "Redis pool capacity"),
+    ("in_use", "Redis connections checked out"),
+    ("idle", "Redis connections open and idle"),
+    ("healthy", "Redis pool answered the last health check"),
+    ("ping", "Latency of the last Redis health check in seconds"),
+)
+
+
+def add_pool_gauges(metrics, redis_registry: RedisRegistry) -> None:
+    for field, help_text in POOL_GAUGES:
+        metrics.add_gauge(
+            f"bot_redis_pool_{field}",
+            help_text,
+            lambda field=field: {
+                (name,): float(getattr(redis_registry.usage(name), field)) for name in redis_registry.pools
+            },
+            labels=("pool",),
+        )
+
+
+def get_redis_registry(settings) -> RedisRegistry:
+    return RedisRegistry(
+        host=settings.redis.HOST,
+        port=settings.redis.PORT,
+        username=settings.redis.USERNAME,
+        password=settings.redis.PASSWORD.get_secret_value(),
+        pool_sizes={
+            "fsm": settings.redis.FSM_POOL_SIZE,
+            "cache": settings.redis.CACHE_POOL_SIZE,
+            "locks": settings.redis.LOCKS_POOL_SIZE,
+        },
+        pool_timeout=settings.redis.POOL_TIMEOUT,
+        socket_timeout=settings.redis.SOCKET_TIMEOUT,
+        health_check_interval=settings.redis.HEALTH_CHECK_INTERVAL,
+    )
+
+
+async def start_redis_registry(redis_registry: RedisRegistry | None) -> None:
+    if redis_registry is not None:
+        redis_registry.start()
+
+
+async def stop_redis_registry(redis_registry: RedisRegistry | None) -> None:
+    if redis_registry is not None:
+        await redis_registry.close()
@@ -0,0 +1,126 @@
+import logging
+import random
+from time import monotonic
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+# Голова отбирает кандидатов с запасом, хвост оставляет все ошибки и выбросы по задержке, а остальных —
+# ровно с целевой вероятностью: в итоге обычные апдейты идут с настроенной частотой, а интересные — в разы чаще
+OVERSAMPLE = 4
+THROUGHPUT_WINDOW = 60.0
+EWMA_ALPHA = 0.05
+MAX_PROFILE_SECONDS = 30 * 60
+
+
+class SamplingPolicy:
+    def __init__(  # noqa: PLR0913
+        self,
+        traces_rate: float = 0.05,
+        handler_rates: dict[str, float] | None = None,
+        traces_per_minute: float = 60,
+        profiles_rate: float = 0.0,
+        outlier_factor: float = 4.0,
+        outlier_min_seconds: float = 1.0,
+    ):
+        self.traces_rate = traces_rate
+        self.handler_rates = handler_rates or {}
+        self.traces_per_minute = traces_per_minute
+        self.profiles_rate = profiles_rate
+        self.outlier_factor = outlier_factor
+        self.outlier_min_seconds = outlier_min_seconds
+        self.kept = 0
+        self.trimmed = 0
+        self._latency: dict[str, float] = {}
+        self._window_started = monotonic()
+        self._current = 0
+        self._previous = 0
+        self._profile_until = 0.0
+
+    # --- Окно полного профилирования (включается админом командой /admin_profile) ---
+    def profile_for(self, seconds: float) -> float:
+        seconds = max(0.0, min(seconds, MAX_PROFILE_SECONDS))
+        self._profile_until = monotonic() + seconds
+        if seconds:
+            logger.warning(f"Full tracing and profiling enabled for {seconds:.0f}s")
+        else:
+            logger.warning("Full tracing and profiling disabled")
+        return seconds
+
+    @property
+    def profiling_left(self) -> float:
+        return max(0.0, self._profile_until - monotonic())
+
+    # --- Пропускная способность: скользящая оценка по двум фиксированным окнам ---
+    def _tick(self, now: float) -> None:
+        elapsed = now - self._window_started
+        if elapsed >= THROUGHPUT_WINDOW:
+            self._previous = self._current if elapsed < 2 * THROUGHPUT_WINDOW else 0
+            self._current = 0
+            self._window_started = now - elapsed % THROUGHPUT_WINDOW
+        self._current += 1
+
+    def throughput(self, now: float | None = None) -> float:
+        # Апдейтов в минуту за последние THROUGHPUT_WINDOW секунд
+        now = monotonic() if now is None else now
+        weight = 1 - min(1.0, (now - self._window_started) / THROUGHPUT_WINDOW)
+        return (self._previous * weight + self._current) * 60 / THROUGHPUT_WINDOW
+
+    def rate(self, handler: str | None) -> float:
+        # Частота по хендлеру, но не больше бюджета traces_per_minute при текущем потоке
+        rate = self.handler_rates.get(handler, self.traces_rate) if handler else self.traces_rate
+        throughput = self.throughput()
+        if throughput > self.traces_per_minute:
+            rate = min(rate, self.traces_per_minute / throughput)
+        return rate
+
+    # --- Колбэки sentry_sdk.init ---
+    def traces_sampler(self, sampling_context: dict[str, Any]) -> float:
+        if sampling_context.get("parent_sampled") is not None:
+            return float(sampling_context["parent_sampled"])
+        self._tick(monotonic())
+        if self.profiling_left:
+            return 1.0
+        handler = sampling_context.get("handler")
+        rate = self.rate(handler)
+        # Хвостовой отбор делает только middleware хендлеров; остальные транзакции решаются сразу
+        return min(1.0, rate * OVERSAMPLE) if handler else rate
+
+    def profiles_sampler(self, _sampling_context: dict[str, Any]) -> float:
+        return 1.0 if self.profiling_left else self.profiles_rate
+
+    # --- Хвостовое решение для транзакции хендлера ---
+    def finish(self, handler: str, duration: float, failed: bool, sampled: bool) -> bool:
+        # Средняя задержка считается по всем апдейтам, а не только по отобранным, иначе выбросы смещают базу
+        average = self._latency.get(handler)
+        self._latency[handler] = duration if average is None else average + EWMA_ALPHA * (duration - average)
+        if not sampled:
+            return False
+        keep = failed or self.profiling_left > 0 or self.is_outlier(duration, average)
+        if not keep:
+            # Кандидат прошёл голову с вероятностью min(1, rate * OVERSAMPLE) — оставляем долю rate
+            rate = self.rate(handler)
+            keep = random.random() * min(1.0, rate * OVERSAMPLE) < rate  # noqa: S311 выборка, не криптография
+        if keep:
+            self.kept += 1
+        else:
+            self.trimmed += 1
+        return keep
+
+    def is_outlier(self, duration: float, average: float | None) -> bool:
+        return (
+            average is not None
+            and duration >= self.outlier_min_seconds
+            and duration >= average * self.outlier_factor
+        )
+
+
+def get_sampling_policy(settings) -> SamplingPolicy:
+    return SamplingPolicy(
+        traces_rate=settings.sentry.TRACES_RATE,
+        handler_rates=settings.sentry.HANDLER_RATES,
+        traces_per_minute=settings.sentry.TRACES_PER_MINUTE,
+        profiles_rate=settings.sentry.PROFILES_RATE,
+        outlier_factor=settings.sentry.OUTLIER_FACTOR,
+        outlier_min_seconds=settings.sentry.OUTLIER_MIN_SECONDS,
+    )
@@ -0,0 +1,53 @@
+import logging
+from asyncio import get_running_loop
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import Message
+
+from bot.internal.consts import MAX_MESSAGE_LENGTH
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER = "…"
+
+
+class StreamingReply:
+    # Показывает ответ ассистента по мере генерации, редактируя одно сообщение не чаще min_interval
+    def __init__(self, message: Message, min_interval: float = 1.0, min_chars: int = 40):
+        self.message = message
+        self.min_interval = min_interval
+        self.min_chars = min_chars
+        self._parts: list[str] = []
+        self._pending_chars = 0
+        self._last_edit = 0.0
+        self._sent: Message | None = None
+
+    async def on_delta(self, delta: str) -> None:
+        self._parts.append(delta)
+        self._pending_chars += len(delta)
+        now = get_running_loop().time()
+        if self._pending_chars >= self.min_chars and now - self._last_edit >= self.min_interval:
+            await self._show("".join(self._parts) + PLACEHOLDER)
+            self._pending_chars = 0
+            self._last_edit = now
+
+    async def finish(self, text: str) -> None:
+        if self._sent is None:
+            await self.message.answer(text)
+            return
+        await self._show(text, final=True)
+
+    async def _show(self, text: str, *, final: bool = False) -> None:
+        text = text[:MAX_MESSAGE_LENGTH]
+        # Промежуточный текст может содержать незакрытые теги, поэтому HTML включаем только в финальной правке
+        parse_mode = {} if final else {"parse_mode": None}
+        try:
+            if self._sent is None:
+                self._sent = await self.message.answer(text, **parse_mode)
+            else:
+                await self._sent.edit_text(text, **parse_mode)
+        except TelegramRetryAfter as e:
+            logger.info(f"Streaming edit throttled by Telegram for {e.retry_after}s")
+            self._last_edit = get_running_loop().time() + e.retry_after
+        except TelegramBadRequest as e:
+            logger.debug(f"Streaming edit skipped: {e}")
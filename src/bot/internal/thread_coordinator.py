@@ -0,0 +1,133 @@
+import asyncio
+import logging
+from asyncio import Future, Lock, get_running_loop
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any
+
+from openai.types.beta.threads import TextContentBlockParam
+from redis.asyncio import Redis
+from redis.asyncio.lock import Lock as RedisLock
+from redis.exceptions import LockError, RedisError
+
+logger = logging.getLogger(__name__)
+
+REDIS_LOCK_PREFIX = "ai:thread-lock:"
+
+
+@dataclass(slots=True)
+class _ThreadSlot:
+    lock: Lock = field(default_factory=Lock)
+    pending: list[tuple[Any, Future]] = field(default_factory=list)
+    busy_notified: bool = False
+    users: int = 0
+
+
+def merge_contents(contents: list[Any]) -> Any:
+    if len(contents) == 1:
+        return contents[0]
+    if all(isinstance(content, str) for content in contents):
+        return "\n\n".join(contents)
+    blocks = []
+    for content in contents:
+        if isinstance(content, str):
+            blocks.append(TextContentBlockParam(type="text", text=content))
+        else:
+            blocks.extend(content)
+    return blocks
+
+
+class ThreadCoordinator:
+    # Сериализует обращения к одному треду ассистента: пока идёт run, новые сообщения копятся
+    # и уходят одним сообщением в следующий run, без опроса состояния run через API
+    def __init__(self, redis: Redis | None = None, lock_timeout: float = 180):
+        self.redis = redis
+        self.lock_timeout = lock_timeout
+        self._slots: dict[str, _ThreadSlot] = {}
+
+    async def submit(
+        self,
+        thread_id: str,
+        content: Any,
+        process: Callable[[Any], Awaitable[str | None]],
+        on_busy: Callable[[], Awaitable[Any]] | None = None,
+    ) -> str | None:
+        slot = self._slots.setdefault(thread_id, _ThreadSlot())
+        slot.users += 1
+        future = get_running_loop().create_future()
+        slot.pending.append((content, future))
+        try:
+            if slot.lock.locked() and not slot.busy_notified:
+                slot.busy_notified = True
+                if on_busy is not None:
+                    await on_busy()
+
+            async with slot.lock:
+                if future.done():
+                    # Сообщение уже ушло в составе чужого батча, ответ получит его отправитель
+                    return future.result()
+                batch, slot.pending = slot.pending, []
+                slot.busy_notified = False
+                return await self._process_batch(thread_id, batch, future, process)
+        finally:
+            slot.users -= 1
+            if not slot.users:
+                self._slots.pop(thread_id, None)
+
+    async def _process_batch(
+        self,
+        thread_id: str,
+        batch: list[tuple[Any, Future]],
+        future: Future,
+        process: Callable[[Any], Awaitable[str | None]],
+    ) -> str | None:
+        if len(batch) > 1:
+            logger.info(f"Merged {len(batch)} pending inputs into one message for thread {thread_id}")
+        try:
+            async with self._distributed_lock(thread_id):
+                result = await process(merge_contents([item for item, _ in batch]))
+        except Exception as e:
+            for _, waiter in batch:
+                if waiter is not future and not waiter.done():
+                    waiter.set_exception(e)
+            raise
+        for _, waiter in batch:
+            if waiter is not future and not waiter.done():
+                waiter.set_result(None)
+        return result
+
+    @asynccontextmanager
+    async def _distributed_lock(self, thread_id: str) -> AsyncIterator[None]:
+        if self.redis is None:
+            yield
+            return
+        lock = self.redis.lock(
+            REDIS_LOCK_PREFIX + thread_id,
+            timeout=self.lock_timeout,
+            blocking_timeout=self.lock_timeout,
+        )
+        if not await lock.acquire():
+            raise LockError(f"Could not lock thread {thread_id} within {self.lock_timeout}s")
+        # Run вместе с ожиданием очереди планировщика может идти дольше таймаута блокировки:
+        # продлеваем её, пока держим, иначе второй воркер начнёт параллельный run в том же треде
+        renewal = asyncio.create_task(self._keep_lock(lock, thread_id))
+        try:
+            yield
+        finally:
+            renewal.cancel()
+            await asyncio.gather(renewal, return_exceptions=True)
+            try:
+                await lock.release()
+            except (LockError, RedisError) as e:
+                # Результат run уже получен: потерянная блокировка не повод его выбрасывать
+                logger.warning(f"Could not release lock of thread {thread_id}: {e!r}")
+
+    async def _keep_lock(self, lock: RedisLock, thread_id: str) -> None:
+        while True:
+            await asyncio.sleep(self.lock_timeout / 3)
+            try:
+                await lock.reacquire()
+            except (LockError, RedisError) as e:
+                logger.warning(f"Lost lock of thread {thread_id}: {e!r}")
+                return
@@ -0,0 +1,176 @@
+import asyncio
+import contextlib
+import gzip
+import json
+import logging
+import random
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+from time import strftime
+
+from aiogram.types import Update
+
+from bot.internal.consts import ARCHIVE_REDACT_FIELDS
+
+logger = logging.getLogger(__name__)
+
+REDACTED = "[redacted]"
+FILE_PATTERN = "updates-*.ndjson.gz"
+
+
+def redact(value, fields: frozenset[str]):
+    # Значения заменяются заглушкой того же типа, чтобы запись по-прежнему проходила валидацию Update при повторе
+    if isinstance(value, dict):
+        return {key: _placeholder(item) if key in fields else redact(item, fields) for key, item in value.items()}
+    if isinstance(value, list):
+        return [redact(item, fields) for item in value]
+    return value
+
+
+def _placeholder(value):
+    if isinstance(value, str):
+        return REDACTED
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int | float):
+        return type(value)(0)
+    return None
+
+
+class UpdateArchive:
+    # Архив входящих апдейтов: в обработке апдейта — только фильтр, выборка и put в очередь,
+    # сериализация, сжатие и запись выполняются фоновой задачей в отдельном потоке.
+    # Каждая пачка пишется отдельным gzip-членом, поэтому файл читается целиком даже после падения процесса
+    def __init__(  # noqa: PLR0913
+        self,
+        directory: Path,
+        *,
+        sample_rate: float = 1.0,
+        update_types: Iterable[str] = (),
+        redact_fields: Iterable[str] = ARCHIVE_REDACT_FIELDS,
+        max_file_bytes: int = 64 * 1024 * 1024,
+        queue_size: int = 10_000,
+        flush_interval: float = 1.0,
+        batch_size: int = 1000,
+    ):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.update_types = frozenset(update_types)
+        self.redact_fields = frozenset(redact_fields)
+        self.max_file_bytes = max_file_bytes
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.archived = 0
+        self.dropped = 0
+        self._queue: asyncio.Queue[Update] = asyncio.Queue(queue_size)
+        self._path: Path | None = None
+        self._stopping = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def offer(self, update: Update) -> None:
+        if self.update_types and update.event_type not in self.update_types:
+            return
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:  # noqa: S311 выборка, не криптография
+            return
+        try:
+            self._queue.put_nowait(update)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    def start(self) -> None:
+        if self._task is None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        # Задачу не отменяем: отмена не остановит запись в потоке, а пачка уже вынута из очереди
+        self._stopping.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            with contextlib.suppress(TimeoutError):
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.flush_interval)
+            try:
+                await self._flush()
+            except Exception:
+                logger.exception("Failed to write update archive batch")
+            if self._stopping.is_set():
+                logger.info(f"Update archive closed: {self.archived} archived, {self.dropped} dropped")
+                return
+
+    async def _flush(self) -> None:
+        while not self._queue.empty():
+            batch = [self._queue.get_nowait() for _ in range(min(self.batch_size, self._queue.qsize()))]
+            await asyncio.to_thread(self._write, batch)
+            self.archived += len(batch)
+
+    def _write(self, batch: list[Update]) -> None:
+        lines = [
+            json.dumps(
+                redact(update.model_dump(mode="json", exclude_unset=True), self.redact_fields), ensure_ascii=False
+            )
+            for update in batch
+        ]
+        member = gzip.compress(("\n".join(lines) + "\n").encode("utf-8"), compresslevel=6)
+        if self._path is None or self._path.stat().st_size + len(member) > self.max_file_bytes:
+            self._path = self._next_path()
+        with self._path.open("ab") as file:
+            file.write(member)
+
+    def _next_path(self) -> Path:
+        # Имена сортируются в порядке записи: время открытия файла и номер внутри секунды.
+        # Файл создаётся атомарно (режим "x"): воркеры с общим ARCHIVE_DIR не допишут в один и тот же файл
+        stem = f"updates-{strftime('%Y%m%d-%H%M%S')}"
+        n = 0
+        while True:
+            path = self.directory / f"{stem}-{n:03d}.ndjson.gz"
+            try:
+                path.open("xb").close()
+            except FileExistsError:
+                n += 1
+                continue
+            return path
+
+
+def archive_files(path: Path) -> list[Path]:
+    return sorted(path.glob(FILE_PATTERN)) if path.is_dir() else [path]
+
+
+def read_archive(path: Path) -> Iterator[Update]:
+    # Загрузчик для повторного прогона: path — файл архива или каталог с ними (по порядку ротации)
+    for file_path in archive_files(path):
+        with gzip.open(file_path, "rt", encoding="utf-8") as file:
+            try:
+                for line in file:
+                    if line.strip():
+                        yield Update.model_validate_json(line)
+            except (EOFError, gzip.BadGzipFile):
+                # Последняя пачка могла не дописаться при падении процесса — предыдущие целы
+                logger.warning(f"Update archive {file_path} is truncated, skipping its tail")
+
+
+def get_update_archive(settings) -> UpdateArchive | None:
+    if not settings.archive.ENABLED:
+        return None
+    return UpdateArchive(
+        Path(settings.archive.DIR),
+        sample_rate=settings.archive.SAMPLE_RATE,
+        update_types=settings.archive.UPDATE_TYPES,
+        redact_fields=settings.archive.REDACT_FIELDS,
+        max_file_bytes=settings.archive.MAX_FILE_MB * 1024 * 1024,
+        queue_size=settings.archive.QUEUE_SIZE,
+        flush_interval=settings.archive.FLUSH_INTERVAL,
+    )
+
+
+async def start_update_archive(update_archive: UpdateArchive | None) -> None:
+    if update_archive is not None:
+        update_archive.start()
+
+
+async def stop_update_archive(update_archive: UpdateArchive | None) -> None:
+    if update_archive is not None:
+        await update_archive.close()
@@ -0,0 +1,113 @@
+import asyncio
+import hashlib
+import logging
+from time import time
+
+from openai import NotFoundError
+from redis.asyncio import Redis
+
+from bot.internal.cache import TTLCache
+from bot.internal.openai_scheduler import SYSTEM_QUEUE
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "openai:file:"
+UPLOADS_KEY = "openai:uploads"
+CLEANUP_GRACE = 3600
+
+
+def content_key(file_unique_id: str | None, data: bytes) -> str:
+    if file_unique_id:
+        return f"tg:{file_unique_id}"
+    return f"sha256:{hashlib.sha256(data).hexdigest()}"
+
+
+class UploadCache:
+    # Сопоставляет фото (file_unique_id или хэш содержимого) с уже загруженным в OpenAI file_id
+    def __init__(self, redis: Redis | None = None, ttl: int = 86400, maxsize: int = 10_000):
+        self.redis = redis
+        self.ttl = ttl
+        self.local = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._uploads: dict[str, float] = {}
+        self.cleanup_task: asyncio.Task | None = None
+
+    async def get(self, key: str) -> str | None:
+        file_id = self.local.get(key)
+        if file_id is None and self.redis is not None:
+            file_id = await self.redis.get(KEY_PREFIX + key)
+            if isinstance(file_id, bytes):
+                file_id = file_id.decode()
+            if file_id is not None:
+                # Локальная копия живёт не дольше окна до удаления файла cleanup-задачей
+                self.local.set(key, file_id, ttl=min(self.ttl, CLEANUP_GRACE))
+        return file_id
+
+    async def put(self, key: str, file_id: str) -> None:
+        self.local.set(key, file_id)
+        if self.redis is None:
+            self._uploads[file_id] = time()
+            return
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.set(KEY_PREFIX + key, file_id, ex=self.ttl)
+            pipe.zadd(UPLOADS_KEY, {file_id: time()})
+            await pipe.execute()
+
+    async def expired(self, limit: int = 500) -> list[str]:
+        deadline = time() - self.ttl - CLEANUP_GRACE
+        if self.redis is None:
+            return [file_id for file_id, uploaded_at in self._uploads.items() if uploaded_at < deadline][:limit]
+        file_ids = await self.redis.zrangebyscore(UPLOADS_KEY, "-inf", deadline, start=0, num=limit)
+        return [file_id.decode() if isinstance(file_id, bytes) else file_id for file_id in file_ids]
+
+    async def forget(self, file_ids: list[str]) -> None:
+        if not file_ids:
+            return
+        if self.redis is None:
+            for file_id in file_ids:
+                self._uploads.pop(file_id, None)
+            return
+        await self.redis.zrem(UPLOADS_KEY, *file_ids)
+
+
+async def delete_expired_uploads(ai_client, upload_cache: UploadCache, concurrency: int = 8) -> int:
+    file_ids = await upload_cache.expired()
+    if not file_ids:
+        return 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def delete(file_id: str) -> str | None:
+        async with semaphore:
+            try:
+                await ai_client.scheduler.call(SYSTEM_QUEUE, ai_client.client.files.delete, file_id)
+            except NotFoundError:
+                pass
+            except Exception:
+                logger.exception(f"Failed to delete expired OpenAI file {file_id}")
+                return None
+            return file_id
+
+    deleted = [file_id for file_id in await asyncio.gather(*map(delete, file_ids)) if file_id]
+    await upload_cache.forget(deleted)
+    logger.info(f"Deleted {len(deleted)} expired OpenAI uploads")
+    return len(deleted)
+
+
+async def run_upload_cleanup(ai_client, upload_cache: UploadCache, interval: int = 3600) -> None:
+    while True:
+        try:
+            while await delete_expired_uploads(ai_client, upload_cache):
+                pass
+        except Exception:
+            logger.exception("Upload cleanup failed")
+        await asyncio.sleep(interval)
+
+
+async def start_upload_cleanup(openai_client) -> None:
+    upload_cache = openai_client.upload_cache
+    upload_cache.cleanup_task = asyncio.create_task(run_upload_cleanup(openai_client, upload_cache))
+
+
+async def stop_upload_cleanup(openai_client) -> None:
+    task = openai_client.upload_cache.cleanup_task
+    if task is not None:
+        task.cancel()
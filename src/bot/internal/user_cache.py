@@ -0,0 +1,94 @@
+import json
+import logging
+from datetime import datetime
+from typing import Any
+
+from redis.asyncio import Redis
+from sqlalchemy import inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
+
+from bot.internal.cache import TTLCache
+from database.models import User
+
+logger = logging.getLogger(__name__)
+
+REDIS_KEY_PREFIX = "user:tg:"
+REPORT_EVERY = 1000
+
+
+class UserCache:
+    # Без Redis кэш живёт в памяти процесса. С Redis (несколько воркеров) локальный уровень не используется:
+    # инвалидация в одном воркере иначе не дошла бы до остальных, и они отдавали бы устаревшие ai_thread
+    def __init__(self, maxsize: int = 10_000, ttl: int = 300, redis: Redis | None = None):
+        self.local = TTLCache(maxsize=maxsize, ttl=ttl) if redis is None else None
+        self.redis = redis
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, tg_id: int, db_session: AsyncSession) -> User | None:
+        if self.redis is not None:
+            snapshot = await self._redis_get(tg_id)
+        else:
+            snapshot = self.local.get(tg_id)
+        if snapshot is None:
+            self._count(hit=False)
+            return None
+        self._count(hit=True)
+        return self._attach(snapshot, db_session)
+
+    async def set(self, user: User) -> None:
+        snapshot = {attr.key: getattr(user, attr.key) for attr in inspect(User).column_attrs}
+        if self.redis is None:
+            self.local.set(user.tg_id, snapshot)
+        else:
+            try:
+                await self.redis.set(REDIS_KEY_PREFIX + str(user.tg_id), json.dumps(snapshot, default=str), ex=self.ttl)
+            except Exception:
+                logger.exception(f"Failed to store user {user.tg_id} in redis cache")
+
+    async def invalidate(self, *tg_ids: int) -> None:
+        if not tg_ids:
+            return
+        if self.redis is None:
+            for tg_id in tg_ids:
+                self.local.pop(tg_id)
+        else:
+            try:
+                await self.redis.delete(*(REDIS_KEY_PREFIX + str(tg_id) for tg_id in tg_ids))
+            except Exception:
+                logger.exception(f"Failed to invalidate users {tg_ids} in redis cache")
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    async def _redis_get(self, tg_id: int) -> dict[str, Any] | None:
+        try:
+            raw = await self.redis.get(REDIS_KEY_PREFIX + str(tg_id))
+        except Exception:
+            logger.exception(f"Failed to read user {tg_id} from redis cache")
+            return None
+        if raw is None:
+            return None
+        snapshot = json.loads(raw)
+        snapshot["created_at"] = datetime.fromisoformat(snapshot["created_at"])
+        return snapshot
+
+    @staticmethod
+    def _attach(snapshot: dict[str, Any], db_session: AsyncSession) -> User:
+        # Каждый апдейт получает свой экземпляр User, привязанный к своей сессии, без SELECT
+        user = User(**snapshot)
+        make_transient_to_detached(user)
+        db_session.add(user)
+        return user
+
+    def _count(self, hit: bool) -> None:
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        if (self.hits + self.misses) % REPORT_EVERY == 0:
+            logger.info(f"User cache hit rate: {self.hit_rate:.1%} ({self.hits} hits, {self.misses} misses)")
@@ -1,68 +1,211 @@
 import logging
+from argparse import ArgumentParser
 from asyncio import run
 
 import sentry_sdk
-from aiogram import Bot, Dispatcher
+from aiogram import BaseMiddleware, Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
-from aiogram.fsm.storage.redis import RedisStorage
-from redis.asyncio import Redis
+from aiogram.fsm.storage.base import BaseStorage
 
-from bot.config import get_settings
+from bot.ai_client import get_ai_client
+from bot.config import Settings, get_settings
+from bot.controllers.recommendations import RecommendationEngine
+from bot.controllers.shops import get_shop_catalog, start_shop_catalog, stop_shop_catalog
+from bot.controllers.weather import close_weather_service, get_weather_service
 from bot.handlers.command import router as commands_router
 from bot.handlers.errors import router as error_router
+from bot.handlers.pdf_generator import PDFRenderer, close_pdf_renderer
+from bot.internal.consts import PDF_RENDER_WORKERS
 from bot.internal.enums import Stage
+from bot.internal.fsm_storage import BatchedRedisStorage, get_fsm_storage
 from bot.internal.helpers import setup_logs
+from bot.internal.metrics import BotMetrics, get_metrics, get_metrics_server, instrument_engine
 from bot.internal.notify_admin import on_shutdown, on_startup
+from bot.internal.rate_limiter import get_rate_limiter, start_rate_limiter, stop_rate_limiter
+from bot.internal.redis_pool import add_pool_gauges, get_redis_registry, start_redis_registry, stop_redis_registry
+from bot.internal.sentry_sampling import SamplingPolicy, get_sampling_policy
+from bot.internal.update_archive import get_update_archive, start_update_archive, stop_update_archive
+from bot.internal.upload_cache import start_upload_cleanup, stop_upload_cleanup
+from bot.internal.user_cache import UserCache
 from bot.middlewares.auth import AuthMiddleware
+from bot.middlewares.fsm_batch import FSMBatchMiddleware
 from bot.middlewares.logging import LoggingMiddleware
+from bot.middlewares.metrics import HandlerMetricsMiddleware, UpdateMetricsMiddleware
+from bot.middlewares.rate_limit import RateLimitMiddleware
+from bot.middlewares.sentry import SentryTracingMiddleware
 from bot.middlewares.session import DBSessionMiddleware
 from bot.middlewares.updates_dumper import UpdatesDumperMiddleware
 from bot.middlewares.user_limit import UserLimitMiddleware
 from database.database_connector import get_db
+from database.write_queue import get_write_queue, start_write_queue, stop_write_queue
 
 
-async def main() -> None:
-    setup_logs("suslik_robot")
-    settings = get_settings()
-    if settings.bot.SENTRY_DSN and settings.bot.STAGE == Stage.PROD:
-        sentry_sdk.init(
-            dsn=settings.bot.SENTRY_DSN.get_secret_value(),
-            traces_sample_rate=1.0,
-            profiles_sample_rate=1.0,
-        )
-    bot = Bot(
+def init_logs(settings: Settings) -> None:
+    setup_logs(
+        "suslik_robot",
+        log_format=settings.log.FORMAT,
+        level=settings.log.LEVEL,
+        levels=settings.log.LEVELS,
+        queue_size=settings.log.QUEUE_SIZE,
+    )
+
+
+def init_sentry(settings: Settings) -> SamplingPolicy | None:
+    if not (settings.bot.SENTRY_DSN and settings.bot.STAGE == Stage.PROD):
+        return None
+    sampling_policy = get_sampling_policy(settings)
+    sentry_sdk.init(
+        dsn=settings.bot.SENTRY_DSN.get_secret_value(),
+        traces_sampler=sampling_policy.traces_sampler,
+        profiles_sampler=sampling_policy.profiles_sampler,
+    )
+    return sampling_policy
+
+
+def create_bot(settings: Settings) -> Bot:
+    return Bot(
         token=settings.bot.TOKEN.get_secret_value(),
         default=DefaultBotProperties(parse_mode=ParseMode.HTML),
     )
-    redis_client = Redis(
-        host=settings.redis.HOST,
-        port=settings.redis.PORT,
-        username=settings.redis.USERNAME,
-        password=settings.redis.PASSWORD.get_secret_value(),
-        decode_responses=True,
+
+
+async def build_dispatcher(
+    settings: Settings,
+    storage: BaseStorage | None = None,
+    sampling_policy: SamplingPolicy | None = None,
+) -> Dispatcher:
+    # Своё хранилище передаёт нагрузочный стенд: с MemoryStorage бот собирается без Redis
+    redis_registry = redis_client = lock_redis = None
+    if storage is None:
+        redis_registry = get_redis_registry(settings)
+        redis_client = redis_registry.client("cache")
+        lock_redis = redis_registry.client("locks")
+        storage = get_fsm_storage(settings, redis_registry.client("fsm"))
+    user_cache = UserCache(
+        maxsize=settings.cache.USER_MAXSIZE,
+        ttl=settings.cache.USER_TTL,
+        redis=redis_client if settings.cache.USER_SHARED else None,
     )
-    storage = RedisStorage(redis_client)
-    dispatcher = Dispatcher(storage=storage, settings=settings)
     db = get_db(settings)
     await db.init_models()
-    db_session_middleware = DBSessionMiddleware(db)
-    dispatcher.update.outer_middleware(UpdatesDumperMiddleware())
-    dispatcher.startup.register(on_startup)
-    dispatcher.shutdown.register(on_shutdown)
-    dispatcher.message.middleware(db_session_middleware)
-    dispatcher.callback_query.middleware(db_session_middleware)
-    dispatcher.message.middleware(AuthMiddleware())
-    dispatcher.callback_query.middleware(AuthMiddleware())
+    update_archive = get_update_archive(settings)
+    openai_client = get_ai_client(settings, redis_client, lock_redis)
+    write_queue = get_write_queue(settings, db)
+    rate_limiter = get_rate_limiter(settings, lock_redis, db, user_cache) if lock_redis is not None else None
+    metrics = get_metrics(settings)
+    dispatcher = Dispatcher(
+        storage=storage,
+        settings=settings,
+        user_cache=user_cache,
+        openai_client=openai_client,
+        pdf_renderer=PDFRenderer(max_workers=PDF_RENDER_WORKERS),
+        weather_service=get_weather_service(settings, redis_client),
+        shop_catalog=get_shop_catalog(settings, db),
+        recommendation_engine=RecommendationEngine(),
+        write_queue=write_queue,
+        update_archive=update_archive,
+        metrics=metrics,
+        sampling_policy=sampling_policy,
+        redis_registry=redis_registry,
+        rate_limiter=rate_limiter,
+    )
+    if isinstance(storage, BatchedRedisStorage):
+        # Пачка открывается раньше FSMContextMiddleware: он читает состояние ещё до фильтров
+        dispatcher.update.outer_middleware.unregister(dispatcher.fsm)
+        dispatcher.update.outer_middleware(FSMBatchMiddleware(storage))
+        dispatcher.update.outer_middleware(dispatcher.fsm)
+    db_session_middleware = DBSessionMiddleware(db, user_cache)
+    if metrics is not None:
+        # Внешний middleware регистрируется первым, чтобы в замер попало всё, включая архив апдейтов
+        instrument_engine(db.engine)
+        metrics.add_gauge(
+            "bot_openai_queue_depth", "OpenAI calls waiting for a slot", lambda: openai_client.scheduler.queue_depth
+        )
+        metrics.add_gauge(
+            "bot_openai_active_runs", "OpenAI runs in progress", lambda: openai_client.scheduler.active_runs
+        )
+        metrics.add_gauge("bot_write_queue_pending", "Rows waiting in the write queue", lambda: len(write_queue))
+        if redis_registry is not None:
+            add_pool_gauges(metrics, redis_registry)
+        dispatcher.update.outer_middleware(UpdateMetricsMiddleware(metrics))
+        _add_handler_middleware(dispatcher, HandlerMetricsMiddleware(metrics))
+    dispatcher.update.outer_middleware(UpdatesDumperMiddleware(update_archive))
+    if sampling_policy is not None:
+        # Первым из внутренних, чтобы сессия БД и авторизация попали в транзакцию
+        _add_handler_middleware(dispatcher, SentryTracingMiddleware(sampling_policy))
+    _register_lifecycle(dispatcher)
+    _add_handler_middleware(dispatcher, db_session_middleware)
+    _add_handler_middleware(dispatcher, AuthMiddleware(user_cache))
+    if rate_limiter is not None:
+        # После авторизации: лимит считается по пользователю
+        _add_handler_middleware(dispatcher, RateLimitMiddleware(rate_limiter))
     dispatcher.update.middleware(UserLimitMiddleware())
     dispatcher.message.middleware.register(LoggingMiddleware())
     dispatcher.callback_query.middleware.register(LoggingMiddleware())
     dispatcher.include_routers(commands_router, error_router)
+    return dispatcher
+
+
+def _add_handler_middleware(dispatcher: Dispatcher, middleware: BaseMiddleware) -> None:
+    dispatcher.message.middleware(middleware)
+    dispatcher.callback_query.middleware(middleware)
+
+
+def _register_lifecycle(dispatcher: Dispatcher) -> None:
+    dispatcher.startup.register(on_startup)
+    dispatcher.shutdown.register(on_shutdown)
+    dispatcher.startup.register(start_upload_cleanup)
+    dispatcher.shutdown.register(stop_upload_cleanup)
+    dispatcher.shutdown.register(close_pdf_renderer)
+    dispatcher.shutdown.register(close_weather_service)
+    dispatcher.startup.register(start_shop_catalog)
+    dispatcher.shutdown.register(stop_shop_catalog)
+    dispatcher.startup.register(start_write_queue)
+    dispatcher.shutdown.register(stop_write_queue)
+    dispatcher.startup.register(start_update_archive)
+    dispatcher.shutdown.register(stop_update_archive)
+    dispatcher.startup.register(start_rate_limiter)
+    dispatcher.shutdown.register(stop_rate_limiter)
+    # Пулы закрываются последними: остальные обработчики остановки ещё обращаются к Redis
+    dispatcher.startup.register(start_redis_registry)
+    dispatcher.shutdown.register(stop_redis_registry)
+
+
+async def start_metrics_server(dispatcher: Dispatcher, settings: Settings, metrics: BotMetrics | None) -> None:
+    if metrics is not None:
+        dispatcher["metrics_server"] = get_metrics_server(settings, metrics)
+        await dispatcher["metrics_server"].start()
+
+
+async def stop_metrics_server(dispatcher: Dispatcher) -> None:
+    if "metrics_server" in dispatcher.workflow_data:
+        await dispatcher.workflow_data.pop("metrics_server").stop()
+
+
+async def main() -> None:
+    settings = get_settings()
+    init_logs(settings)
+    sampling_policy = init_sentry(settings)
+    bot = create_bot(settings)
+    dispatcher = await build_dispatcher(settings, sampling_policy=sampling_policy)
+    # В режиме webhook /metrics отдаёт само приложение FastAPI
+    dispatcher.startup.register(start_metrics_server)
+    dispatcher.shutdown.register(stop_metrics_server)
     logging.info("suslik robot started")
+    await bot.delete_webhook()
     await dispatcher.start_polling(bot, skip_updates=True)
 
 
 def run_main() -> None:
+    parser = ArgumentParser(prog="bot-run")
+    parser.add_argument("--mode", choices=("polling", "webhook"), default="polling")
+    args = parser.parse_args()
+    if args.mode == "webhook":
+        from bot.webhook import run_webhook
+
+        run_webhook()
+        return
     run(main())
 
 
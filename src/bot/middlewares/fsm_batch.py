@@ -0,0 +1,22 @@
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from bot.internal.fsm_storage import BatchedRedisStorage
+
+
+class FSMBatchMiddleware(BaseMiddleware):
+    # Все обращения к FSM за апдейт — одно чтение ключа и одна запись в конце
+    def __init__(self, storage: BatchedRedisStorage):
+        self.storage = storage
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        async with self.storage.batch():
+            return await handler(event, data)
@@ -0,0 +1,58 @@
+from collections.abc import Awaitable, Callable
+from time import perf_counter
+from typing import Any
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from bot.internal.metrics import BotMetrics, track_update
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    # Самый внешний middleware: полное время апдейта, а также время в БД и OpenAI, накопленное за него
+    def __init__(self, metrics: BotMetrics):
+        self.metrics = metrics
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: dict[str, Any],
+    ) -> Any:
+        metrics = self.metrics
+        update_type = event.event_type
+        metrics.in_flight.inc()
+        started = perf_counter()
+        with track_update() as timings:
+            try:
+                return await handler(event, data)
+            except Exception as e:
+                metrics.update_errors.inc(update_type, type(e).__name__)
+                raise
+            finally:
+                metrics.in_flight.dec()
+                metrics.update_duration.observe(perf_counter() - started, update_type)
+                metrics.update_db.observe(timings.db, update_type)
+                metrics.update_openai.observe(timings.openai, update_type)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    # Внутренний middleware: к этому моменту фильтры пройдены и известен хендлер
+    def __init__(self, metrics: BotMetrics):
+        self.metrics = metrics
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        name = data["handler"].callback.__name__
+        started = perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            self.metrics.handler_errors.inc(name, type(e).__name__)
+            raise
+        finally:
+            self.metrics.handler_duration.observe(perf_counter() - started, name)
@@ -0,0 +1,44 @@
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import CallbackQuery, TelegramObject
+
+from bot.internal.lexicon import replies
+from bot.internal.rate_limiter import RateLimiter
+
+
+def format_retry(seconds: float) -> str:
+    minutes = max(1, round(seconds / 60))
+    days, minutes = divmod(minutes, 24 * 60)
+    hours, minutes = divmod(minutes, 60)
+    parts = [f"{days} дн." if days else "", f"{hours} ч" if hours else "", f"{minutes} мин" if minutes else ""]
+    return " ".join(part for part in parts if part)
+
+
+class RateLimitMiddleware(BaseMiddleware):
+    # Хендлер объявляет расходуемые действия флагом: flags={"rate_limit": "action"} или ("action", "picture")
+    def __init__(self, rate_limiter: RateLimiter):
+        self.rate_limiter = rate_limiter
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        actions = get_flag(data, "rate_limit")
+        user = data.get("user")
+        if not actions or user is None:
+            return await handler(event, data)
+        actions = (actions,) if isinstance(actions, str) else tuple(actions)
+        result = await self.rate_limiter.hit(user.tg_id, actions, str(data["event_update"].update_id))
+        if result.allowed:
+            return await handler(event, data)
+        text = replies[f"{result.action}_limit_exceeded"].format(retry=format_retry(result.retry_after))
+        if isinstance(event, CallbackQuery):
+            await event.answer(text, show_alert=True)
+        else:
+            await event.answer(text)
+        return None
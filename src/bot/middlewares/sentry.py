@@ -0,0 +1,46 @@
+from collections.abc import Awaitable, Callable
+from time import perf_counter
+from typing import Any
+
+import sentry_sdk
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from sentry_sdk.tracing import TransactionSource
+
+from bot.internal.sentry_sampling import SamplingPolicy
+
+
+class SentryTracingMiddleware(BaseMiddleware):
+    # Транзакция на каждый вызов хендлера: имя хендлера известно только после фильтров,
+    # поэтому это внутренний middleware. Решение головы принимает SamplingPolicy.traces_sampler,
+    # хвостовое (ошибки, выбросы по задержке) — SamplingPolicy.finish
+    def __init__(self, policy: SamplingPolicy):
+        self.policy = policy
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        name = data["handler"].callback.__name__
+        # Свой scope на апдейт: иначе параллельные апдейты делят текущую транзакцию
+        with sentry_sdk.isolation_scope():
+            transaction = sentry_sdk.start_transaction(
+                op="aiogram.handler",
+                name=name,
+                source=TransactionSource.COMPONENT,
+                custom_sampling_context={"handler": name},
+            )
+            with transaction:
+                started = perf_counter()
+                failed = False
+                try:
+                    return await handler(event, data)
+                except Exception:
+                    failed = True
+                    raise
+                finally:
+                    if not self.policy.finish(name, perf_counter() - started, failed, bool(transaction.sampled)):
+                        # Несохранённая транзакция отбрасывается при finish() так же, как не прошедшая голову
+                        transaction.sampled = False
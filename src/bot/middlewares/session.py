@@ -3,13 +3,41 @@ from typing import Any
 
 from aiogram import BaseMiddleware
 from aiogram.types import Message
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
-from database.database_connector import DatabaseConnector
+from bot.internal.user_cache import UserCache
+from database.database_connector import CHANGED_USERS_KEY, DatabaseConnector, has_pending_writes
+
+
+class LazySession:
+    # Сессия создаётся только при первом обращении из хендлера или мидлвари. Соединение из пула
+    # AsyncSession берёт ещё позже — на первом запросе: попадание в кэш пользователей делает лишь
+    # session.add(), и апдейт без запросов к БД проходит без соединения (tests/test_lazy_session.py)
+    def __init__(self, session_factory: async_sessionmaker[AsyncSession]):
+        self._session_factory = session_factory
+        self._session: AsyncSession | None = None
+
+    @property
+    def is_started(self) -> bool:
+        return self._session is not None
+
+    @property
+    def session(self) -> AsyncSession:
+        if self._session is None:
+            self._session = self._session_factory()
+        return self._session
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.session, name)
+
+    def __contains__(self, instance: object) -> bool:
+        return self.is_started and instance in self._session
 
 
 class DBSessionMiddleware(BaseMiddleware):
-    def __init__(self, db: DatabaseConnector):
+    def __init__(self, db: DatabaseConnector, user_cache: UserCache | None = None):
         self.db = db
+        self.user_cache = user_cache
 
     async def __call__(
         self,
@@ -17,13 +45,25 @@ class DBSessionMiddleware(BaseMiddleware):
         event: Message,
         data: dict[str, Any],
     ) -> Any:
-        async with self.db.session_factory() as db_session:
-            data["db_session"] = db_session
-            try:
-                res = await handler(event, data)
-                await db_session.commit()
-                return res
-            except:
-                await db_session.rollback()
-                raise
+        db_session = LazySession(self.db.session_factory)
+        data["db_session"] = db_session
+        try:
+            res = await handler(event, data)
+            if db_session.is_started and has_pending_writes(db_session.session):
+                await db_session.session.commit()
+                # Только после коммита: иначе параллельный апдейт успел бы закэшировать старую строку
+                await self._invalidate_changed_users(db_session.session)
+            return res
+        except:
+            if db_session.is_started:
+                await db_session.session.rollback()
+            raise
+        finally:
+            if db_session.is_started:
+                await db_session.session.close()
 
+    async def _invalidate_changed_users(self, session: AsyncSession) -> None:
+        # Пользователи, попавшие во flush (в том числе при коммите), собираются слушателем after_flush
+        changed = session.info.pop(CHANGED_USERS_KEY, None)
+        if changed and self.user_cache is not None:
+            await self.user_cache.invalidate(*changed)
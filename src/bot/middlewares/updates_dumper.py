@@ -6,20 +6,25 @@ from aiogram import BaseMiddleware
 from aiogram.dispatcher.event.bases import UNHANDLED
 from aiogram.types import TelegramObject, Update
 
+from bot.internal.update_archive import UpdateArchive
+
 logger = logging.getLogger(__name__)
 
 
 class UpdatesDumperMiddleware(BaseMiddleware):
+    # Апдейт только ставится в очередь архива: сериализация и запись идут в фоне, вне обработки
+    def __init__(self, update_archive: UpdateArchive | None = None):
+        self.update_archive = update_archive
+
     async def __call__(
         self,
         handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
         event: Update,
         data: dict[str, Any],
     ) -> Any:
-        json_event = event.model_dump_json(exclude_unset=True)
-
-        logger.info(json_event)
+        if self.update_archive is not None:
+            self.update_archive.offer(event)
         res = await handler(event, data)
         if res is UNHANDLED:
-            logger.info("UNHANDLED")
+            logger.info(f"UNHANDLED update {event.update_id}")
         return res
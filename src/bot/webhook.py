@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import secrets
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from typing import Annotated, Any
+
+import uvicorn
+from aiogram import Bot, Dispatcher
+from fastapi import FastAPI, Header, Request, Response, status
+
+from bot.config import Settings, get_settings
+from bot.internal.metrics import CONTENT_TYPE, is_authorized
+from bot.main import build_dispatcher, create_bot, init_logs, init_sentry
+
+logger = logging.getLogger(__name__)
+
+SHUTDOWN_DRAIN_TIMEOUT = 30
+
+
+class WebhookProcessor:
+    def __init__(self, bot: Bot, dispatcher: Dispatcher, max_in_flight: int = 100):
+        self.bot = bot
+        self.dispatcher = dispatcher
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._tasks: set[asyncio.Task] = set()
+
+    async def submit(self, update: dict[str, Any]) -> None:
+        # Когда все слоты заняты, ответ Telegram задерживается: он сам придержит следующие апдейты
+        await self._slots.acquire()
+        task = asyncio.create_task(self._process(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _process(self, update: dict[str, Any]) -> None:
+        try:
+            result = await self.dispatcher.feed_webhook_update(self.bot, update)
+            if result is not None:
+                await self.dispatcher.silent_call_request(bot=self.bot, result=result)
+        except Exception:
+            logger.exception(f"Failed to process webhook update {update.get('update_id')}")
+        finally:
+            self._slots.release()
+
+    async def drain(self) -> None:
+        if not self._tasks:
+            return
+        logger.info(f"Waiting for {len(self._tasks)} webhook updates to finish")
+        _, pending = await asyncio.wait(self._tasks, timeout=SHUTDOWN_DRAIN_TIMEOUT)
+        for task in pending:
+            task.cancel()
+
+
+def create_app() -> FastAPI:
+    settings = get_settings()
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+        init_logs(settings)
+        sampling_policy = init_sentry(settings)
+        bot = create_bot(settings)
+        dispatcher = await build_dispatcher(settings, sampling_policy=sampling_policy)
+        workflow_data = {"dispatcher": dispatcher, "bots": [bot], **dispatcher.workflow_data}
+        app.state.processor = WebhookProcessor(bot, dispatcher, settings.webhook.MAX_IN_FLIGHT)
+        app.state.metrics = dispatcher.workflow_data["metrics"]
+        await dispatcher.emit_startup(bot=bot, **workflow_data)
+        logging.info("suslik robot started in webhook mode")
+        try:
+            yield
+        finally:
+            await app.state.processor.drain()
+            await dispatcher.emit_shutdown(bot=bot, **workflow_data)
+            await bot.session.close()
+
+    app = FastAPI(lifespan=lifespan, docs_url=None, redoc_url=None, openapi_url=None)
+
+    @app.post(settings.webhook.PATH)
+    async def telegram_webhook(
+        request: Request,
+        secret_token: Annotated[str | None, Header(alias="X-Telegram-Bot-Api-Secret-Token")] = None,
+    ) -> Response:
+        if not _is_valid_secret(settings, secret_token):
+            return Response(status_code=status.HTTP_401_UNAUTHORIZED)
+        await app.state.processor.submit(await request.json())
+        return Response(status_code=status.HTTP_200_OK)
+
+    @app.get("/metrics")
+    async def metrics_endpoint(authorization: Annotated[str | None, Header()] = None) -> Response:
+        # У каждого воркера uvicorn свой реестр: скрейпер видит воркер, на который попал запрос
+        if app.state.metrics is None:
+            return Response(status_code=status.HTTP_404_NOT_FOUND)
+        token = settings.metrics.TOKEN.get_secret_value() if settings.metrics.TOKEN else None
+        if not is_authorized(token, authorization):
+            return Response(status_code=status.HTTP_401_UNAUTHORIZED)
+        return Response(content=app.state.metrics.render(), media_type=CONTENT_TYPE)
+
+    return app
+
+
+def _webhook_secret(settings: Settings) -> str | None:
+    # Пустой WEBHOOK_SECRET из .env означает «без секрета», как и отсутствующий
+    return settings.webhook.SECRET.get_secret_value() if settings.webhook.SECRET else None
+
+
+def _is_valid_secret(settings: Settings, secret_token: str | None) -> bool:
+    expected = _webhook_secret(settings)
+    if expected is None:
+        return True
+    return secret_token is not None and secrets.compare_digest(secret_token, expected)
+
+
+async def set_webhook(settings: Settings) -> None:
+    if not settings.webhook.URL:
+        raise RuntimeError("WEBHOOK_URL must be set to run the bot in webhook mode")
+    bot = create_bot(settings)
+    try:
+        await bot.set_webhook(
+            url=settings.webhook.URL.rstrip("/") + settings.webhook.PATH,
+            secret_token=_webhook_secret(settings),
+            drop_pending_updates=True,
+        )
+    finally:
+        await bot.session.close()
+
+
+def run_webhook() -> None:
+    settings = get_settings()
+    asyncio.run(set_webhook(settings))
+    uvicorn.run(
+        "bot.webhook:create_app",
+        factory=True,
+        host=settings.webhook.HOST,
+        port=settings.webhook.PORT,
+        workers=settings.webhook.WORKERS,
+    )
@@ -1,12 +1,38 @@
 from collections.abc import AsyncGenerator
 
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import (
     AsyncEngine,
     AsyncSession,
     async_sessionmaker,
     create_async_engine,
 )
-from database.models import Base
+from sqlalchemy.orm import Session
+
+from database.models import Base, User
+
+CHANGED_USERS_KEY = "changed_user_tg_ids"
+HAS_WRITES_KEY = "has_writes"
+
+
+@event.listens_for(Session, "after_flush")
+def _track_changed_users(session: Session, _flush_context) -> None:
+    session.info[HAS_WRITES_KEY] = True
+    changed = session.info.setdefault(CHANGED_USERS_KEY, set())
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, User):
+            changed.add(obj.tg_id)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_statement_writes(orm_execute_state) -> None:
+    if not orm_execute_state.is_select:
+        orm_execute_state.session.info[HAS_WRITES_KEY] = True
+
+
+def has_pending_writes(session: AsyncSession) -> bool:
+    return bool(session.new or session.dirty or session.deleted or session.info.get(HAS_WRITES_KEY))
+
 
 class DatabaseConnector:
     def __init__(
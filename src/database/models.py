@@ -1,5 +1,19 @@
 from datetime import datetime
-from sqlalchemy import BOOLEAN, BigInteger, DateTime, ForeignKey, Integer, Numeric, Text, TIMESTAMP, func
+from sqlalchemy import (
+    BOOLEAN,
+    BigInteger,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    Numeric,
+    SmallInteger,
+    Text,
+    TIMESTAMP,
+    UniqueConstraint,
+    func,
+    text,
+)
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 
 
@@ -37,8 +51,8 @@ class UserProfile(Base):
 
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), unique=True, index=True)
     city: Mapped[str | None]
-    lat: Mapped[float | None] = mapped_column(Numeric(10, 6))
-    lon: Mapped[float | None] = mapped_column(Numeric(10, 6))
+    lat: Mapped[float | None] = mapped_column(Numeric(10, 6, asdecimal=False))
+    lon: Mapped[float | None] = mapped_column(Numeric(10, 6, asdecimal=False))
     allow_location: Mapped[bool] = mapped_column(BOOLEAN, default=False, server_default="false")
     updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
@@ -61,8 +75,20 @@ class UserPhoto(Base):
 
 class Recommendation(Base):
     __tablename__ = "recommendations"
+    __table_args__ = (
+        # Покрывающий индекс для /history: страница читается из индекса по ключу (created_at, id),
+        # без сортировки и без чтения широкого message_text
+        Index(
+            "ix_recommendations_user_id_created_at",
+            "user_id",
+            text("created_at DESC"),
+            text("id DESC"),
+            postgresql_include=["weather_summary"],
+        ),
+        {"extend_existing": True},
+    )
 
-    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), index=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
     preference_id: Mapped[int | None] = mapped_column(ForeignKey("preferences.id", ondelete="SET NULL"))
     weather_summary: Mapped[str]
     message_text: Mapped[str]
@@ -71,13 +97,22 @@ class Recommendation(Base):
 class UserCounters(Base):
     __tablename__ = "user_counters"
 
-    tg_id: Mapped[int] = mapped_column(ForeignKey("users.tg_id", ondelete="CASCADE"))
+    tg_id: Mapped[int] = mapped_column(ForeignKey("users.tg_id", ondelete="CASCADE"), unique=True, index=True)
     period_started_at: Mapped[datetime | None] = mapped_column(TIMESTAMP(timezone=True), nullable=True)
     image_count: Mapped[int] = mapped_column(Integer, default=0)
 
 
 class PlantAnalysis(Base):
     __tablename__ = "plant_analyses"
+    __table_args__ = (
+        Index(
+            "ix_plant_analyses_file_unique_id_created_at",
+            "tg_file_unique_id",
+            text("created_at DESC"),
+            postgresql_where=text("tg_file_unique_id IS NOT NULL"),
+        ),
+        {"extend_existing": True},
+    )
 
     user_tg_id: Mapped[int] = mapped_column(
         BigInteger,
@@ -92,4 +127,30 @@ class PlantAnalysis(Base):
     tg_file_unique_id: Mapped[str | None]
 
     ai_response: Mapped[str] = mapped_column(Text, nullable=False)
-    health_score: Mapped[int | None] = mapped_column(Integer)
\ No newline at end of file
+    health_score: Mapped[int | None] = mapped_column(Integer)
+
+class Shop(Base):
+    __tablename__ = "shops"
+
+    name: Mapped[str]
+    address: Mapped[str] = mapped_column(default="", server_default="")
+    city: Mapped[str] = mapped_column(default="", server_default="", index=True)
+    lat: Mapped[float]
+    lon: Mapped[float]
+
+
+class MetricCounter(Base):
+    # Счётчики для /admin_logs ведут триггеры базы (миграция b4d6f8a0c2e4), приложение их только читает.
+    # Строка — одно значение разреза (всего, день, источник, стиль) в одном из шардов: шард выбирается
+    # по backend pid, чтобы параллельные транзакции не ждали друг друга на одной строке
+    __tablename__ = "metric_counters"
+    __table_args__ = (
+        UniqueConstraint("metric", "dimension", "value", "shard", name="uq_metric_counters_key"),
+        {"extend_existing": True},
+    )
+
+    metric: Mapped[str]
+    dimension: Mapped[str]
+    value: Mapped[str] = mapped_column(default="", server_default="")
+    shard: Mapped[int] = mapped_column(SmallInteger, default=0, server_default="0")
+    count: Mapped[int] = mapped_column(BigInteger, default=0, server_default="0")
@@ -0,0 +1,225 @@
+import asyncio
+import contextlib
+import logging
+from dataclasses import dataclass, field
+from time import monotonic
+
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+
+from database.database_connector import DatabaseConnector
+from database.models import Preference, Recommendation, UserPhoto
+
+logger = logging.getLogger(__name__)
+
+MAX_PENDING = 50_000
+RETRY_BASE_DELAY = 0.1
+RETRY_MAX_DELAY = 2.0
+
+
+@dataclass(slots=True, eq=False)
+class PendingPreference:
+    user_id: int
+    event_type: str
+    style: str
+    season_bias: str | None = None
+    id: int | None = field(default=None, init=False)
+
+
+@dataclass(slots=True, eq=False)
+class PendingRecommendation:
+    user_id: int
+    weather_summary: str
+    message_text: str
+    preference: PendingPreference | None = None
+
+
+@dataclass(slots=True, eq=False)
+class PendingPhoto:
+    user_id: int
+    tg_file_id: str
+
+
+PendingWrite = PendingPreference | PendingRecommendation | PendingPhoto
+
+
+class WriteQueue:
+    # Write-behind для аналитических строк: копит вставки из разных апдейтов и пишет их пачкой
+    # (многострочный INSERT) по размеру или по таймеру. В sync-режиме каждая запись сбрасывается сразу
+    def __init__(
+        self,
+        db: DatabaseConnector,
+        *,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+        sync: bool = False,
+        shutdown_timeout: float = 30.0,
+    ):
+        self.db = db
+        self.shutdown_timeout = shutdown_timeout
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.sync = sync
+        self.flushed = 0
+        self.dropped = 0
+        self._pending: list[PendingWrite] = []
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._closing = False
+        self._task: asyncio.Task | None = None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    async def put(self, *records: PendingWrite) -> None:
+        self._pending.extend(records)
+        if self.sync:
+            await self.flush()
+        elif len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def start(self) -> None:
+        if not self.sync and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        # Задачу не отменяем: отмена посреди транзакции потеряла бы пачку
+        self._closing = True
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        # При остановке дописываем всё до конца; если база недоступна — повторяем с паузами,
+        # пока не выйдет shutdown_timeout
+        deadline = monotonic() + self.shutdown_timeout
+        delay = RETRY_BASE_DELAY
+        while self._pending:
+            if await self.flush():
+                delay = RETRY_BASE_DELAY
+                continue
+            if monotonic() + delay > deadline:
+                self.dropped += len(self._pending)
+                logger.error(f"Write queue closed with {len(self._pending)} unsaved records")
+                self._pending.clear()
+                return
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RETRY_MAX_DELAY)
+
+    async def flush(self) -> bool:
+        async with self._flush_lock:
+            batch, self._pending = self._pending[: self.batch_size], self._pending[self.batch_size :]
+            if not batch:
+                return True
+            started = monotonic()
+            try:
+                await self._write(batch)
+            except IntegrityError:
+                # Одна битая строка (например, пользователь уже удалён) не должна блокировать всю очередь
+                logger.warning(f"Batch of {len(batch)} queued writes violates a constraint, writing one by one")
+                unsaved = await self._write_each(batch)
+                if unsaved:
+                    self._requeue(unsaved)
+                    return False
+            except Exception:
+                logger.exception(f"Failed to flush {len(batch)} queued writes, will retry")
+                self._requeue(batch)
+                return False
+            self.flushed += len(batch)
+            logger.debug(f"Flushed {len(batch)} queued writes in {monotonic() - started:.3f}s")
+            return True
+
+    async def _run(self) -> None:
+        # Остаток очереди при остановке дописывает close()
+        while not self._closing:
+            with contextlib.suppress(TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            self._wakeup.clear()
+            while self._pending and not self._closing:
+                if not await self.flush() or len(self._pending) < self.batch_size:
+                    break
+
+    def _requeue(self, batch: list[PendingWrite]) -> None:
+        self._pending[:0] = batch
+        overflow = len(self._pending) - MAX_PENDING
+        if overflow > 0:
+            # База недоступна слишком долго: жертвуем самыми старыми строками, а не памятью процесса
+            del self._pending[:overflow]
+            self.dropped += overflow
+            logger.error(f"Write queue overflow, dropped {overflow} oldest records")
+
+    async def _write_each(self, batch: list[PendingWrite]) -> list[PendingWrite]:
+        for n, record in enumerate(batch):
+            try:
+                await self._write([record])
+            except IntegrityError:
+                self.dropped += 1
+                logger.exception(f"Dropping queued write {record!r}")
+            except Exception:
+                logger.exception("Failed to write queued record, will retry")
+                return batch[n:]
+        return []
+
+    async def _write(self, batch: list[PendingWrite]) -> None:
+        preferences = [record for record in batch if isinstance(record, PendingPreference) and record.id is None]
+        recommendations = [record for record in batch if isinstance(record, PendingRecommendation)]
+        photos = [record for record in batch if isinstance(record, PendingPhoto)]
+
+        ids: list[int] = []
+        async with self.db.session_factory() as db_session, db_session.begin():
+            if preferences:
+                stmt = insert(Preference).returning(Preference.id, sort_by_parameter_order=True)
+                rows = await db_session.execute(
+                    stmt,
+                    [
+                        {
+                            "user_id": pref.user_id,
+                            "event_type": pref.event_type,
+                            "style": pref.style,
+                            "season_bias": pref.season_bias,
+                        }
+                        for pref in preferences
+                    ],
+                )
+                ids = rows.scalars().all()
+            if recommendations:
+                # Предпочтение всегда стоит в очереди раньше своей подборки: либо оно в этой же пачке,
+                # либо уже записано и имеет id
+                new_ids = {id(pref): pref_id for pref, pref_id in zip(preferences, ids, strict=True)}
+                await db_session.execute(
+                    insert(Recommendation),
+                    [
+                        {
+                            "user_id": rec.user_id,
+                            "preference_id": rec.preference
+                            and new_ids.get(id(rec.preference), rec.preference.id),
+                            "weather_summary": rec.weather_summary,
+                            "message_text": rec.message_text,
+                        }
+                        for rec in recommendations
+                    ],
+                )
+            if photos:
+                await db_session.execute(
+                    insert(UserPhoto),
+                    [{"user_id": photo.user_id, "tg_file_id": photo.tg_file_id} for photo in photos],
+                )
+        # id проставляем только после коммита: при откате пачка вернётся в очередь без них
+        for pref, pref_id in zip(preferences, ids, strict=True):
+            pref.id = pref_id
+
+
+def get_write_queue(settings, db: DatabaseConnector) -> WriteQueue:
+    return WriteQueue(
+        db,
+        batch_size=settings.db.write_batch_size,
+        flush_interval=settings.db.write_flush_interval,
+        sync=not settings.db.write_behind,
+    )
+
+
+async def start_write_queue(write_queue: WriteQueue) -> None:
+    write_queue.start()
+
+
+async def stop_write_queue(write_queue: WriteQueue) -> None:
+    await write_queue.close()
@@ -1,37 +1,63 @@
 import asyncio
+import math
 import random
 import time
-from typing import Any
-from typing import Any, AsyncIterator
-from aiogram.client.session.base import BaseSession
-from aiogram import Bot, Dispatcher
+from argparse import ArgumentParser
+from collections import defaultdict
+from collections.abc import AsyncIterator, Awaitable, Callable
+from pathlib import Path
+from typing import Any, get_args
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.client.session.base import BaseSession
 from aiogram.enums import ChatType, ParseMode
-from aiogram.fsm.storage.redis import RedisStorage
-from aiogram.types import Chat, Message, Update, User as TgUser
-from redis.asyncio import Redis
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.types import Message, Update
 
 from bot.config import get_settings
-from bot.handlers.command import router as commands_router
-from bot.middlewares.auth import AuthMiddleware
-from bot.middlewares.logging import LoggingMiddleware
-from bot.middlewares.session import DBSessionMiddleware
-from bot.middlewares.updates_dumper import UpdatesDumperMiddleware
-from bot.middlewares.user_limit import UserLimitMiddleware
-from database.database_connector import get_db
+from bot.internal.update_archive import read_archive
+from bot.main import build_dispatcher
+
+# Нагрузочный стенд: синтетические сценарии или записанный архив апдейтов (см. UpdateArchive)
+# прогоняются через полный стек middleware и роутеров от N виртуальных пользователей с заданной частотой.
+#
+#   PYTHONPATH=src python tests/replay_start_polling.py --users 50 --iterations 3 --rate 200
+#   PYTHONPATH=src python tests/replay_start_polling.py --replay logs/updates --users 20 --storage redis
+#
+# Telegram заменён DummySession, FSM по умолчанию в памяти (--storage redis — как в проде).
+# Postgres берётся из DB_* настроек: запросы бота специфичны для PostgreSQL, подделки для него нет.
+
+VIRTUAL_USER_BASE = 9_000_000_000
+CITIES = ((55.75, 37.61), (59.93, 30.31), (56.84, 60.61))
+EVENTS = ("повседневно", "мероприятие", "работа", "свидание", "спорт")
+STYLES = ("casual", "classic", "sport", "street")
 
 
 # --- Telegram transport stub: никакого реального Telegram API ---
 class DummySession(BaseSession):
-    async def make_request(
-        self,
-        bot,
-        method,
-        timeout: Any = None,
-    ) -> Any:
-        # Имитируем успешный ответ Telegram API
-        return {"ok": True, "result": None}
+    def __init__(self) -> None:
+        super().__init__()
+        self.requests = 0
+
+    async def make_request(self, bot, method, timeout: Any = None) -> Any:
+        # Имитируем успешный ответ Telegram API правильного типа: хендлеры используют результат send/edit
+        self.requests += 1
+        returning = get_args(method.__returning__) or (method.__returning__,)
+        if Message in returning:
+            chat_id = getattr(method, "chat_id", 0)
+            return Message.model_validate(
+                {
+                    "message_id": random.randint(1, 10_000_000),
+                    "date": int(time.time()),
+                    "chat": {"id": chat_id if isinstance(chat_id, int) else 0, "type": ChatType.PRIVATE},
+                    "text": getattr(method, "text", None),
+                },
+                context={"bot": bot},
+            )
+        if bool in returning:
+            return True
+        return None
 
     async def stream_content(
         self,
@@ -46,101 +72,230 @@ class DummySession(BaseSession):
     async def close(self) -> None:
         return
 
-def make_message(user_id: int, text: str) -> Message:
-    return Message(
-        message_id=random.randint(1, 10_000_000),
-        date=int(time.time()),
-        chat=Chat(id=user_id, type=ChatType.PRIVATE),
-        from_user=TgUser(
-            id=user_id,
-            is_bot=False,
-            first_name="Replay",
-            last_name="User",
-            username=f"replay_{user_id}",
-        ),
-        text=text,
-    )
 
+# --- Синтетические апдейты ---
+def _sender(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": "Load", "last_name": "User", "username": f"load_{user_id}"}
 
-async def feed(dp: Dispatcher, bot: Bot, user_id: int, text: str) -> None:
-    msg = make_message(user_id, text)
-    update = Update(update_id=random.randint(1, 10_000_000), message=msg)
-    await dp.feed_update(bot=bot, update=update)
 
+def _message(user_id: int, **content) -> dict:
+    return {
+        "message_id": random.randint(1, 10_000_000),
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": ChatType.PRIVATE},
+        "from": _sender(user_id),
+        **content,
+    }
 
-def build_dispatcher_and_bot() -> tuple[Dispatcher, Bot]:
-    settings = get_settings()
 
-    # Важно: Bot нужен FSM (bot.id берётся из токена, поэтому токен должен быть валидного формата)
-    # Реальный токен можно оставить — запросов к Telegram не будет из-за DummySession.
-    bot = Bot(
-        token=settings.bot.TOKEN.get_secret_value(),
-        default=DefaultBotProperties(parse_mode=ParseMode.HTML),
-        session=DummySession(),
-    )
+def text_update(user_id: int, text: str) -> dict:
+    return {"update_id": random.randint(1, 10_000_000), "message": _message(user_id, text=text)}
 
-    # Storage как в проде
-    redis = Redis(
-        host=settings.redis.HOST,
-        port=settings.redis.PORT,
-        username=settings.redis.USERNAME,
-        password=settings.redis.PASSWORD.get_secret_value(),
-        decode_responses=True,
-    )
-    storage = RedisStorage(redis)
 
-    dp = Dispatcher(storage=storage, settings=settings)
+def location_update(user_id: int) -> dict:
+    lat, lon = random.choice(CITIES)
+    location = {"latitude": lat + random.uniform(-0.1, 0.1), "longitude": lon + random.uniform(-0.1, 0.1)}
+    return {"update_id": random.randint(1, 10_000_000), "message": _message(user_id, location=location)}
 
-    # DB middleware как в проде
-    db = get_db(settings)
-    db_session_middleware = DBSessionMiddleware(db)
 
-    # middlewares — порядок как в main.py
-    dp.update.outer_middleware(UpdatesDumperMiddleware())
+def photo_update(user_id: int) -> dict:
+    file_id = f"load-photo-{user_id}-{random.randint(1, 10_000_000)}"
+    photo = [{"file_id": file_id, "file_unique_id": file_id[-16:], "width": 1280, "height": 960}]
+    return {"update_id": random.randint(1, 10_000_000), "message": _message(user_id, photo=photo)}
 
-    dp.message.middleware(db_session_middleware)
-    dp.callback_query.middleware(db_session_middleware)
 
-    dp.message.middleware(AuthMiddleware())
-    dp.callback_query.middleware(AuthMiddleware())
+def callback_update(user_id: int, data: str) -> dict:
+    callback = {
+        "id": str(random.randint(1, 10_000_000)),
+        "from": _sender(user_id),
+        "chat_instance": str(user_id),
+        "data": data,
+        "message": _message(user_id, text="…"),
+    }
+    return {"update_id": random.randint(1, 10_000_000), "callback_query": callback}
 
-    dp.update.middleware(UserLimitMiddleware())
 
-    dp.message.middleware.register(LoggingMiddleware())
-    dp.callback_query.middleware.register(LoggingMiddleware())
+Scenario = Callable[[int], list[dict]]
 
-    # Для воспроизведения /start достаточно commands_router
-    dp.include_router(commands_router)
 
-    return dp, bot
+def onboarding_scenario(user_id: int) -> list[dict]:
+    # Полный путь подбора: /start → геолокация → событие → стиль → фото или пропуск → магазины → /history
+    return [
+        text_update(user_id, "/start"),
+        callback_update(user_id, "style:start"),
+        location_update(user_id),
+        callback_update(user_id, f"style:event:{random.choice(EVENTS)}"),
+        callback_update(user_id, f"style:style:{random.choice(STYLES)}"),
+        photo_update(user_id) if random.random() < 0.3 else callback_update(user_id, "style:skip_photo"),
+        callback_update(user_id, random.choice(("style:shops:yes", "style:shops:no"))),
+        text_update(user_id, "/history"),
+    ]
 
 
-async def scenario_deeplink_then_start(dp: Dispatcher, bot: Bot, user_id: int) -> None:
-    await feed(dp, bot, user_id, "/start event")
-    await asyncio.sleep(random.uniform(5, 20))
-    await feed(dp, bot, user_id, "/start")
+def start_scenario(user_id: int) -> list[dict]:
+    # deep-link, затем повторный /start — первый апдейт нового пользователя
+    return [text_update(user_id, "/start event"), text_update(user_id, "/start")]
 
 
-async def scenario_double_start_race(dp: Dispatcher, bot: Bot, user_id: int) -> None:
-    # Два /start почти одновременно — имитация гонки
-    await asyncio.gather(
-        feed(dp, bot, user_id, "/start"),
-        feed(dp, bot, user_id, "/start"),
-    )
+SCENARIOS: dict[str, Scenario] = {"onboarding": onboarding_scenario, "start": start_scenario}
 
 
-async def main() -> None:
-    dp, bot = build_dispatcher_and_bot()
+def _remap_ids(value, user_id: int):
+    # Записанный поток проигрывается от имени виртуального пользователя: подменяем отправителя и чат
+    if isinstance(value, dict):
+        remapped = {key: _remap_ids(item, user_id) for key, item in value.items()}
+        for key in ("from", "chat", "user"):
+            if isinstance(remapped.get(key), dict) and "id" in remapped[key]:
+                remapped[key]["id"] = user_id
+        return remapped
+    if isinstance(value, list):
+        return [_remap_ids(item, user_id) for item in value]
+    return value
+
+
+def archive_scenario(path: Path) -> Scenario:
+    recorded = [update.model_dump(mode="json", by_alias=True, exclude_unset=True) for update in read_archive(path)]
+    return lambda user_id: [_remap_ids(update, user_id) for update in recorded]
+
+
+# --- Измерения ---
+class HandlerProbe(BaseMiddleware):
+    # Самый внутренний middleware: запоминает, какой хендлер обработал апдейт
+    async def __call__(
+        self,
+        handler: Callable[[Any, dict[str, Any]], Awaitable[Any]],
+        event: Any,
+        data: dict[str, Any],
+    ) -> Any:
+        data["probe"]["handler"] = data["handler"].callback.__name__
+        return await handler(event, data)
 
-    # Возьми здесь свой реальный tg_id или любой — Telegram API всё равно не вызывается
-    user_id = 342699578
 
-    # 1) deep-link -> пауза -> /start
-    # 2) гонка /start + /start
-    await asyncio.gather(
-        scenario_deeplink_then_start(dp, bot, user_id),
-        scenario_double_start_race(dp, bot, user_id),
+class Pacer:
+    # Общая для всех пользователей частота отправки; при отставании стенд не догоняет пачкой
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0.0
+        self.next_at = 0.0
+
+    async def wait(self) -> None:
+        if not self.interval:
+            return
+        now = asyncio.get_running_loop().time()
+        self.next_at = max(self.next_at, now)
+        delay = self.next_at - now
+        self.next_at += self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class Report:
+    def __init__(self) -> None:
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+
+    def add(self, handler: str, seconds: float, failed: bool) -> None:
+        self.latencies[handler].append(seconds)
+        if failed:
+            self.errors[handler] += 1
+
+    def render(self, elapsed: float, telegram_requests: int) -> str:
+        total = sum(len(values) for values in self.latencies.values())
+        lines = [
+            f"{total} updates in {elapsed:.2f}s: {total / elapsed:.1f} updates/s, {telegram_requests} Telegram calls",
+            f"{'handler':<32}{'count':>8}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}",
+        ]
+        for handler, values in sorted(self.latencies.items(), key=lambda item: -len(item[1])):
+            values.sort()
+            p50, p95, p99 = (percentile(values, q) * 1000 for q in (50, 95, 99))
+            lines.append(
+                f"{handler:<32}{len(values):>8}{self.errors[handler]:>8}"
+                f"{p50:>10.1f}{p95:>10.1f}{p99:>10.1f}{values[-1] * 1000:>10.1f}"
+            )
+        return "\n".join(lines)
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    # Метод ближайшего ранга
+    return sorted_values[max(1, math.ceil(q / 100 * len(sorted_values))) - 1]
+
+
+async def feed(dp: Dispatcher, bot: Bot, data: dict, report: Report) -> None:
+    # Монтируем апдейт к боту заранее, иначе feed_update делает JSON-roundtrip внутри замера
+    update = Update.model_validate(data, context={"bot": bot})
+    probe = {"handler": f"unhandled:{update.event_type}"}
+    failed = False
+    started = time.perf_counter()
+    try:
+        await dp.feed_update(bot=bot, update=update, probe=probe)
+    except Exception:  # noqa: BLE001 падение хендлера попадает в отчёт как ошибка
+        failed = True
+    report.add(probe["handler"], time.perf_counter() - started, failed)
+
+
+async def run_user(  # noqa: PLR0913
+    dp: Dispatcher,
+    bot: Bot,
+    scenario: Scenario,
+    user_id: int,
+    iterations: int,
+    pacer: Pacer,
+    report: Report,
+) -> None:
+    # Шаги одного пользователя идут строго по очереди: от этого зависит FSM
+    for _ in range(iterations):
+        for data in scenario(user_id):
+            await pacer.wait()
+            await feed(dp, bot, data, report)
+
+
+async def build_dispatcher_and_bot(storage: str) -> tuple[Dispatcher, Bot, DummySession]:
+    settings = get_settings()
+    session = DummySession()
+    # Важно: Bot нужен FSM (bot.id берётся из токена, поэтому токен должен быть валидного формата)
+    bot = Bot(
+        token=settings.bot.TOKEN.get_secret_value(),
+        default=DefaultBotProperties(parse_mode=ParseMode.HTML),
+        session=session,
     )
+    # Стек middleware и роутеров — тот же, что в main.py
+    dp = await build_dispatcher(settings, storage=MemoryStorage() if storage == "memory" else None)
+    probe = HandlerProbe()
+    dp.message.middleware(probe)
+    dp.callback_query.middleware(probe)
+    return dp, bot, session
+
+
+async def main() -> None:
+    parser = ArgumentParser(description="Load generator: replays synthetic or recorded updates through the bot")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="onboarding")
+    parser.add_argument("--replay", type=Path, help="update archive file or directory to replay instead")
+    parser.add_argument("--users", type=int, default=10, help="virtual users running concurrently")
+    parser.add_argument("--iterations", type=int, default=1, help="scenario runs per user")
+    parser.add_argument("--rate", type=float, default=0, help="target updates per second in total, 0 = unlimited")
+    parser.add_argument("--storage", choices=("memory", "redis"), default="memory", help="FSM storage backend")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    scenario = archive_scenario(args.replay) if args.replay else SCENARIOS[args.scenario]
+    dp, bot, session = await build_dispatcher_and_bot(args.storage)
+    workflow_data = {"dispatcher": dp, "bots": [bot], **dp.workflow_data}
+    await dp.emit_startup(bot=bot, **workflow_data)
+    report = Report()
+    pacer = Pacer(args.rate)
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(
+            *(
+                run_user(dp, bot, scenario, VIRTUAL_USER_BASE + n, args.iterations, pacer, report)
+                for n in range(args.users)
+            )
+        )
+        elapsed = time.perf_counter() - started
+    finally:
+        await dp.emit_shutdown(bot=bot, **workflow_data)
+        await dp.storage.close()
+    print(report.render(elapsed, session.requests))  # noqa: T201
 
 
 if __name__ == "__main__":
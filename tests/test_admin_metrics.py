@@ -0,0 +1,42 @@
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from bot.controllers.style_assistant import admin_metrics
+
+
+class FakeSession:
+    def __init__(self, rows: list[tuple]) -> None:
+        self.rows = rows
+        self.statements = []
+
+    async def execute(self, stmt):
+        self.statements.append(stmt)
+        return iter(self.rows)
+
+
+@pytest.mark.asyncio
+async def test_admin_metrics_reads_counters_without_scanning_tables() -> None:
+    session = FakeSession(
+        [
+            ("users", "total", "", 120),
+            ("recommendations", "total", "", 300),
+            ("users", "day", "2026-10-18", 4),
+            ("recommendations", "day", "2026-10-18", 9),
+            ("users", "source", "", 80),
+            ("users", "source", "ads", 40),
+            ("recommendations", "style", "casual", 200),
+            ("recommendations", "style", "street", 0),
+        ]
+    )
+
+    metrics = await admin_metrics(session)
+
+    assert metrics["users"] == 120
+    assert metrics["recommendations"] == 300
+    assert metrics["photos"] == 0
+    assert metrics["by_day"] == {"2026-10-18": {"users": 4, "recommendations": 9}}
+    assert metrics["by_source"] == {"—": 80, "ads": 40}
+    assert metrics["by_style"] == {"casual": 200}
+    sql = str(session.statements[0].compile(dialect=postgresql.dialect()))
+    assert "FROM metric_counters" in sql
+    assert "recommendations" not in sql
@@ -0,0 +1,65 @@
+from types import SimpleNamespace
+
+import pytest
+
+from bot.ai_client import AIClient
+
+
+def text_delta(value: str) -> SimpleNamespace:
+    block = SimpleNamespace(type="text", text=SimpleNamespace(value=value))
+    return SimpleNamespace(event="thread.message.delta", data=SimpleNamespace(delta=SimpleNamespace(content=[block])))
+
+
+class FakeStream:
+    def __init__(self, events: list) -> None:
+        self.events = events
+        self.current_run = SimpleNamespace(id="run_1", status="completed")
+
+    async def __aenter__(self) -> "FakeStream":
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        return None
+
+    async def __aiter__(self):
+        for event in self.events:
+            yield event
+
+
+@pytest.mark.asyncio
+async def test_streaming_run_collects_text_and_pushes_deltas() -> None:
+    client = AIClient(token="sk-test", assistant_id="asst_test")
+    stream = FakeStream([text_delta("Полив "), text_delta("раз в неделю")])
+    client.client = SimpleNamespace(
+        beta=SimpleNamespace(threads=SimpleNamespace(runs=SimpleNamespace(stream=lambda **kwargs: stream)))
+    )
+    deltas: list[str] = []
+
+    async def on_delta(delta: str) -> None:
+        deltas.append(delta)
+
+    response = await client._run_thread_and_get_response("thread_1", on_delta=on_delta)
+
+    assert response == "Полив раз в неделю"
+    assert deltas == ["Полив ", "раз в неделю"]
+
+
+@pytest.mark.asyncio
+async def test_run_is_scheduled_under_user_key() -> None:
+    client = AIClient(token="sk-test", assistant_id="asst_test")
+    stream = FakeStream([text_delta("Готово")])
+    client.client = SimpleNamespace(
+        beta=SimpleNamespace(threads=SimpleNamespace(runs=SimpleNamespace(stream=lambda **kwargs: stream)))
+    )
+    keys: list = []
+    slot = client.scheduler.slot
+
+    def recording_slot(user_key, *args, **kwargs):
+        keys.append(user_key)
+        return slot(user_key, *args, **kwargs)
+
+    client.scheduler.slot = recording_slot
+
+    await client._run_thread_and_get_response("thread_1", 42)
+
+    assert keys == [42]
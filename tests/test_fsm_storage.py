@@ -0,0 +1,139 @@
+import time
+
+import pytest
+from aiogram import Bot, Dispatcher
+from aiogram.enums import ChatType
+from aiogram.filters import StateFilter
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.types import Chat, Message, Update, User
+
+from bot.internal.enums import StyleAssistantState
+from bot.internal.fsm_storage import BatchedRedisStorage, decode_data
+from bot.middlewares.fsm_batch import FSMBatchMiddleware
+
+KEY = StorageKey(bot_id=42, chat_id=1, user_id=1)
+
+
+class FakePipeline:
+    def __init__(self, redis: "FakeRedis") -> None:
+        self.redis = redis
+        self.commands: list[tuple] = []
+
+    def __getattr__(self, name: str):
+        return lambda *args, **kwargs: self.commands.append((name, args, kwargs))
+
+    async def execute(self) -> list:
+        for name, args, kwargs in self.commands:
+            getattr(self.redis, f"_{name}")(*args, **kwargs)
+        return []
+
+
+class FakeRedis:
+    def __init__(self) -> None:
+        self.data: dict[str, dict[bytes, bytes]] = {}
+        self.ttl: dict[str, int] = {}
+
+    async def hgetall(self, key: str) -> dict[bytes, bytes]:
+        return dict(self.data.get(key, {}))
+
+    def pipeline(self, transaction: bool = True) -> FakePipeline:
+        return FakePipeline(self)
+
+    def _hset(self, key: str, mapping: dict) -> None:
+        self.data.setdefault(key, {}).update(
+            {name: value.encode() if isinstance(value, str) else value for name, value in mapping.items()}
+        )
+
+    def _hdel(self, key: str, *names: bytes) -> None:
+        for name in names:
+            self.data.get(key, {}).pop(name, None)
+
+    def _delete(self, key: str) -> None:
+        self.data.pop(key, None)
+
+    def _expire(self, key: str, seconds: int) -> None:
+        self.ttl[key] = seconds
+
+
+def text_update(text: str) -> Update:
+    message = Message(
+        message_id=1,
+        date=int(time.time()),
+        chat=Chat(id=1, type=ChatType.PRIVATE),
+        from_user=User(id=1, is_bot=False, first_name="Анна"),
+        text=text,
+    )
+    return Update(update_id=1, message=message)
+
+
+@pytest.mark.asyncio
+async def test_onboarding_step_costs_one_read_and_one_write() -> None:
+    redis = FakeRedis()
+    storage = BatchedRedisStorage(redis, ttl=600)
+    dispatcher = Dispatcher(storage=storage)
+    dispatcher.update.outer_middleware.unregister(dispatcher.fsm)
+    dispatcher.update.outer_middleware(FSMBatchMiddleware(storage))
+    dispatcher.update.outer_middleware(dispatcher.fsm)
+
+    @dispatcher.message(StateFilter(None))
+    async def step(message: Message, state: FSMContext) -> None:
+        await state.get_data()
+        await state.update_data(event="работа")
+        await state.update_data(style="classic")
+        await state.set_state(StyleAssistantState.ASK_EVENT)
+
+    bot = Bot(token="42:TEST")
+    await dispatcher.feed_update(bot, text_update("hi"))
+
+    assert storage.round_trips == 2
+    (key, fields), = redis.data.items()
+    assert fields[b"state"] == StyleAssistantState.ASK_EVENT.state.encode()
+    assert decode_data(fields[b"data"]) == {"event": "работа", "style": "classic"}
+    assert redis.ttl[key] == 600
+
+
+@pytest.mark.asyncio
+async def test_local_cache_serves_next_update_and_copies_data() -> None:
+    storage = BatchedRedisStorage(FakeRedis(), local_ttl=30)
+    async with storage.batch():
+        await storage.set_data(KEY, {"items": [1]})
+    async with storage.batch():
+        data = await storage.get_data(KEY)
+        data["items"].append(2)
+    async with storage.batch():
+        assert await storage.get_data(KEY) == {"items": [1]}
+
+    assert storage.round_trips == 2
+
+
+@pytest.mark.asyncio
+async def test_cleared_state_deletes_key_outside_batch() -> None:
+    redis = FakeRedis()
+    storage = BatchedRedisStorage(redis)
+    await storage.set_state(KEY, StyleAssistantState.ASK_EVENT)
+    await storage.update_data(KEY, {"event": "спорт"})
+    assert await storage.get_state(KEY) == StyleAssistantState.ASK_EVENT.state
+
+    await storage.set_state(KEY, None)
+    await storage.set_data(KEY, {})
+
+    assert redis.data == {}
+
+
+@pytest.mark.asyncio
+async def test_state_change_is_visible_before_batch_ends() -> None:
+    redis = FakeRedis()
+    storage = BatchedRedisStorage(redis)
+    async with storage.batch():
+        await storage.update_data(KEY, {"event": "спорт"})
+        assert redis.data == {}
+        await storage.set_state(KEY, StyleAssistantState.ASK_EVENT)
+        (fields,) = redis.data.values()
+        assert fields[b"state"] == StyleAssistantState.ASK_EVENT.state.encode()
+        await storage.update_data(KEY, {"style": "classic"})
+        # Пока идёт апдейт, другой воркер читает из Redis уже новое состояние
+        assert decode_data(fields[b"data"]) == {"event": "спорт"}
+
+    assert decode_data(fields[b"data"]) == {"event": "спорт", "style": "classic"}
+    assert storage.round_trips == 3
@@ -0,0 +1,72 @@
+from datetime import UTC, datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from bot.controllers.style_assistant import decode_history_cursor, encode_history_cursor, user_recommendation_history
+
+START = datetime(2026, 10, 1, 12, 0, 0, 123456, tzinfo=UTC)
+
+
+class FakeSession:
+    # Имитирует индекс (user_id, created_at DESC, id DESC): отдаёт строки по условию курсора
+    def __init__(self, rows: list[SimpleNamespace]) -> None:
+        self.rows = rows
+        self.statements = []
+        self.cursor = None
+        self.newer = False
+
+    async def execute(self, stmt):
+        self.statements.append(stmt)
+        limit = stmt._limit
+        key = lambda row: (row.created_at, row.id)  # noqa: E731
+        if self.newer:
+            found = sorted((row for row in self.rows if key(row) > self.cursor), key=key)
+        else:
+            found = sorted(
+                (row for row in self.rows if self.cursor is None or key(row) < self.cursor), key=key, reverse=True
+            )
+        return iter(found[:limit])
+
+
+async def fetch(session: FakeSession, cursor=None, newer: bool = False):
+    session.cursor, session.newer = cursor, newer
+    return await user_recommendation_history(session, SimpleNamespace(id=1), limit=2, cursor=cursor, newer=newer)
+
+
+@pytest.mark.asyncio
+async def test_history_pages_back_and_forth() -> None:
+    rows = [SimpleNamespace(id=i, created_at=START + timedelta(minutes=i), weather_summary=f"w{i}") for i in range(5)]
+    session = FakeSession(rows)
+
+    first = await fetch(session)
+    assert [row.id for row in first.items] == [4, 3]
+    assert (first.has_newer, first.has_older) == (False, True)
+
+    second = await fetch(session, first.last)
+    assert [row.id for row in second.items] == [2, 1]
+    assert (second.has_newer, second.has_older) == (True, True)
+
+    last = await fetch(session, second.last)
+    assert [row.id for row in last.items] == [0]
+    assert (last.has_newer, last.has_older) == (True, False)
+
+    back = await fetch(session, second.first, newer=True)
+    assert [row.id for row in back.items] == [4, 3]
+    assert (back.has_newer, back.has_older) == (False, True)
+
+
+@pytest.mark.asyncio
+async def test_history_query_projects_columns_and_uses_keyset() -> None:
+    session = FakeSession([])
+    await fetch(session, (START, 7))
+
+    sql = str(session.statements[0].compile(dialect=postgresql.dialect()))
+    assert "message_text" not in sql
+    assert "OFFSET" not in sql
+    assert "(recommendations.created_at, recommendations.id) <" in sql
+
+
+def test_history_cursor_round_trip_keeps_microseconds() -> None:
+    assert decode_history_cursor(encode_history_cursor((START, 42))) == (START, 42)
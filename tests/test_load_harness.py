@@ -0,0 +1,42 @@
+import pytest
+from aiogram import Bot
+from aiogram.methods import AnswerCallbackQuery, SendMessage
+from aiogram.types import Message, Update
+from replay_start_polling import DummySession, _remap_ids, onboarding_scenario, percentile
+
+
+def test_synthetic_onboarding_updates_are_valid_telegram_updates() -> None:
+    updates = [Update.model_validate(data) for data in onboarding_scenario(9_000_000_001)]
+
+    assert [update.event_type for update in updates][:3] == ["message", "callback_query", "message"]
+    assert updates[2].message.location is not None
+    assert all(update.event.from_user.id == 9_000_000_001 for update in updates)
+
+
+def test_recorded_update_is_replayed_as_virtual_user() -> None:
+    recorded = onboarding_scenario(1)[1]
+
+    update = Update.model_validate(_remap_ids(recorded, 77))
+
+    assert update.callback_query.from_user.id == 77
+    assert update.callback_query.message.chat.id == 77
+
+
+def test_percentile_uses_nearest_rank() -> None:
+    values = [float(n) for n in range(1, 101)]
+
+    assert [percentile(values, q) for q in (50, 95, 99)] == [50.0, 95.0, 99.0]
+    assert percentile([3.0], 99) == 3.0
+
+
+@pytest.mark.asyncio
+async def test_dummy_session_answers_with_typed_results() -> None:
+    session = DummySession()
+    bot = Bot("123456:AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA", session=session)
+
+    sent = await session.make_request(bot, SendMessage(chat_id=5, text="hi"))
+
+    assert isinstance(sent, Message)
+    assert sent.chat.id == 5
+    assert await session.make_request(bot, AnswerCallbackQuery(callback_query_id="1")) is True
+    assert session.requests == 2
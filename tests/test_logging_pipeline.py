@@ -0,0 +1,66 @@
+import json
+import logging
+from datetime import datetime
+from queue import Queue
+
+from bot.internal.helpers import (
+    CustomFormatter,
+    DroppingQueueHandler,
+    JsonFormatter,
+    main_template,
+    setup_logs,
+    stop_logs,
+)
+
+
+def make_record(msg: str = "hello %s", args: tuple = ("world",)) -> logging.LogRecord:
+    return logging.LogRecord("bot.test", logging.INFO, __file__, 10, msg, args, None)
+
+
+def test_cached_format_time_matches_per_record_conversion() -> None:
+    formatter = CustomFormatter(main_template["format"], main_template["datefmt"])
+    for _ in range(3):
+        record = make_record()
+        ct = datetime.fromtimestamp(record.created).astimezone()
+        expected = f"{ct:%d.%m.%Y %H:%M:%S}.{int(record.msecs):03d}М{ct:%z}"
+        assert formatter.formatTime(record, main_template["datefmt"]) == expected
+
+
+def test_json_formatter_emits_one_object_per_record() -> None:
+    payload = json.loads(JsonFormatter(datefmt=main_template["datefmt"]).format(make_record()))
+
+    assert payload["message"] == "hello world"
+    assert payload["level"] == "INFO"
+    assert payload["logger"] == "bot.test"
+
+
+def test_full_queue_drops_and_reports_overflow() -> None:
+    handler = DroppingQueueHandler(Queue(2))
+    for _ in range(5):
+        handler.handle(make_record())
+    assert handler.dropped == 3
+
+    handler.queue.get_nowait()
+    handler.queue.get_nowait()
+    handler.handle(make_record())
+    overflow = handler.queue.get_nowait()
+    assert "dropped 3 records" in overflow.getMessage()
+    assert handler.queue.get_nowait().getMessage() == "hello world"
+
+
+def test_setup_logs_writes_through_background_listener(tmp_path, monkeypatch) -> None:
+    monkeypatch.chdir(tmp_path)
+    root = logging.getLogger()
+    saved_handlers, saved_level = root.handlers[:], root.level
+    try:
+        queue_handler = setup_logs("test_app", log_format="json", levels={"bot.noisy": "ERROR"})
+        assert root.handlers == [queue_handler]
+        logging.getLogger("bot.test").info("started %d", 1)
+        logging.getLogger("bot.noisy").warning("suppressed")
+        stop_logs()
+    finally:
+        root.handlers, root.level = saved_handlers, saved_level
+        logging.getLogger("bot.noisy").setLevel(logging.NOTSET)
+
+    lines = [json.loads(line) for line in (tmp_path / "logs" / "test_app.log").read_text(encoding="utf-8").splitlines()]
+    assert [line["message"] for line in lines] == ["started 1"]
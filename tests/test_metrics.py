@@ -0,0 +1,68 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from bot.internal.metrics import BotMetrics, Histogram, is_authorized, track_openai, track_update
+from bot.middlewares.metrics import HandlerMetricsMiddleware, UpdateMetricsMiddleware
+
+
+def test_histogram_renders_cumulative_buckets() -> None:
+    histogram = Histogram("latency_seconds", "Latency", ("handler",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, "start")
+
+    lines = list(histogram.render())
+
+    assert 'latency_seconds_bucket{handler="start",le="0.1"} 2' in lines
+    assert 'latency_seconds_bucket{handler="start",le="1.0"} 3' in lines
+    assert 'latency_seconds_bucket{handler="start",le="+Inf"} 4' in lines
+    assert 'latency_seconds_count{handler="start"} 4' in lines
+    assert 'latency_seconds_sum{handler="start"} 3.65' in lines
+
+
+@pytest.mark.asyncio
+async def test_nested_openai_time_is_counted_once() -> None:
+    with track_update() as timings, track_openai(), track_openai():
+        await asyncio.sleep(0.02)
+    # Вне апдейта замер ничего не делает
+    with track_openai():
+        pass
+
+    assert 0.02 <= timings.openai < 0.04
+
+
+@pytest.mark.asyncio
+async def test_middlewares_record_latency_and_errors() -> None:
+    metrics = BotMetrics()
+    update_middleware = UpdateMetricsMiddleware(metrics)
+    handler_middleware = HandlerMetricsMiddleware(metrics)
+
+    async def command_start(event, data):
+        with track_openai():
+            await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def inner(event, data):
+        assert metrics.in_flight.value == 1
+        return await handler_middleware(command_start, event, data)
+
+    update = SimpleNamespace(event_type="message")
+    with pytest.raises(ValueError, match="boom"):
+        await update_middleware(inner, update, {"handler": SimpleNamespace(callback=command_start)})
+
+    assert metrics.in_flight.value == 0
+    assert metrics.update_errors.series == {("message", "ValueError"): 1}
+    assert metrics.handler_errors.series == {("command_start", "ValueError"): 1}
+    assert metrics.handler_duration.series[("command_start",)][-1] == 1
+    assert metrics.update_openai.series[("message",)][-2] >= 0.01
+    rendered = metrics.render()
+    assert 'bot_update_duration_seconds_count{update_type="message"} 1' in rendered
+    assert "bot_updates_in_flight 0" in rendered
+
+
+def test_token_check() -> None:
+    assert is_authorized(None, None)
+    assert is_authorized("secret", "Bearer secret")
+    assert not is_authorized("secret", "Bearer other")
+    assert not is_authorized("secret", None)
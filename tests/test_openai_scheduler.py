@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from bot.internal.openai_scheduler import OpenAIScheduler
+
+
+@pytest.mark.asyncio
+async def test_runs_are_capped_and_users_served_round_robin() -> None:
+    scheduler = OpenAIScheduler(max_concurrent_runs=1)
+    order: list[str] = []
+    release = asyncio.Event()
+
+    async def run(user: str) -> None:
+        async with scheduler.slot(user, run=True):
+            order.append(user)
+            await release.wait()
+
+    first = asyncio.create_task(run("alice"))
+    await asyncio.sleep(0)
+    tasks = [first, *(asyncio.create_task(run(user)) for user in ("alice", "alice", "alice", "bob"))]
+    await asyncio.sleep(0)
+    assert order == ["alice"]
+    assert scheduler.active_runs == 1
+    assert scheduler.queue_depth == 4
+
+    release.set()
+    await asyncio.gather(*tasks)
+
+    assert order == ["alice", "alice", "bob", "alice", "alice"]
+    assert scheduler.active_runs == 0
+    assert scheduler.stats.granted == 5
+
+
+@pytest.mark.asyncio
+async def test_request_bucket_delays_excess_calls() -> None:
+    scheduler = OpenAIScheduler(requests_per_minute=60)
+    scheduler.requests.tokens = 1
+
+    async def ping() -> str:
+        return "pong"
+
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    results = await asyncio.gather(scheduler.call("u", ping), scheduler.call("u", ping))
+
+    assert results == ["pong", "pong"]
+    assert loop.time() - started >= 0.9
+
+
+@pytest.mark.asyncio
+async def test_waiting_run_does_not_block_plain_calls_of_same_user() -> None:
+    scheduler = OpenAIScheduler(max_concurrent_runs=1)
+    release = asyncio.Event()
+
+    async def active_run() -> None:
+        async with scheduler.slot("alice", run=True):
+            await release.wait()
+
+    async def poll() -> str:
+        return "in_progress"
+
+    running = asyncio.create_task(active_run())
+    await asyncio.sleep(0)
+    queued = asyncio.create_task(active_run())
+    await asyncio.sleep(0)
+
+    assert await asyncio.wait_for(scheduler.call("alice", poll), timeout=1) == "in_progress"
+    assert scheduler.queue_depth == 1
+
+    release.set()
+    await asyncio.gather(running, queued)
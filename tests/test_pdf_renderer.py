@@ -0,0 +1,19 @@
+import pytest
+from reportlab import rl_config
+
+from bot.handlers.pdf_generator import PDFRenderer
+
+PLAN = "### ЭТАП 1. Осмотр\n- Проверьте листья &amp; побеги\nРастение любит рассеянный свет."
+
+
+@pytest.mark.asyncio
+async def test_pool_renders_pdf_without_touching_parent_reportlab_config() -> None:
+    use_a85 = rl_config.useA85
+    renderer = PDFRenderer(max_workers=1)
+    try:
+        document = await renderer.render(PLAN, "План ухода")
+    finally:
+        renderer.close()
+
+    assert document.startswith(b"%PDF")
+    assert rl_config.useA85 == use_a85
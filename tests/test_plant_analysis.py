@@ -0,0 +1,69 @@
+from datetime import timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from bot.controllers import plant_analysis
+from bot.internal.metrics import BotMetrics
+
+
+class FakeAIClient:
+    def __init__(self) -> None:
+        self.thread_messages: list[tuple[str, str, str]] = []
+
+    async def new_thread(self, user_key) -> str:
+        return "thread-2"
+
+    async def add_to_thread(self, thread_id: str, messages: list[tuple[str, str]], user_key=None) -> None:
+        self.thread_messages.extend((thread_id, role, content) for role, content in messages)
+
+
+class FakeSession:
+    def __init__(self) -> None:
+        self.added: list = []
+
+    def add(self, item) -> None:
+        self.added.append(item)
+
+    async def flush(self) -> None:
+        return None
+
+
+@pytest.mark.asyncio
+async def test_cache_hit_is_added_to_users_thread_and_counted(monkeypatch: pytest.MonkeyPatch) -> None:
+    cached = SimpleNamespace(thread_id="thread-1", ai_response="Полив раз в неделю", health_score=80)
+    lookups: list[timedelta] = []
+
+    async def find_fresh_analysis(db_session, tg_file_unique_id: str, max_age: timedelta):
+        lookups.append(max_age)
+        return cached
+
+    async def load_image() -> bytes:
+        raise AssertionError("cached analysis must not download the photo")
+
+    monkeypatch.setattr(plant_analysis, "find_fresh_analysis", find_fresh_analysis)
+    openai_client = FakeAIClient()
+    db_session = FakeSession()
+    metrics = BotMetrics()
+
+    response = await plant_analysis.analyze_plant_photo(
+        message=None,
+        user=SimpleNamespace(tg_id=1, ai_thread=None),
+        db_session=db_session,
+        openai_client=openai_client,
+        prompt="Что с растением?",
+        tg_file_id="file",
+        tg_file_unique_id="unique",
+        load_image=load_image,
+        settings=SimpleNamespace(cache=SimpleNamespace(ANALYSIS_MAX_AGE_HOURS=6)),
+        metrics=metrics,
+    )
+
+    assert response == "Полив раз в неделю"
+    assert lookups == [timedelta(hours=6)]
+    assert openai_client.thread_messages == [
+        ("thread-2", "user", "Что с растением?"),
+        ("thread-2", "assistant", "Полив раз в неделю"),
+    ]
+    assert db_session.added[-1].thread_id == "thread-2"
+    assert 'bot_plant_analysis_cache_total{result="hit"} 1' in metrics.render()
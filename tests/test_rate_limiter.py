@@ -0,0 +1,141 @@
+from datetime import UTC, datetime
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from bot.internal.rate_limiter import ACTION, PICTURE, Limit, RateLimiter
+from bot.middlewares.rate_limit import RateLimitMiddleware, format_retry
+
+
+class FakeScript:
+    def __init__(self, *results) -> None:
+        self.results = list(results)
+        self.calls: list[tuple[list, list]] = []
+
+    async def __call__(self, keys: list, args: list):
+        self.calls.append((keys, args))
+        return self.results.pop(0)
+
+
+class FakeRedis:
+    def __init__(self, script: FakeScript) -> None:
+        self.script = script
+
+    def register_script(self, source: str) -> FakeScript:
+        return self.script
+
+
+class FakeSession:
+    def __init__(self, fail: bool = False) -> None:
+        self.fail = fail
+        self.executed: list[tuple[str, object]] = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        return None
+
+    def begin(self):
+        return self
+
+    async def execute(self, stmt, params=None) -> None:
+        if self.fail:
+            raise ConnectionError("database is down")
+        self.executed.append((str(stmt.compile(dialect=postgresql.dialect())), params))
+
+
+class FakeMessage:
+    def __init__(self) -> None:
+        self.answers: list[str] = []
+
+    async def answer(self, text: str, *args, **kwargs) -> None:
+        self.answers.append(text)
+
+
+class FakeUserCache:
+    def __init__(self) -> None:
+        self.invalidated: list[int] = []
+
+    async def invalidate(self, *tg_ids: int) -> None:
+        self.invalidated.extend(tg_ids)
+
+
+def make_limiter(script: FakeScript, session: FakeSession | None = None) -> RateLimiter:
+    db = SimpleNamespace(session_factory=lambda: session)
+    limits = {ACTION: Limit(20, 86400), PICTURE: Limit(5, 30 * 86400)}
+    return RateLimiter(FakeRedis(script), limits, db=db, user_cache=FakeUserCache(), exempt=frozenset({1}))
+
+
+@pytest.mark.asyncio
+async def test_hit_checks_all_actions_in_one_script_call() -> None:
+    oldest = int(datetime(2026, 10, 1, tzinfo=UTC).timestamp() * 1000)
+    script = FakeScript([1, 3, oldest - 1000, 2, oldest], [0, 2, 90_000])
+    limiter = make_limiter(script)
+
+    assert (await limiter.hit(42, (ACTION, PICTURE), "7")).allowed
+    denied = await limiter.hit(42, (ACTION, PICTURE), "8")
+    assert (await limiter.hit(1, (ACTION,), "9")).allowed
+
+    keys, args = script.calls[0]
+    assert keys == ["ratelimit:{42}:action", "ratelimit:{42}:picture"]
+    assert args[1:] == ["7", 20, 86_400_000, 5, 2_592_000_000]
+    assert (denied.allowed, denied.action, denied.retry_after) == (False, PICTURE, 90.0)
+    assert len(script.calls) == 2
+    assert limiter._actions == {42: 1}
+    assert limiter._pictures == {42: (2, datetime(2026, 10, 1, tzinfo=UTC))}
+
+
+@pytest.mark.asyncio
+async def test_reconcile_writes_counters_in_bulk_and_keeps_them_on_failure() -> None:
+    started_at = datetime(2026, 10, 1, tzinfo=UTC)
+    session = FakeSession(fail=True)
+    limiter = make_limiter(FakeScript(), session)
+    limiter._actions.update({42: 2, 43: 1})
+    limiter._pictures[42] = (2, started_at)
+
+    await limiter.reconcile()
+    limiter._actions[42] += 1
+    assert limiter._actions == {42: 3, 43: 1}
+    assert not limiter.user_cache.invalidated
+
+    session.fail = False
+    await limiter.reconcile()
+
+    (update_sql, update_params), (upsert_sql, _) = session.executed
+    assert "SET action_count=(users.action_count + %(b_delta)s" in update_sql
+    assert update_params == [{"b_tg_id": 42, "b_delta": 3}, {"b_tg_id": 43, "b_delta": 1}]
+    assert "ON CONFLICT (tg_id) DO UPDATE SET" in upsert_sql
+    assert "image_count = excluded.image_count" in upsert_sql
+    assert not limiter._actions
+    assert not limiter._pictures
+    assert limiter.user_cache.invalidated == [42, 43]
+
+
+@pytest.mark.asyncio
+async def test_middleware_enforces_handler_flags() -> None:
+    calls = []
+
+    async def handler(event, data):
+        calls.append(event)
+
+    limiter = make_limiter(FakeScript([1, 1, 0], [0, 1, 2 * 3600 * 1000 + 300_000]))
+    middleware = RateLimitMiddleware(limiter)
+    user = SimpleNamespace(tg_id=42)
+
+    def data(flags: dict) -> dict:
+        return {"handler": SimpleNamespace(flags=flags), "user": user, "event_update": SimpleNamespace(update_id=5)}
+
+    message = FakeMessage()
+    await middleware(handler, message, data({}))
+    await middleware(handler, message, data({"rate_limit": ACTION}))
+    await middleware(handler, message, data({"rate_limit": ACTION}))
+
+    assert len(calls) == 2
+    assert message.answers == ["Лимит подборок исчерпан. Следующая будет доступна через 2 ч 5 мин."]
+
+
+def test_format_retry() -> None:
+    assert format_retry(10) == "1 мин"
+    assert format_retry(3 * 86400 + 60) == "3 дн. 1 мин"
@@ -0,0 +1,70 @@
+import json
+
+import pytest
+
+from bot.controllers.recommendations import RecommendationEngine
+from bot.controllers.weather import WeatherSnapshot
+
+WARDROBE = {
+    "bands": [{"name": "cold", "max_c": 5}, {"name": "warm", "max_c": None}],
+    "events": ["повседневно", "мероприятие"],
+    "default_event": "повседневно",
+    "styles": {"casual": "в casual", "classic": "в classic"},
+    "slots": ["top", "bottom", "shoes", "outer", "extra"],
+    "required_slots": ["top", "bottom", "shoes"],
+    "garments": [
+        {"name": "футболка", "slot": "top", "events": ["повседневно"], "styles": ["casual"], "bands": ["warm"]},
+        {"name": "свитер", "slot": "top", "events": [], "styles": [], "bands": ["cold"]},
+        {"name": "блуза", "slot": "top", "events": ["мероприятие"], "styles": ["classic"], "bands": []},
+        {"name": "джинсы", "slot": "bottom", "events": [], "styles": ["casual"], "bands": []},
+        {"name": "брюки", "slot": "bottom", "events": ["мероприятие"], "styles": ["classic"], "bands": []},
+        {"name": "кеды", "slot": "shoes", "events": [], "styles": ["casual"], "bands": ["warm"]},
+        {"name": "ботинки", "slot": "shoes", "events": [], "styles": [], "bands": ["cold"], "rain": 1},
+        {"name": "пуховик", "slot": "outer", "events": [], "styles": [], "bands": ["cold"]},
+        {"name": "зонт", "slot": "extra", "events": [], "styles": [], "bands": [], "rain": 1},
+    ],
+    "rules": [
+        {"when": {"band": "cold"}, "require": ["outer"]},
+        {"when": {"precip": True}, "require": ["extra"]},
+    ],
+}
+
+
+@pytest.fixture
+def engine(tmp_path) -> RecommendationEngine:
+    path = tmp_path / "wardrobe.json"
+    path.write_text(json.dumps(WARDROBE, ensure_ascii=False), encoding="utf-8")
+    return RecommendationEngine(path)
+
+
+def test_weather_bucket_filters_and_requires_slots(engine: RecommendationEngine) -> None:
+    warm = engine.recommend("повседневно", "casual", WeatherSnapshot("", 20, None))
+    assert warm[0] == "1) футболка, джинсы, кеды, в casual"
+    assert all("пуховик" not in look and "ботинки" not in look for look in warm)
+
+    cold_rain = engine.recommend("повседневно", "casual", WeatherSnapshot("", -3, "Возможны осадки"))
+    assert cold_rain[0] == "1) свитер, джинсы, ботинки, пуховик, зонт, в casual"
+
+
+def test_unknown_event_and_style_fall_back(engine: RecommendationEngine) -> None:
+    looks = engine.recommend("дача", "boho", WeatherSnapshot("", 20, None))
+    assert len(looks) == 3
+    assert looks[0].endswith("в стиле boho")
+
+
+def test_contexts_are_memoized(engine: RecommendationEngine) -> None:
+    weather = WeatherSnapshot("", 21, None)
+    first = engine.recommend("мероприятие", "classic", weather)
+    assert engine.recommend("мероприятие", "classic", WeatherSnapshot("", 22, None)) == first
+    assert engine.catalog.memo_hits == 1
+
+
+@pytest.mark.asyncio
+async def test_reload_swaps_catalog(engine: RecommendationEngine) -> None:
+    engine.recommend("повседневно", "casual", WeatherSnapshot("", 20, None))
+    wardrobe = {**WARDROBE, "garments": [*WARDROBE["garments"], {"name": "поло", "slot": "top", "weight": 50}]}
+    engine.path.write_text(json.dumps(wardrobe, ensure_ascii=False), encoding="utf-8")
+
+    assert await engine.reload() == len(WARDROBE["garments"]) + 1
+    assert engine.recommend("повседневно", "casual", WeatherSnapshot("", 20, None))[0].startswith("1) поло")
+    assert engine.catalog.memo_hits == 0
@@ -0,0 +1,43 @@
+import pytest
+from redis.asyncio import BlockingConnectionPool
+
+from bot.internal.metrics import BotMetrics
+from bot.internal.redis_pool import RedisRegistry, add_pool_gauges
+
+
+def make_registry() -> RedisRegistry:
+    # Порт 1 закрыт: проверка здоровья падает сразу, без ожидания таймаута
+    return RedisRegistry("127.0.0.1", 1, pool_sizes={"fsm": 4, "cache": 8}, socket_timeout=0.5)
+
+
+def test_clients_are_shared_per_logical_pool() -> None:
+    registry = make_registry()
+
+    fsm = registry.client("fsm")
+    assert registry.client("fsm") is fsm
+    assert registry.client("cache") is not fsm
+    pool = registry.pools["fsm"]
+    assert isinstance(pool, BlockingConnectionPool)
+    assert pool.max_connections == 4
+    assert pool.connection_kwargs["decode_responses"] is False
+    assert registry.pools["cache"].connection_kwargs["decode_responses"] is True
+    assert registry.pools["cache"].connection_kwargs["health_check_interval"] == 30
+    with pytest.raises(KeyError):
+        registry.client("sessions")
+
+
+@pytest.mark.asyncio
+async def test_health_check_marks_unreachable_pool_and_exports_gauges() -> None:
+    registry = make_registry()
+    registry.client("cache")
+    metrics = BotMetrics()
+    add_pool_gauges(metrics, registry)
+
+    await registry.check()
+
+    usage = registry.usage("cache")
+    assert (usage.size, usage.in_use, usage.healthy) == (8, 0, False)
+    rendered = metrics.render()
+    assert 'bot_redis_pool_size{pool="cache"} 8.0' in rendered
+    assert 'bot_redis_pool_healthy{pool="cache"} 0.0' in rendered
+    await registry.close()
@@ -0,0 +1,88 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+import sentry_sdk
+from sentry_sdk.transport import Transport
+
+from bot.internal import sentry_sampling
+from bot.internal.sentry_sampling import OVERSAMPLE, SamplingPolicy
+from bot.middlewares.sentry import SentryTracingMiddleware
+
+
+class CapturingTransport(Transport):
+    def __init__(self) -> None:
+        super().__init__()
+        self.transactions: list[str] = []
+
+    def capture_envelope(self, envelope) -> None:
+        event = envelope.get_transaction_event()
+        if event is not None:
+            self.transactions.append(event["transaction"])
+
+
+def test_rate_follows_handler_and_throughput_budget() -> None:
+    policy = SamplingPolicy(traces_rate=0.1, handler_rates={"command_handler": 0.5}, traces_per_minute=60)
+
+    assert policy.traces_sampler({"handler": "command_handler"}) == 1.0
+    assert policy.traces_sampler({"handler": "style_callback"}) == pytest.approx(0.1 * OVERSAMPLE)
+    assert policy.traces_sampler({"transaction_context": {}}) == 0.1
+    assert policy.traces_sampler({"parent_sampled": False, "handler": "command_handler"}) == 0.0
+
+    # 600 апдейтов в минуту при бюджете 60 трасс — не больше 10% даже для хендлера с частотой 50%
+    for _ in range(600):
+        policy.traces_sampler({"handler": "style_callback"})
+    assert policy.rate("command_handler") == pytest.approx(60 / policy.throughput())
+    assert policy.rate("command_handler") < 0.11
+
+
+def test_tail_keeps_errors_and_outliers(monkeypatch) -> None:
+    policy = SamplingPolicy(traces_rate=0.0, outlier_factor=4.0, outlier_min_seconds=1.0)
+    monkeypatch.setattr(sentry_sampling.random, "random", lambda: 0.99)
+    for _ in range(20):
+        assert not policy.finish("command_handler", 0.3, failed=False, sampled=True)
+
+    assert policy.finish("command_handler", 0.3, failed=True, sampled=True)
+    assert policy.finish("command_handler", 1.5, failed=False, sampled=True)
+    # Не прошедшая голову транзакция не сохраняется, но её задержка учитывается в средней
+    assert not policy.finish("command_handler", 5.0, failed=True, sampled=False)
+    assert not policy.finish("command_handler", 0.9, failed=False, sampled=True)
+
+
+def test_profile_window_samples_everything() -> None:
+    policy = SamplingPolicy(traces_rate=0.0, profiles_rate=0.0)
+    assert policy.profiles_sampler({}) == 0.0
+
+    assert policy.profile_for(24 * 3600) == sentry_sampling.MAX_PROFILE_SECONDS
+    assert policy.traces_sampler({"handler": "command_handler"}) == 1.0
+    assert policy.profiles_sampler({}) == 1.0
+    assert policy.finish("command_handler", 0.01, failed=False, sampled=True)
+
+    policy.profile_for(0)
+    assert policy.traces_sampler({"handler": "command_handler"}) == 0.0
+
+
+@pytest.mark.asyncio
+async def test_middleware_drops_trimmed_transactions(monkeypatch) -> None:
+    # Голова при 0.25 * OVERSAMPLE берёт всё, хвост оставляет четверть
+    policy = SamplingPolicy(traces_rate=0.25)
+    transport = CapturingTransport()
+    sentry_sdk.init(dsn="https://key@sentry.invalid/1", transport=transport, traces_sampler=policy.traces_sampler)
+    monkeypatch.setattr(sentry_sampling.random, "random", lambda: 0.0)
+    try:
+        middleware = SentryTracingMiddleware(policy)
+
+        async def command_handler(event, data):
+            await asyncio.sleep(0)
+            return "ok"
+
+        data = {"handler": SimpleNamespace(callback=command_handler)}
+        assert await middleware(command_handler, object(), data) == "ok"
+        monkeypatch.setattr(sentry_sampling.random, "random", lambda: 0.5)
+        await middleware(command_handler, object(), data)
+        sentry_sdk.flush()
+    finally:
+        sentry_sdk.init()
+
+    assert transport.transactions == ["command_handler"]
+    assert (policy.kept, policy.trimmed) == (1, 1)
@@ -0,0 +1,96 @@
+import asyncio
+import json
+import random
+
+import pytest
+
+from bot.controllers import shops
+from bot.controllers.shops import Shop, ShopCatalog, ShopIndex, distance_km
+
+
+def _random_shops(count: int, seed: int = 1) -> list[Shop]:
+    rng = random.Random(seed)
+    return [
+        Shop(name=f"Shop {i}", address="", city="Москва", lat=55.75 + rng.gauss(0, 0.2), lon=37.6 + rng.gauss(0, 0.3))
+        for i in range(count)
+    ]
+
+
+def test_nearest_matches_brute_force() -> None:
+    shops = _random_shops(3000)
+    index = ShopIndex(shops)
+    rng = random.Random(2)
+    for _ in range(50):
+        lat, lon = 55.75 + rng.gauss(0, 0.3), 37.6 + rng.gauss(0, 0.4)
+        expected = sorted(distance_km(lat, lon, shop.lat, shop.lon) for shop in shops)[:5]
+        got = [distance for _, distance in index.nearest(lat, lon, k=5, max_radius_km=1000)]
+        assert got == pytest.approx(expected)
+
+
+def test_within_matches_brute_force() -> None:
+    shops = _random_shops(3000)
+    index = ShopIndex(shops)
+    expected = {shop.name for shop in shops if distance_km(55.75, 37.6, shop.lat, shop.lon) <= 2}
+    found = index.within(55.75, 37.6, 2)
+    assert {shop.name for shop, _ in found} == expected
+    assert [distance for _, distance in found] == sorted(distance for _, distance in found)
+
+
+def test_nearest_respects_max_radius_and_empty_index() -> None:
+    index = ShopIndex(_random_shops(100))
+    assert index.nearest(45.0, 40.0, k=3) == []
+    assert ShopIndex([]).nearest(55.75, 37.6) == []
+
+
+def test_in_city_normalizes_name() -> None:
+    index = ShopIndex([Shop(name="Ёлка", address="", city="Орёл", lat=52.97, lon=36.06)])
+    assert [shop.name for shop in index.in_city("  орел ")] == ["Ёлка"]
+
+
+@pytest.mark.asyncio
+async def test_catalog_reloads_file(tmp_path) -> None:
+    path = tmp_path / "shops.jsonl"
+    path.write_text(json.dumps({"name": "A", "city": "Москва", "lat": 55.75, "lon": 37.6}) + "\n")
+    catalog = ShopCatalog(file_path=path)
+
+    assert await catalog.reload() == 1
+    old_index = catalog.index
+
+    with path.open("a") as file:
+        file.write(json.dumps({"name": "B", "city": "Москва", "lat": 55.76, "lon": 37.61}) + "\n")
+    assert await catalog.reload() == 2
+    assert catalog.index is not old_index
+    assert [shop.name for shop, _ in await catalog.nearest(55.76, 37.61, k=2)] == ["B", "A"]
+
+
+@pytest.mark.asyncio
+async def test_watch_rebuilds_db_index_only_when_version_changes(monkeypatch) -> None:
+    # Версия таблицы на каждом тике watch: первый тик без изменений, второй — с новой строкой
+    versions = [(1, 1, None), (2, 2, None)]
+    version = (1, 1, None)
+    loads = []
+
+    async def fake_version(db) -> tuple:
+        return version
+
+    async def fake_load(db) -> list[Shop]:
+        loads.append(db)
+        return [Shop(name="A", address="", city="Москва", lat=55.75, lon=37.6)]
+
+    async def fake_sleep(delay: float) -> None:
+        nonlocal version
+        if not versions:
+            raise asyncio.CancelledError
+        version = versions.pop(0)
+
+    monkeypatch.setattr(shops, "shops_db_version", fake_version)
+    monkeypatch.setattr(shops, "load_shops_db", fake_load)
+    monkeypatch.setattr(shops.asyncio, "sleep", fake_sleep)
+    catalog = ShopCatalog(db=object())
+    await catalog.reload()
+
+    with pytest.raises(asyncio.CancelledError):
+        await catalog.watch(300)
+
+    assert len(loads) == 2
+    assert catalog.index.nearest(55.75, 37.6, k=1)[0][0].name == "A"
@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+from redis.exceptions import LockNotOwnedError
+
+from bot.internal.thread_coordinator import ThreadCoordinator
+
+
+@pytest.mark.asyncio
+async def test_pending_inputs_are_merged_into_one_run() -> None:
+    coordinator = ThreadCoordinator()
+    processed: list[str] = []
+    busy_replies: list[str] = []
+    release_first_run = asyncio.Event()
+
+    async def process(content: str) -> str:
+        processed.append(content)
+        if len(processed) == 1:
+            await release_first_run.wait()
+        return f"answer to {content!r}"
+
+    async def on_busy() -> None:
+        busy_replies.append("wait")
+
+    first = asyncio.create_task(coordinator.submit("thread", "первое", process, on_busy))
+    await asyncio.sleep(0)
+    second = asyncio.create_task(coordinator.submit("thread", "второе", process, on_busy))
+    third = asyncio.create_task(coordinator.submit("thread", "третье", process, on_busy))
+    await asyncio.sleep(0)
+    release_first_run.set()
+
+    results = await asyncio.gather(first, second, third)
+
+    assert processed == ["первое", "второе\n\nтретье"]
+    assert results == ["answer to 'первое'", "answer to 'второе\\n\\nтретье'", None]
+    assert busy_replies == ["wait"]
+    assert not coordinator._slots
+
+
+class ExpiringLock:
+    def __init__(self, redis: "FakeLockRedis") -> None:
+        self.redis = redis
+
+    async def acquire(self) -> bool:
+        return True
+
+    async def reacquire(self) -> bool:
+        self.redis.renewals += 1
+        return True
+
+    async def release(self) -> None:
+        raise LockNotOwnedError("Cannot release a lock that's no longer owned")
+
+
+class FakeLockRedis:
+    def __init__(self) -> None:
+        self.renewals = 0
+
+    def lock(self, name: str, timeout: float, blocking_timeout: float) -> ExpiringLock:
+        return ExpiringLock(self)
+
+
+@pytest.mark.asyncio
+async def test_lock_is_renewed_during_long_run_and_lost_lock_keeps_result() -> None:
+    redis = FakeLockRedis()
+    coordinator = ThreadCoordinator(redis, lock_timeout=0.03)
+
+    async def process(content: str) -> str:
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    assert await coordinator.submit("thread", "вопрос", process) == "answer"
+    assert redis.renewals >= 2
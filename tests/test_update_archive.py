@@ -0,0 +1,94 @@
+import gzip
+import json
+import time
+
+import pytest
+from aiogram.enums import ChatType
+from aiogram.types import CallbackQuery, Chat, Location, Message, Update, User
+
+from bot.internal import update_archive
+from bot.internal.update_archive import REDACTED, UpdateArchive, read_archive
+
+SENDER = User(id=42, is_bot=False, first_name="Анна", last_name="Петрова", username="anna")
+
+
+def location_update(update_id: int) -> Update:
+    message = Message(
+        message_id=update_id,
+        date=int(time.time()),
+        chat=Chat(id=42, type=ChatType.PRIVATE),
+        from_user=SENDER,
+        location=Location(latitude=55.75, longitude=37.61),
+    )
+    return Update(update_id=update_id, message=message)
+
+
+def callback_update(update_id: int) -> Update:
+    return Update(
+        update_id=update_id,
+        callback_query=CallbackQuery(id=str(update_id), from_user=SENDER, chat_instance="1", data="style:start"),
+    )
+
+
+@pytest.mark.asyncio
+async def test_archive_redacts_filters_and_replays(tmp_path) -> None:
+    archive = UpdateArchive(tmp_path, update_types=["message"], flush_interval=0.01)
+    archive.start()
+    for n in range(1, 4):
+        archive.offer(location_update(n))
+    archive.offer(callback_update(10))
+    await archive.close()
+
+    assert archive.archived == 3
+    files = sorted(tmp_path.glob("*.ndjson.gz"))
+    assert len(files) == 1
+    raw = gzip.decompress(files[0].read_bytes()).decode("utf-8")
+    assert "Анна" not in raw
+    assert "55.75" not in raw
+
+    replayed = list(read_archive(tmp_path))
+    assert [update.update_id for update in replayed] == [1, 2, 3]
+    assert replayed[0].message.from_user.first_name == REDACTED
+    assert replayed[0].message.from_user.id == 42
+    assert replayed[0].message.location.latitude == 0
+
+
+@pytest.mark.asyncio
+async def test_archive_rotates_by_size_and_survives_truncated_tail(tmp_path) -> None:
+    archive = UpdateArchive(tmp_path, max_file_bytes=1, batch_size=1)
+    archive.start()
+    for n in range(1, 4):
+        archive.offer(location_update(n))
+    await archive.close()
+
+    files = sorted(tmp_path.glob("*.ndjson.gz"))
+    assert len(files) == 3
+    with files[-1].open("ab") as file:
+        file.write(gzip.compress(json.dumps({"update_id": 4}).encode())[:-8])
+
+    assert [update.update_id for update in read_archive(tmp_path)] == [1, 2, 3]
+
+
+def test_sampling_and_overflow_skip_without_blocking(tmp_path) -> None:
+    archive = UpdateArchive(tmp_path, sample_rate=0.0)
+    archive.offer(location_update(1))
+    assert archive._queue.empty()
+
+    archive = UpdateArchive(tmp_path, queue_size=1)
+    archive.offer(location_update(1))
+    archive.offer(location_update(2))
+    assert archive.dropped == 1
+
+
+def test_next_path_never_reuses_file_created_by_another_worker(tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(update_archive, "strftime", lambda _: "20261018-120000")
+    (tmp_path / "updates-20261018-120000-000.ndjson.gz").write_bytes(b"other worker")
+    archive = UpdateArchive(tmp_path)
+
+    first, second = archive._next_path(), archive._next_path()
+
+    assert (first.name, second.name) == (
+        "updates-20261018-120000-001.ndjson.gz",
+        "updates-20261018-120000-002.ndjson.gz",
+    )
+    assert (tmp_path / "updates-20261018-120000-000.ndjson.gz").read_bytes() == b"other worker"
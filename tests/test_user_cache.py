@@ -0,0 +1,78 @@
+from datetime import UTC, datetime
+
+import pytest
+
+from bot.internal.user_cache import UserCache
+from database.models import User
+
+
+class FakeSession:
+    def __init__(self) -> None:
+        self.added: list = []
+
+    def add(self, obj) -> None:
+        self.added.append(obj)
+
+
+def make_user(tg_id: int) -> User:
+    return User(
+        id=tg_id,
+        tg_id=tg_id,
+        fullname="Test User",
+        username="@test",
+        action_count=0,
+        is_context_added=False,
+        created_at=datetime.now(UTC),
+    )
+
+
+@pytest.mark.asyncio
+async def test_user_cache_hit_returns_fresh_instance() -> None:
+    cache = UserCache(maxsize=10, ttl=60)
+    await cache.set(make_user(1))
+
+    first_session, second_session = FakeSession(), FakeSession()
+    first = await cache.get(1, first_session)
+    second = await cache.get(1, second_session)
+
+    assert first.tg_id == second.tg_id == 1
+    assert first is not second
+    assert first_session.added == [first]
+    assert cache.hit_rate == 1.0
+
+
+@pytest.mark.asyncio
+async def test_user_cache_invalidate() -> None:
+    cache = UserCache(maxsize=10, ttl=60)
+    await cache.set(make_user(1))
+    await cache.invalidate(1)
+
+    assert await cache.get(1, FakeSession()) is None
+    assert cache.misses == 1
+
+
+class FakeRedis:
+    def __init__(self) -> None:
+        self.data: dict[str, str] = {}
+
+    async def get(self, key: str) -> str | None:
+        return self.data.get(key)
+
+    async def set(self, key: str, value: str, ex: int | None = None) -> None:
+        self.data[key] = value
+
+    async def delete(self, *keys: str) -> None:
+        for key in keys:
+            self.data.pop(key, None)
+
+
+@pytest.mark.asyncio
+async def test_shared_cache_invalidation_reaches_other_workers() -> None:
+    redis = FakeRedis()
+    worker_a, worker_b = UserCache(ttl=60, redis=redis), UserCache(ttl=60, redis=redis)
+    await worker_a.set(make_user(1))
+    assert (await worker_b.get(1, FakeSession())).tg_id == 1
+
+    await worker_a.invalidate(1)
+
+    assert await worker_b.get(1, FakeSession()) is None
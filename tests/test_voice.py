@@ -0,0 +1,23 @@
+import tempfile
+
+import pytest
+
+from bot.controllers import voice
+
+
+@pytest.mark.asyncio
+async def test_native_audio_is_streamed_to_file_chunk_by_chunk(monkeypatch: pytest.MonkeyPatch) -> None:
+    async def download_chunks(bot, file_path: str):
+        for n in range(3):
+            yield bytes([n]) * voice.CHUNK_SIZE
+
+    monkeypatch.setattr(voice, "_download_chunks", download_chunks)
+
+    with tempfile.TemporaryFile() as audio:
+        filename = await voice._load_audio(None, "voice/file_1.oga", "audio/ogg", audio)
+        audio.seek(0)
+        content = audio.read()
+
+    assert filename == "audio.ogg"
+    assert len(content) == 3 * voice.CHUNK_SIZE
+    assert content[-1] == 2
@@ -0,0 +1,121 @@
+import asyncio
+
+import aiohttp
+import pytest
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from bot.controllers.weather import (
+    FakeWeatherProvider,
+    OpenWeatherProvider,
+    WeatherService,
+    fallback_snapshot,
+    geohash,
+)
+
+
+def test_geohash_known_value() -> None:
+    assert geohash(57.64911, 10.40744, precision=11) == "u4pruydqqvj"
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_in_one_cell_hit_provider_once() -> None:
+    provider = FakeWeatherProvider()
+    service = WeatherService(provider, ttl=600)
+
+    results = await asyncio.gather(
+        *(service.get(city=None, lat=55.7558 + i * 0.0001, lon=37.6173) for i in range(50)),
+    )
+
+    assert provider.calls == 1
+    assert len({result.summary for result in results}) == 1
+
+    await service.get(city=None, lat=55.7558, lon=37.6173)
+    assert provider.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_city_names_are_normalized() -> None:
+    provider = FakeWeatherProvider()
+    service = WeatherService(provider, ttl=600)
+
+    await service.get(city="Москва", lat=None, lon=None)
+    await service.get(city="  москва ", lat=None, lon=None)
+
+    assert provider.calls == 1
+
+
+class FailingProvider(FakeWeatherProvider):
+    async def by_city(self, city: str):
+        self.calls += 1
+        raise aiohttp.ClientResponseError(request_info=None, history=(), status=404, message="city not found")
+
+
+@pytest.mark.asyncio
+async def test_provider_errors_fall_back_and_are_cached_briefly() -> None:
+    provider = FailingProvider()
+    service = WeatherService(provider, ttl=600)
+
+    first = await service.get(city="Масква", lat=None, lon=None)
+    second = await service.get(city="масква", lat=None, lon=None)
+
+    assert first == second == fallback_snapshot("Масква")
+    assert provider.calls == 1
+
+
+class BrokenRedis:
+    async def get(self, key: str):
+        raise RedisConnectionError("redis is down")
+
+    async def set(self, key: str, value: str, ex: int):
+        raise RedisConnectionError("redis is down")
+
+
+@pytest.mark.asyncio
+async def test_redis_errors_do_not_break_lookups() -> None:
+    provider = FakeWeatherProvider()
+    service = WeatherService(provider, redis=BrokenRedis(), ttl=600)
+
+    snapshot = await service.get(city=None, lat=55.7558, lon=37.6173)
+
+    assert snapshot != fallback_snapshot("вашему городу")
+    assert provider.calls == 1
+
+
+class MalformedProvider(FakeWeatherProvider):
+    async def by_city(self, city: str):
+        self.calls += 1
+        return OpenWeatherProvider._parse({"weather": []})
+
+
+@pytest.mark.asyncio
+async def test_malformed_payload_falls_back() -> None:
+    service = WeatherService(MalformedProvider(), ttl=600)
+
+    assert await service.get(city="Казань", lat=None, lon=None) == fallback_snapshot("Казань")
+
+
+class SlowProvider(FakeWeatherProvider):
+    def __init__(self) -> None:
+        super().__init__()
+        self.started = 0
+
+    async def by_city(self, city: str):
+        self.started += 1
+        await asyncio.sleep(0.05)
+        return await super().by_city(city)
+
+
+@pytest.mark.asyncio
+async def test_waiters_survive_cancelled_leader() -> None:
+    provider = SlowProvider()
+    service = WeatherService(provider, ttl=600)
+
+    leader = asyncio.create_task(service.get(city="Казань", lat=None, lon=None))
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(service.get(city="Казань", lat=None, lon=None))
+    await asyncio.sleep(0.01)
+    leader.cancel()
+
+    assert await asyncio.wait_for(waiter, timeout=1) == fallback_snapshot("Казань")
+    assert leader.cancelled()
+    assert (provider.started, provider.calls) == (2, 1)
@@ -0,0 +1,48 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from pydantic import SecretStr
+
+from bot.webhook import WebhookProcessor, _is_valid_secret
+
+
+def webhook_settings(secret: SecretStr | None) -> SimpleNamespace:
+    return SimpleNamespace(webhook=SimpleNamespace(SECRET=secret))
+
+
+def test_empty_secret_accepts_updates_without_header() -> None:
+    assert _is_valid_secret(webhook_settings(SecretStr("")), None)
+    assert _is_valid_secret(webhook_settings(None), None)
+    assert not _is_valid_secret(webhook_settings(SecretStr("s3cret")), None)
+    assert not _is_valid_secret(webhook_settings(SecretStr("s3cret")), "wrong")
+    assert _is_valid_secret(webhook_settings(SecretStr("s3cret")), "s3cret")
+
+
+class SlowDispatcher:
+    def __init__(self) -> None:
+        self.running = 0
+        self.peak = 0
+        self.release = asyncio.Event()
+
+    async def feed_webhook_update(self, bot, update: dict) -> None:
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        await self.release.wait()
+        self.running -= 1
+
+
+@pytest.mark.asyncio
+async def test_processor_limits_updates_in_flight() -> None:
+    dispatcher = SlowDispatcher()
+    processor = WebhookProcessor(bot=None, dispatcher=dispatcher, max_in_flight=2)
+
+    submits = [asyncio.create_task(processor.submit({"update_id": n})) for n in range(5)]
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    assert sum(task.done() for task in submits) == 2
+
+    dispatcher.release.set()
+    await asyncio.gather(*submits)
+    await processor.drain()
+    assert dispatcher.peak == 2
@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+
+from database.write_queue import PendingPhoto, PendingPreference, PendingRecommendation, WriteQueue
+
+
+class RecordingQueue(WriteQueue):
+    def __init__(self, fail_times: int = 0, **kwargs) -> None:
+        super().__init__(db=None, **kwargs)
+        self.batches: list[list] = []
+        self.fail_times = fail_times
+        self.written = asyncio.Event()
+
+    async def _write(self, batch: list) -> None:
+        if self.fail_times:
+            self.fail_times -= 1
+            raise ConnectionError("database is down")
+        self.batches.append(list(batch))
+        self.written.set()
+
+
+async def wait_written(queue: RecordingQueue) -> None:
+    await asyncio.wait_for(queue.written.wait(), timeout=2)
+    queue.written.clear()
+
+
+@pytest.mark.asyncio
+async def test_sync_mode_writes_on_put() -> None:
+    queue = RecordingQueue(sync=True)
+    pref = PendingPreference(user_id=1, event_type="повседневно", style="casual")
+    await queue.put(pref, PendingRecommendation(1, "ясно", "образ", preference=pref))
+
+    assert len(queue.batches) == 1
+    assert len(queue) == 0
+
+
+@pytest.mark.asyncio
+async def test_background_flush_by_size_and_time() -> None:
+    queue = RecordingQueue(batch_size=3, flush_interval=0.05)
+    queue.start()
+    try:
+        await queue.put(*(PendingPhoto(user_id=i, tg_file_id=str(i)) for i in range(3)))
+        await wait_written(queue)
+        assert [len(batch) for batch in queue.batches] == [3]
+
+        await queue.put(PendingPhoto(user_id=9, tg_file_id="9"))
+        await wait_written(queue)
+        assert [len(batch) for batch in queue.batches] == [3, 1]
+    finally:
+        await queue.close()
+
+
+@pytest.mark.asyncio
+async def test_close_retries_failed_flush_and_keeps_order() -> None:
+    queue = RecordingQueue(fail_times=2, batch_size=2, flush_interval=60, shutdown_timeout=5)
+    queue.start()
+    photos = [PendingPhoto(user_id=i, tg_file_id=str(i)) for i in range(5)]
+    await queue.put(*photos)
+
+    await queue.close()
+
+    assert [record for batch in queue.batches for record in batch] == photos
+    assert len(queue) == 0
+    assert queue.dropped == 0
+
+
+@pytest.mark.asyncio
+async def test_close_gives_up_after_shutdown_timeout() -> None:
+    queue = RecordingQueue(fail_times=1000, shutdown_timeout=0.3)
+    await queue.put(PendingPhoto(user_id=1, tg_file_id="1"))
+
+    await asyncio.wait_for(queue.close(), timeout=2)
+
+    assert queue.dropped == 1